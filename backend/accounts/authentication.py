@@ -0,0 +1,22 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import user_cache
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication, берущая пользователя из снимков accounts/user_cache.py."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Токен не содержит идентификатора пользователя')
+
+        user = user_cache.get_user(user_id)
+        if user is None:
+            raise AuthenticationFailed('Пользователь не найден', code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed('Пользователь неактивен', code='user_inactive')
+        return user
@@ -0,0 +1,13 @@
+"""Сброс снимка пользователя (accounts/user_cache.py) при его сохранении или удалении."""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+
+from . import user_cache
+
+
+def _invalidate_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+post_save.connect(_invalidate_user, sender=get_user_model(), dispatch_uid='user_cache_save')
+post_delete.connect(_invalidate_user, sender=get_user_model(), dispatch_uid='user_cache_delete')
@@ -18,4 +18,5 @@ urlpatterns = [
     path('admin/parents/<int:pk>/', views.parent_detail_view),
     path('admin/parents/<int:pk>/children/', views.parent_children_view),
     path('admin/parents/<int:pk>/reset-password/', views.reset_password_view),
+    path('admin/cache-stats/', views.cache_stats_view),
 ]
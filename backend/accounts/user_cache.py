@@ -0,0 +1,100 @@
+"""
+Снимки пользователей для аутентификации по JWT (HTTP и WebSocket).
+
+Каждый запрос и каждое WS-подключение загружают request.user / scope['user']
+по user_id из токена. Класс из 30 учеников, переподключающийся после обрыва
+сети, — это 30+ одинаковых SELECT подряд. Здесь хранятся значения полей
+пользователя (LRU в памяти процесса) по ключу (user_id, версия). Версия
+увеличивается сигналом post_save/post_delete, поэтому после user.save() старый
+снимок больше не находится. USER_TTL_SEC ограничивает устаревание при изменениях
+из других процессов и через queryset.update()/bulk_update().
+
+Блокировка (is_active) и смена ролей идут через user.save() — из админки и
+эндпоинтов accounts — в том же процессе Daphne (DEPLOY.md), поэтому действуют
+сразу. Устаревший снимок возможен только после правки из manage.py shell или
+другой команды, и живёт не дольше USER_TTL_SEC: минута задержки блокировки
+приемлема, а для всплеска переподключений класса (секунды) её хватает с запасом.
+
+Снимок — только значения полей: на каждый запрос собирается новый экземпляр
+User (from_db), поэтому кэш связей и изменения полей не переходят между запросами.
+PasswordChanged и проверки ролей (is_admin, is_teacher…) читают поля этого экземпляра.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+USER_TTL_SEC = 60
+
+_MAX_USERS = 2048
+
+_snapshots: 'OrderedDict[tuple, tuple]' = OrderedDict()   # (user_id, version) → (expires_at, values)
+_versions: 'dict[int, int]' = {}
+_counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_lock = threading.Lock()
+
+
+def _model():
+    from django.contrib.auth import get_user_model
+    return get_user_model()
+
+
+def _field_names():
+    return [f.attname for f in _model()._meta.concrete_fields]
+
+
+def _build(values):
+    return _model().from_db('default', _field_names(), values)
+
+
+def peek(user_id):
+    """Пользователь из кэша без обращения к БД или None (можно вызывать из async-кода)."""
+    now = time.monotonic()
+    with _lock:
+        key = (user_id, _versions.get(user_id, 0))
+        entry = _snapshots.get(key)
+        if entry is None or entry[0] <= now:
+            return None
+        _snapshots.move_to_end(key)
+        _counters['hits'] += 1
+        values = entry[1]
+    return _build(values)
+
+
+def get_user(user_id):
+    """Пользователь по id (из кэша или из БД) или None, если его нет."""
+    user = peek(user_id)
+    if user is not None:
+        return user
+    with _lock:
+        _counters['misses'] += 1
+        version = _versions.get(user_id, 0)
+    values = _model().objects.filter(pk=user_id).values_list(*_field_names()).first()
+    if values is None:
+        return None
+    with _lock:
+        # Пока шёл запрос, пользователя могли сохранить — такой снимок не кладём
+        if _versions.get(user_id, 0) == version:
+            key = (user_id, version)
+            _snapshots[key] = (time.monotonic() + USER_TTL_SEC, values)
+            _snapshots.move_to_end(key)
+            while len(_snapshots) > _MAX_USERS:
+                _snapshots.popitem(last=False)
+    return _build(values)
+
+
+def invalidate(user_id):
+    with _lock:
+        old_key = (user_id, _versions.get(user_id, 0))
+        _versions[user_id] = old_key[1] + 1
+        _snapshots.pop(old_key, None)
+        _counters['invalidations'] += 1
+
+
+def stats():
+    with _lock:
+        total = _counters['hits'] + _counters['misses']
+        return {
+            **_counters,
+            'hit_rate': round(_counters['hits'] / total, 3) if total else None,
+            '_entries': len(_snapshots),
+        }
@@ -618,3 +618,21 @@ def parent_children_view(request, pk):
         profile.children.remove(sp)
 
     return Response(ParentSerializer(user).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin, PasswordChanged])
+def cache_stats_view(request):
+    """Счётчики внутрипроцессных кэшей (попадания/промахи) — для диагностики."""
+    from core import authz
+    from groups import fanout, receipts
+    from lessons import consumers as lesson_consumers, page_cache
+    from . import user_cache
+    return Response({
+        'authz': authz.stats(),
+        'users': user_cache.stats(),
+        'chat_fanout': fanout.stats(),
+        'chat_receipts': receipts.stats(),
+        'pdf_pages': page_cache.stats(),
+        'discussion_drag': lesson_consumers.stats(),
+    })
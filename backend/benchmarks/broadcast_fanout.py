@@ -0,0 +1,115 @@
+"""
+Микробенчмарк рассылки в большую группу: json.dumps на каждого получателя
+(как было в обработчиках consumers) против одного core.frames.encode у отправителя.
+
+Второй замер — полная рассылка через InMemoryChannelLayer: group_send и
+получение событий всеми каналами группы.
+
+Запуск из backend/:
+    python benchmarks/broadcast_fanout.py
+    python benchmarks/broadcast_fanout.py --sizes 30 300 1500 --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from channels.layers import InMemoryChannelLayer  # noqa: E402
+
+from core import frames  # noqa: E402
+
+
+def sample_message():
+    """Сообщение чата в форме ChatMessageSerializer: вложение, ответ, реакции."""
+    return {
+        'id': 184213,
+        'room': 42,
+        'sender': {'id': 17, 'first_name': 'Анна', 'last_name': 'Смирнова', 'is_teacher': True},
+        'text': 'Напоминаю: завтра контрольная по алгебре, повторите параграфы 12–14. ' * 3,
+        'created_at': '2026-10-16T09:41:27.512394+03:00',
+        'is_deleted': False,
+        'is_pinned': False,
+        'reply_to': {'id': 184190, 'sender_name': 'Иван Петров', 'text': 'А какие темы будут?'},
+        'attachments': [{
+            'id': 9311, 'file_url': '/media/chat/2026/10/16/zadaniya.pdf',
+            'original_name': 'Задания.pdf', 'file_size': 482113, 'mime_type': 'application/pdf',
+        }],
+        'reactions': [
+            {'emoji': '👍', 'count': 12, 'user_ids': list(range(100, 112))},
+            {'emoji': '🙏', 'count': 3, 'user_ids': [201, 202, 203]},
+        ],
+        'poll': None,
+        'task': None,
+    }
+
+
+def bench_encode(size, repeat):
+    payload = {'type': 'message_new', 'message': sample_message()}
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for _ in range(size):
+            json.dumps(payload)
+    per_recipient = (time.perf_counter() - started) / repeat
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        frame = frames.encode(payload)
+        for _ in range(size):
+            str(frame)   # обработчик пересылает готовый текст
+    once = (time.perf_counter() - started) / repeat
+    return per_recipient, once
+
+
+async def bench_layer(size, repeat, pre_encoded):
+    layer = InMemoryChannelLayer(capacity=repeat + 1)
+    channels = [await layer.new_channel() for _ in range(size)]
+    for name in channels:
+        await layer.group_add('chat_bench', name)
+    payload = {'message': sample_message()}
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        if pre_encoded:
+            event = frames.group_event('chat_message_new', {'type': 'message_new', **payload})
+        else:
+            event = {'type': 'chat_message_new', **payload}
+        await layer.group_send('chat_bench', event)
+        for name in channels:
+            received = await layer.receive(name)
+            if pre_encoded:
+                received['frame']
+            else:
+                json.dumps({'type': 'message_new', 'message': received['message']})
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[30, 300, 1500])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    encoder = 'orjson' if frames.orjson is not None else 'json'
+    print(f'Кодировщик кадров: {encoder}\n')
+    print(f'{"получателей":>12} | {"dumps×N, мс":>12} | {"encode×1, мс":>12} | '
+          f'{"слой до, мс":>12} | {"слой после, мс":>14}')
+    for size in args.sizes:
+        per_recipient, once = bench_encode(size, args.repeat)
+        layer_before = asyncio.run(bench_layer(size, args.repeat, pre_encoded=False))
+        layer_after = asyncio.run(bench_layer(size, args.repeat, pre_encoded=True))
+        print(f'{size:>12} | {per_recipient * 1000:>12.2f} | {once * 1000:>12.3f} | '
+              f'{layer_before * 1000:>12.2f} | {layer_after * 1000:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Задержка отправки события в комнату в зависимости от её размера: group_send
+основного слоя (RedisChannelLayer) против pub/sub-слоя (RedisPubSubChannelLayer),
+через который groups/fanout.py рассылает большие комнаты.
+
+Замеряется время самого group_send, т. е. то, что ждёт запрос отправителя.
+Нужен локальный Redis (REDIS_URL, по умолчанию redis://127.0.0.1:6379);
+бенчмарк пишет в отдельный префикс ключей и очищает его после себя.
+
+Запуск из backend/:
+    python benchmarks/broadcast_latency.py
+    python benchmarks/broadcast_latency.py --sizes 30 300 1500 3000 --repeat 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from channels_redis.core import RedisChannelLayer  # noqa: E402
+from channels_redis.pubsub import RedisPubSubChannelLayer  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+from core import frames  # noqa: E402
+
+GROUP = 'chat_bench'
+
+
+def sample_event():
+    frame = {
+        'type': 'message_new',
+        'message': {
+            'id': 184213, 'room': 42, 'text': 'Напоминаю: завтра контрольная по алгебре. ' * 4,
+            'sender': {'id': 17, 'first_name': 'Анна', 'last_name': 'Смирнова'},
+            'created_at': '2026-10-16T09:41:27.512394+03:00',
+            'attachments': [], 'reactions': [], 'reply_to': None, 'poll': None, 'task': None,
+        },
+    }
+    return frames.group_event('chat_message_new', frame)
+
+
+async def measure(layer, size, repeat):
+    channels = [await layer.new_channel() for _ in range(size)]
+    for name in channels:
+        await layer.group_add(GROUP, name)
+    event = sample_event()
+    await layer.group_send(GROUP, event)   # прогрев соединений
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await layer.group_send(GROUP, event)
+        timings.append(time.perf_counter() - started)
+
+    for name in channels:
+        await layer.group_discard(GROUP, name)
+    await layer.flush()
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[30, 300, 1500, 3000])
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    config = {'hosts': [settings.REDIS_URL], 'prefix': 'bench'}
+    print(f'Redis: {settings.REDIS_URL}, порог CHAT_FANOUT_THRESHOLD = {settings.CHAT_FANOUT_THRESHOLD}\n')
+    print(f'{"участников":>11} | {"группа, мс (медиана/макс)":>26} | {"pub/sub, мс (медиана/макс)":>27}')
+    for size in args.sizes:
+        group_med, group_max = asyncio.run(measure(RedisChannelLayer(**config), size, args.repeat))
+        pubsub_med, pubsub_max = asyncio.run(measure(RedisPubSubChannelLayer(**config), size, args.repeat))
+        print(f'{size:>11} | {group_med * 1000:>12.2f} / {group_max * 1000:>11.2f} | '
+              f'{pubsub_med * 1000:>12.2f} / {pubsub_max * 1000:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -122,7 +122,8 @@ CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default='', cast=Csv())
 # DRF
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication с кэшем пользователей (accounts/user_cache.py)
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -161,8 +162,30 @@ CHANNEL_LAYERS = {
             'hosts': [REDIS_URL],
         },
     },
+    # Pub/sub-рассылка для больших чатов (groups/fanout.py)
+    'fanout': {
+        'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+        'CONFIG': {
+            'hosts': [REDIS_URL],
+        },
+    },
 }
 
+# С какого числа участников чат рассылается через слой 'fanout'
+CHAT_FANOUT_THRESHOLD = config('CHAT_FANOUT_THRESHOLD', default=300, cast=int)
+
+# Через сколько дней сообщения чата переносятся в архив (manage.py archive_chat_messages)
+CHAT_ARCHIVE_AFTER_DAYS = config('CHAT_ARCHIVE_AFTER_DAYS', default=365, cast=int)
+
+# Процессов рендера страниц при импорте PDF в урок (0 — по числу ядер, не больше 4)
+PDF_IMPORT_WORKERS = config('PDF_IMPORT_WORKERS', default=0, cast=int)
+
+# Дисковый кэш отрендеренных страниц PDF (lessons/page_cache.py)
+PDF_PAGE_CACHE_DIR = config('PDF_PAGE_CACHE_DIR', default=str(BASE_DIR / 'cache' / 'pdf_pages'))
+PDF_PAGE_CACHE_MB = config('PDF_PAGE_CACHE_MB', default=1024, cast=int)
+# Одновременных рендеров страниц по запросу на процесс
+PDF_RENDER_CONCURRENCY = config('PDF_RENDER_CONCURRENCY', default=2, cast=int)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
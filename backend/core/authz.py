@@ -0,0 +1,67 @@
+"""
+Кэш решений авторизации: «может ли пользователь user_id работать с ресурсом».
+
+Проверки членства и доступа (чаты, проекты, сессии и слайды уроков) повторяются
+на каждом WS-подключении и REST-запросе одними и теми же запросами к БД.
+Решение кэшируется в памяти процесса по ключу (kind, user_id, resource_id) на
+AUTHZ_TTL_SEC. Сигналы приложений сбрасывают записи при изменении членства
+(invalidate по kind + resource_id или kind + user_id), а TTL ограничивает
+устаревание после изменений, которые сигналов не шлют.
+
+Счётчики попаданий по каждому kind — stats(), отдаются в /api/admin/cache-stats/.
+"""
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+AUTHZ_TTL_SEC = 30
+
+_MAX_ENTRIES = 8192
+
+_decisions: 'OrderedDict[tuple, tuple]' = OrderedDict()   # (kind, user_id, resource_id) → (expires_at, bool)
+_counters = defaultdict(lambda: {'hits': 0, 'misses': 0, 'invalidations': 0})
+_lock = threading.Lock()
+
+
+def check(kind, user_id, resource_id, compute):
+    """Решение из кэша или compute() (без аргументов, возвращает bool)."""
+    key = (kind, user_id, resource_id)
+    now = time.monotonic()
+    with _lock:
+        entry = _decisions.get(key)
+        if entry is not None and entry[0] > now:
+            _decisions.move_to_end(key)
+            _counters[kind]['hits'] += 1
+            return entry[1]
+        _counters[kind]['misses'] += 1
+    allowed = bool(compute())
+    with _lock:
+        _decisions[key] = (now + AUTHZ_TTL_SEC, allowed)
+        _decisions.move_to_end(key)
+        while len(_decisions) > _MAX_ENTRIES:
+            _decisions.popitem(last=False)
+    return allowed
+
+
+def invalidate(kind, resource_id=None, user_id=None):
+    """Сбросить решения kind по ресурсу и/или пользователю (None — любой)."""
+    with _lock:
+        stale = [
+            key for key in _decisions
+            if key[0] == kind
+            and (resource_id is None or key[2] == resource_id)
+            and (user_id is None or key[1] == user_id)
+        ]
+        for key in stale:
+            del _decisions[key]
+        _counters[kind]['invalidations'] += len(stale)
+
+
+def stats():
+    with _lock:
+        result = {}
+        for kind, c in _counters.items():
+            total = c['hits'] + c['misses']
+            result[kind] = {**c, 'hit_rate': round(c['hits'] / total, 3) if total else None}
+        result['_entries'] = len(_decisions)
+        return result
@@ -0,0 +1,33 @@
+"""
+Кадры WebSocket, закодированные один раз на стороне отправителя.
+
+Раньше обработчик события группы (chat_message_new, project_post_new,
+quiz_leaderboard…) вызывал json.dumps для каждого получателя: сообщение в чат
+на 300 участников сериализовалось 300 раз. Теперь отправитель кладёт в событие
+готовый текст кадра (поле 'frame'), а обработчики пересылают его как есть.
+
+Если установлен orjson, кодирование идёт через него; иначе — стандартный json.
+Бенчмарк: benchmarks/broadcast_fanout.py.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательная зависимость
+    orjson = None
+
+
+def encode(payload):
+    """dict → JSON-текст кадра."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+
+def group_event(handler, frame, **route):
+    """
+    Событие для channel_layer.group_send: обработчик handler получит готовый
+    кадр в event['frame']. route — поля, нужные самому обработчику (например,
+    user_id, чтобы не слать «печатает…» автору).
+    """
+    return {'type': handler, 'frame': encode(frame), **route}
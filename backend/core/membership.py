@@ -0,0 +1,50 @@
+"""
+Массовое добавление участников (чаты, проекты).
+
+Раньше эндпоинты членства делали User.objects.get и get_or_create на каждый id:
+класс из 30 учеников — 60+ запросов, параллель из 600 — тысячи. Здесь
+пользователи загружаются одним запросом, уже состоящие отсекаются ещё одним,
+а новые вставляются пакетами bulk_create(ignore_conflicts=True).
+
+bulk_create не шлёт post_save — кэши, которые сбрасывают сигналы участников
+(core/authz.py и др.), вызывающий сбрасывает сам.
+"""
+from django.contrib.auth import get_user_model
+
+BATCH_SIZE = 500
+
+
+def resolve_users(user_ids):
+    """Пользователи по списку id одним запросом; нечисловые и несуществующие id пропускаются."""
+    ids = set()
+    for uid in user_ids or []:
+        try:
+            ids.add(int(uid))
+        except (TypeError, ValueError):
+            continue
+    if not ids:
+        return []
+    return list(get_user_model().objects.filter(pk__in=ids).order_by('id'))
+
+
+def add_members(model, parent_field, parent, users, build):
+    """
+    Добавить users в parent (model — ChatMember, ProjectMember; parent_field —
+    имя FK на комнату/проект). build(user) возвращает несохранённый экземпляр model.
+    Уже состоящие пропускаются. Возвращает добавленные записи, перечитанные из БД
+    вместе с user (с ignore_conflicts bulk_create не проставляет pk).
+    """
+    if not users:
+        return []
+    existing = set(
+        model.objects.filter(**{parent_field: parent, 'user__in': users})
+        .values_list('user_id', flat=True)
+    )
+    new = [build(user) for user in users if user.id not in existing]
+    if not new:
+        return []
+    model.objects.bulk_create(new, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return list(
+        model.objects.filter(**{parent_field: parent, 'user__in': [m.user for m in new]})
+        .select_related('user').order_by('id')
+    )
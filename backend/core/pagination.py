@@ -0,0 +1,63 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def make_cursor(ts, pk=0) -> str:
+    """Непрозрачный курсор позиции (ts, pk); pk=0 — «начиная с момента ts»."""
+    raw = f'{ts.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def encode_cursor(obj, field='created_at') -> str:
+    """Непрозрачный курсор позиции (field, id) объекта."""
+    return make_cursor(getattr(obj, field), obj.id)
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        ts, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(ts), int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def keyset_page(qs, before=None, after=None, limit=50, field='created_at'):
+    """
+    Страница по ключу (created_at, id) — стоимость не зависит от глубины истории.
+    field — другое поле-метка времени вместо created_at (например, updated_at).
+
+    Без курсора — последние limit объектов. before/after — курсоры из прошлого
+    ответа: объекты строго старше / строго новее. has_more считается по limit+1
+    строке, без COUNT/EXISTS. Для индекса нужен (<фильтр>, field, id).
+
+    Возвращает dict: items (по возрастанию), has_more (есть ещё в запрошенном
+    направлении), prev_cursor (для загрузки более старых), next_cursor (более новых).
+    Бросает InvalidCursor.
+    """
+    if after:
+        ts, pk = decode_cursor(after)
+        qs = qs.filter(Q(**{f'{field}__gt': ts}) | Q(**{field: ts}, id__gt=pk)).order_by(field, 'id')
+        items = list(qs[:limit + 1])
+        has_more = len(items) > limit
+        items = items[:limit]
+    else:
+        if before:
+            ts, pk = decode_cursor(before)
+            qs = qs.filter(Q(**{f'{field}__lt': ts}) | Q(**{field: ts}, id__lt=pk))
+        items = list(qs.order_by(f'-{field}', '-id')[:limit + 1])
+        has_more = len(items) > limit
+        items = items[:limit]
+        items.reverse()
+    return {
+        'items': items,
+        'has_more': has_more,
+        'prev_cursor': encode_cursor(items[0], field) if items else before,
+        'next_cursor': encode_cursor(items[-1], field) if items else after,
+    }
@@ -0,0 +1,42 @@
+"""
+Общие средства тестов.
+
+MigrationTestCase — проверка data-миграций: база откатывается к состоянию до
+migrate_from, тест наполняет её историческими моделями (self.apps), затем
+migrate() прогоняет миграции вперёд или назад. После теста схема
+возвращается к последним миграциям проекта.
+"""
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTestCase(TransactionTestCase):
+    app = None
+    migrate_from = None     # имя миграции, состояние до которой готовит setUp
+    migrate_to = None       # целевая миграция проверяемого участка
+
+    def setUp(self):
+        super().setUp()
+        self.migrate([(self.app, self.migrate_from)])
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def migrate(self, targets):
+        """Прогнать миграции до targets; self.apps — исторические модели этого состояния."""
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        # Состояние всех применённых миграций: остальные приложения (accounts и т.д.)
+        # остаются на последних миграциях, а не на тех, от которых зависит targets
+        executor.loader.build_graph()
+        self.apps = executor.loader.project_state(list(executor.loader.applied_migrations)).apps
+        return self.apps
+
+    def forward(self):
+        return self.migrate([(self.app, self.migrate_to)])
+
+    def backward(self):
+        return self.migrate([(self.app, self.migrate_from)])
@@ -0,0 +1,179 @@
+"""
+Архив сообщений чата.
+
+Сообщения старше CHAT_ARCHIVE_AFTER_DAYS переносятся из ChatMessage в
+ArchivedChatMessage (с пометкой учебного года), чтобы история, список чатов и
+подсчёт непрочитанных работали с таблицей и индексами только «горячих» сообщений.
+Перенос — management-командой archive_chat_messages, короткими пакетами: каждый
+пакет — своя транзакция, поэтому долгих блокировок нет.
+
+В архив сообщение попадает сериализованным (payload): вложения, опрос, задача и
+реакции с id поставивших. Исходные строки и связанные с ними реакции, голоса и
+записи вложений удаляются (файлы остаются на диске). Не переносятся сообщения,
+на которые ссылается ChatRoom.last_message, и те, на которые (в том числе по
+цепочке ответов) отвечают остающиеся горячими сообщения. Архив только для
+чтения: поиск, синхронизация и реакции его не касаются.
+
+ChatMessagesView читает историю через history_page(): когда страница уходит
+глубже ChatRoom.messages_archived_until, она догружается из архива тем же
+ключом (created_at, id).
+"""
+import copy
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.pagination import decode_cursor, encode_cursor, keyset_page
+
+from .models import ArchivedChatMessage, ChatMessage, ChatReaction, ChatRoom
+
+
+def archive_after_days():
+    return getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 365)
+
+
+def academic_year(dt):
+    """Учебный год, начинающийся 1 сентября: 2024 — это 2024/25."""
+    local = timezone.localtime(dt)
+    return local.year if local.month >= 9 else local.year - 1
+
+
+def _pinned_ids(pinned_roots):
+    """
+    Старые сообщения, на которые по цепочке ответов ссылаются остающиеся горячими
+    старые сообщения (pinned_roots): reply_to — SET_NULL, и перенос цели молча
+    убрал бы цитату из сообщения, которое ещё показывается из ChatMessage.
+    """
+    pinned = set()
+    frontier = set(
+        pinned_roots.filter(reply_to__isnull=False).values_list('reply_to_id', flat=True)
+    )
+    while frontier:
+        pinned |= frontier
+        frontier = set(
+            ChatMessage.objects.filter(id__in=frontier, reply_to__isnull=False)
+            .values_list('reply_to_id', flat=True)
+        ) - pinned
+    return pinned
+
+
+def candidates(cutoff):
+    """Сообщения, которые можно перенести в архив."""
+    old = ChatMessage.objects.filter(created_at__lt=cutoff)
+    pinned_roots = old.filter(
+        Q(id__in=ChatRoom.objects.filter(last_message__isnull=False).values('last_message_id'))
+        | Q(id__in=ChatMessage.objects.filter(
+            created_at__gte=cutoff, reply_to__isnull=False,
+        ).values('reply_to_id'))
+    )
+    return (
+        old.exclude(id__in=pinned_roots.values('id'))
+        .exclude(id__in=_pinned_ids(pinned_roots))
+    )
+
+
+def archive_batch(cutoff, batch_size=500):
+    """Перенести в архив до batch_size самых старых кандидатов. Возвращает их число."""
+    from .serializers import ChatMessageSerializer
+
+    ids = list(candidates(cutoff).order_by('id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return 0
+    with transaction.atomic():
+        messages = list(
+            ChatMessage.objects.select_for_update(of=('self',)).filter(id__in=ids)
+            .select_related('sender', 'reply_to__sender')
+        )
+        reactors = defaultdict(list)
+        for message_id, emoji, user_id in ChatReaction.objects.filter(message_id__in=ids).values_list(
+            'message_id', 'emoji', 'user_id',
+        ):
+            reactors[(message_id, emoji)].append(user_id)
+
+        rows, newest = [], {}
+        for message, payload in zip(messages, ChatMessageSerializer(messages, many=True).data):
+            for reaction in payload['reactions']:
+                reaction.pop('user_reacted', None)
+                reaction['user_ids'] = reactors[(message.id, reaction['emoji'])]
+            rows.append(ArchivedChatMessage(
+                id=message.id,
+                room_id=message.room_id,
+                academic_year=academic_year(message.created_at),
+                created_at=message.created_at,
+                payload=payload,
+            ))
+            if message.room_id not in newest or newest[message.room_id] < message.created_at:
+                newest[message.room_id] = message.created_at
+
+        ArchivedChatMessage.objects.bulk_create(rows, ignore_conflicts=True)
+        ChatMessage.objects.filter(id__in=ids).delete()
+        for room_id, until in newest.items():
+            ChatRoom.objects.filter(pk=room_id).filter(
+                Q(messages_archived_until__isnull=True) | Q(messages_archived_until__lt=until),
+            ).update(messages_archived_until=until)
+    return len(messages)
+
+
+def represent(archived, user):
+    """Сообщение из архива в форме ChatMessageSerializer для пользователя user."""
+    data = copy.deepcopy(archived.payload)
+    for reaction in data.get('reactions') or []:
+        reaction['user_reacted'] = user.id in reaction.pop('user_ids', [])
+    poll = data.get('poll')
+    if poll:
+        for option in poll['options']:
+            option['user_voted'] = any(v['id'] == user.id for v in option['voters'])
+    task = data.get('task_preview')
+    if task:
+        task['user_took'] = any(t['id'] == user.id for t in task['takers'])
+    data['archived'] = True
+    return data
+
+
+def _needs_archive(room, page, before, after, limit):
+    until = room.messages_archived_until
+    if until is None:
+        return False
+    if after:
+        return decode_cursor(after)[0] <= until
+    items = page['items']
+    return len(items) < limit or items[0].created_at <= until
+
+
+def history_page(room, request, before=None, after=None, limit=50):
+    """
+    Страница истории комнаты (как keyset_page) с догрузкой из архива.
+    Возвращает dict: results (сериализованные, по возрастанию), has_more,
+    prev_cursor, next_cursor. Бросает InvalidCursor.
+    """
+    from .serializers import ChatMessageSerializer
+
+    hot_qs = room.messages.select_related('sender', 'reply_to__sender').prefetch_related('attachments')
+    page = keyset_page(hot_qs, before=before, after=after, limit=limit)
+    items, has_more = page['items'], page['has_more']
+    if _needs_archive(room, page, before, after, limit):
+        archived = keyset_page(
+            ArchivedChatMessage.objects.filter(room=room), before=before, after=after, limit=limit,
+        )
+        merged = sorted(items + archived['items'], key=lambda m: (m.created_at, m.id))
+        has_more = has_more or archived['has_more'] or len(merged) > limit
+        items = merged[:limit] if after else merged[-limit:]
+
+    hot = [m for m in items if isinstance(m, ChatMessage)]
+    serialized = dict(zip(
+        (m.id for m in hot),
+        ChatMessageSerializer(hot, many=True, context={'request': request}).data,
+    ))
+    return {
+        'results': [
+            serialized[m.id] if isinstance(m, ChatMessage) else represent(m, request.user)
+            for m in items
+        ],
+        'has_more': has_more,
+        'prev_cursor': encode_cursor(items[0]) if items else before,
+        'next_cursor': encode_cursor(items[-1]) if items else after,
+    }
+
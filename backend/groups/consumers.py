@@ -1,3 +1,4 @@
+import asyncio
 import json
 import re
 
@@ -5,16 +6,40 @@ from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.utils import timezone
 
-from .models import ChatRoom, ChatMember, ChatMessage, StudentChatRestriction
-from .serializers import ChatMessageSerializer
+from core import frames
+
+from . import fanout, receipts, restrictions, services
+from .models import ChatRoom, ChatMessage
+from .permissions import can_access_room
+from .serializers import serialize_message
 
 _URL_PATTERN = re.compile(r'https?://|www\.', re.IGNORECASE)
 
+# Событие группы chat_{id} → тип кадра для клиента
+CLIENT_FRAME_TYPES = {
+    'chat_message_new': 'message_new',
+    'chat_room_read': 'room_read',
+    'chat_user_typing': 'user_typing',
+    'chat_message_deleted': 'message_deleted',
+    'chat_poll_updated': 'poll_updated',
+    'chat_task_taken': 'chat_task_taken',
+    'chat_reaction_updated': 'reaction_updated',
+}
+
+
+def group_event(event):
+    """Событие группы чата с кадром, закодированным один раз для всех получателей."""
+    frame = {'type': CLIENT_FRAME_TYPES[event['type']], **{k: v for k, v in event.items() if k != 'type'}}
+    route = {'user_id': event['user_id']} if event['type'] == 'chat_user_typing' else {}
+    return frames.group_event(event['type'], frame, **route)
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.room_id = self.scope['url_route']['kwargs']['room_id']
-        self.room_group_name = f'chat_{self.room_id}'
+        self.room_id = int(self.scope['url_route']['kwargs']['room_id'])
+        self.room_group_name = fanout.room_group(self.room_id)
+        self.fanout_task = None
+        self.read_trailing = None   # отложенная отметка о прочтении (groups/receipts.py)
         self.user = self.scope['user']
 
         if not self.user or not self.user.is_authenticated:
@@ -28,10 +53,50 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
+        if await fanout.is_large(self.room_id):
+            await self.subscribe_fanout()
 
     async def disconnect(self, close_code):
         if hasattr(self, 'room_group_name'):
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if getattr(self, 'read_trailing', None) is not None:
+            # Отложенную отметку не теряем — записываем сразу
+            self.read_trailing.cancel()
+            await self.flush_read()
+        if getattr(self, 'fanout_task', None) is not None:
+            self.fanout_task.cancel()
+            await fanout.fanout_layer().group_discard(self.room_group_name, self.fanout_channel)
+
+    async def subscribe_fanout(self):
+        """Получать события большой комнаты через pub/sub-слой (groups/fanout.py)."""
+        if self.fanout_task is not None:
+            return
+        layer = fanout.fanout_layer()
+        self.fanout_channel = await layer.new_channel()
+        await layer.group_add(self.room_group_name, self.fanout_channel)
+        self.fanout_task = asyncio.ensure_future(self._receive_fanout(layer))
+
+    async def _receive_fanout(self, layer):
+        while True:
+            await self.dispatch(await layer.receive(self.fanout_channel))
+
+    async def flush_read(self):
+        """Записать отметку о прочтении и разослать room_read."""
+        self.read_trailing = None
+        receipts.note_read_flushed(self.room_id, self.user.id)
+        await self.mark_read()
+        await fanout.group_send(
+            self.room_id,
+            group_event({
+                'type': 'chat_room_read',
+                'user_id': self.user.id,
+                'last_read_at': timezone.now().isoformat(),
+            }),
+        )
+
+    async def _trailing_read(self, delay):
+        await asyncio.sleep(delay)
+        await self.flush_read()
 
     async def receive(self, text_data):
         try:
@@ -56,78 +121,57 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
             message = await self.save_message(text, reply_to_id)
             serialized = await self.serialize_message(message)
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {'type': 'chat_message_new', 'message': serialized},
+            await fanout.group_send(
+                self.room_id,
+                group_event({'type': 'chat_message_new', 'message': serialized}),
             )
 
         elif msg_type == 'mark_read':
-            await self.mark_read()
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'chat_room_read',
-                    'user_id': self.user.id,
-                    'last_read_at': timezone.now().isoformat(),
-                },
-            )
+            delay, schedule = receipts.read_delay(self.room_id, self.user.id)
+            if delay <= 0 and schedule:
+                await self.flush_read()
+            elif schedule:
+                self.read_trailing = asyncio.ensure_future(self._trailing_read(delay))
 
         elif msg_type == 'typing':
+            if not receipts.allow_typing(self.room_id, self.user.id):
+                return
             first = self.user.first_name or ''
             display_name = f'{self.user.last_name} {first[0]}.' if first else self.user.last_name
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
+            await fanout.group_send(
+                self.room_id,
+                group_event({
                     'type': 'chat_user_typing',
                     'user_id': self.user.id,
                     'display_name': display_name,
-                },
+                }),
             )
 
     # ─── Event handlers ────────────────────────────────────────────────────────
+    # Кадр уже закодирован отправителем (group_event) — пересылаем как есть.
 
     async def chat_message_new(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'message_new',
-            'message': event['message'],
-        }))
+        await self.send(text_data=event['frame'])
 
     async def chat_room_read(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'room_read',
-            'user_id': event['user_id'],
-            'last_read_at': event['last_read_at'],
-        }))
+        await self.send(text_data=event['frame'])
 
     async def chat_user_typing(self, event):
         # не отправлять самому себе
         if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({
-                'type': 'user_typing',
-                'user_id': event['user_id'],
-                'display_name': event['display_name'],
-            }))
+            await self.send(text_data=event['frame'])
 
     async def chat_message_deleted(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'message_deleted',
-            'message_id': event['message_id'],
-        }))
+        await self.send(text_data=event['frame'])
 
     async def chat_poll_updated(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'poll_updated',
-            'poll_id': event['poll_id'],
-            'options': event['options'],
-            'total_votes': event['total_votes'],
-        }))
+        await self.send(text_data=event['frame'])
 
     async def chat_task_taken(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'chat_task_taken',
-            'task_id': event['task_id'],
-            'takers': event['takers'],
-        }))
+        await self.send(text_data=event['frame'])
+
+    async def chat_fanout_upgrade(self, event):
+        await self.subscribe_fanout()
 
     async def restriction_error(self, event):
         await self.send(text_data=json.dumps({
@@ -136,26 +180,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
         }))
 
     async def chat_reaction_updated(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'reaction_updated',
-            'message_id': event['message_id'],
-            'reactions': event['reactions'],
-        }))
+        await self.send(text_data=event['frame'])
 
     # ─── DB helpers ────────────────────────────────────────────────────────────
 
     @sync_to_async
     def check_membership(self):
-        try:
-            room = ChatRoom.objects.get(id=self.room_id)
-            if room.members_rel.filter(user=self.user).exists():
-                return True
-            # Admin может подключиться к групповому чату (модерация)
-            if self.user.is_admin and room.room_type == 'group':
-                return True
-            return False
-        except ChatRoom.DoesNotExist:
-            return False
+        # Admin может подключиться к групповому чату (модерация)
+        return can_access_room(self.user, self.room_id)
 
     @sync_to_async
     def save_message(self, text, reply_to_id=None):
@@ -166,24 +198,17 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 reply_to = ChatMessage.objects.get(id=reply_to_id, room=room)
             except ChatMessage.DoesNotExist:
                 pass
-        return ChatMessage.objects.create(
-            room=room,
-            sender=self.user,
-            text=text,
-            reply_to=reply_to,
-        )
+        return services.create_message(room, self.user, text, reply_to=reply_to)
 
     @sync_to_async
     def serialize_message(self, message):
-        serializer = ChatMessageSerializer(message)
-        return serializer.data
+        return serialize_message(message)
 
     @sync_to_async
     def check_restrictions(self, text, restriction_type='text'):
         """Возвращает строку с ошибкой если ученик нарушает ограничения, иначе None."""
-        try:
-            r = StudentChatRestriction.objects.get(student=self.user)
-        except StudentChatRestriction.DoesNotExist:
+        r = restrictions.get_restriction(self.user.id)
+        if r is None:
             return None
 
         now = timezone.now()
@@ -207,11 +232,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
             # Cooldown
             if r.message_cooldown > 0:
-                last_msg = ChatMessage.objects.filter(
-                    sender=self.user, is_deleted=False
-                ).order_by('-created_at').first()
-                if last_msg:
-                    elapsed = (now - last_msg.created_at).total_seconds()
+                last_sent = restrictions.last_sent_at('chat', self.user.id, lambda: (
+                    ChatMessage.objects.filter(sender=self.user, is_deleted=False)
+                    .order_by('-created_at').values_list('created_at', flat=True).first()
+                ))
+                if last_sent:
+                    elapsed = (now - last_sent).total_seconds()
                     if elapsed < r.message_cooldown:
                         wait = int(r.message_cooldown - elapsed) + 1
                         return f'Подождите {wait} сек. перед следующим сообщением.'
@@ -220,7 +246,4 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     @sync_to_async
     def mark_read(self):
-        ChatMember.objects.filter(
-            room_id=self.room_id,
-            user=self.user,
-        ).update(last_read_at=timezone.now())
+        services.mark_read(self.room_id, self.user)
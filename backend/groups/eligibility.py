@@ -0,0 +1,101 @@
+"""
+Граф допустимых собеседников для личных сообщений учеников и родителей.
+
+Ученик может писать учителям, ведущим уроки в его классе, и куратору класса;
+родитель — кураторам классов своих детей. Вместо JOIN-ов на каждый вызов
+can_start_direct / get_available_dm_users граф школы строится целиком четырьмя
+запросами и хранится в памяти процесса: проверка превращается в поиск по set.
+
+Граф сбрасывается сигналами (groups/signals.py) при изменении ScheduleLesson,
+SchoolClass, StudentProfile и ParentProfile.children, а массовые импорты,
+обходящие сигналы (bulk_create/bulk_update), вызывают invalidate() сами.
+TTL страхует от изменений из других процессов (manage.py-команды).
+"""
+import threading
+import time
+from collections import defaultdict
+
+GRAPH_TTL_SEC = 600
+
+
+class DMGraph:
+    def __init__(self):
+        self.class_contacts = defaultdict(set)    # class_id → {учителя класса, куратор}
+        self.class_curator = {}                   # class_id → curator_id
+        self.student_class = {}                   # user_id ученика → class_id
+        self.parent_classes = defaultdict(set)    # user_id родителя → {class_id детей}
+
+    def student_contacts(self, user_id):
+        class_id = self.student_class.get(user_id)
+        if class_id is None:
+            return frozenset()
+        return frozenset(self.class_contacts.get(class_id, ()))
+
+    def parent_contacts(self, user_id):
+        return frozenset(
+            self.class_curator[class_id]
+            for class_id in self.parent_classes.get(user_id, ())
+            if self.class_curator.get(class_id)
+        )
+
+
+def _build():
+    from school.models import ParentProfile, ScheduleLesson, SchoolClass, StudentProfile
+
+    graph = DMGraph()
+    rows = (
+        ScheduleLesson.objects.filter(teacher__isnull=False)
+        .values_list('school_class_id', 'teacher_id')
+        .distinct()
+        .order_by()
+    )
+    for class_id, teacher_id in rows:
+        graph.class_contacts[class_id].add(teacher_id)
+    for class_id, curator_id in SchoolClass.objects.filter(curator__isnull=False).values_list('id', 'curator_id'):
+        graph.class_curator[class_id] = curator_id
+        graph.class_contacts[class_id].add(curator_id)
+    graph.student_class = dict(StudentProfile.objects.values_list('user_id', 'school_class_id'))
+    rows = ParentProfile.children.through.objects.values_list(
+        'parentprofile__user_id', 'studentprofile__school_class_id',
+    )
+    for parent_user_id, class_id in rows:
+        graph.parent_classes[parent_user_id].add(class_id)
+    return graph
+
+
+_graph = None
+_built_at = 0.0
+_generation = 0
+_lock = threading.Lock()
+
+
+def get_graph():
+    global _graph, _built_at
+    with _lock:
+        if _graph is not None and time.monotonic() - _built_at < GRAPH_TTL_SEC:
+            return _graph
+        generation = _generation
+    graph = _build()
+    with _lock:
+        # Если граф сбросили, пока он строился, — не сохраняем устаревший
+        if generation == _generation:
+            _graph, _built_at = graph, time.monotonic()
+    return graph
+
+
+def invalidate(*args, **kwargs):
+    """Сбросить граф; сигнатура совместима с обработчиками сигналов."""
+    global _graph, _generation
+    with _lock:
+        _graph = None
+        _generation += 1
+
+
+def student_contacts(user):
+    """id учителей класса ученика и куратора."""
+    return get_graph().student_contacts(user.id)
+
+
+def parent_contacts(user):
+    """id кураторов классов детей родителя."""
+    return get_graph().parent_contacts(user.id)
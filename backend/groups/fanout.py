@@ -0,0 +1,123 @@
+"""
+Рассылка событий чата по WebSocket-подключениям комнаты.
+
+Обычные комнаты используют группу chat_{id} основного слоя (RedisChannelLayer).
+Его group_send читает из Redis весь список каналов группы и раскладывает сообщение
+по ключам каналов внутри запроса отправителя, поэтому время отправки растёт с
+размером комнаты. Комнаты от CHAT_FANOUT_THRESHOLD участников (общешкольные чаты)
+переводятся на pub/sub-слой CHANNEL_LAYERS['fanout']: отправка — один PUBLISH,
+а раскладку по локальным подключениям делает каждый процесс-подписчик.
+
+Переход односторонний, до перезапуска процесса. Подключения, открытые до перехода,
+получают по старой группе событие chat_fanout_upgrade и подписываются на pub/sub.
+Событие, на котором комната стала большой, ещё уходит по старой группе.
+Если слой 'fanout' не настроен (тесты, InMemoryChannelLayer), всё идёт по группе.
+
+Бенчмарк: benchmarks/broadcast_latency.py.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+FANOUT_ALIAS = 'fanout'
+MEMBER_COUNT_TTL_SEC = 60
+
+_MAX_ROOMS = 4096
+
+_counts: 'OrderedDict[int, tuple]' = OrderedDict()   # room_id → (expires_at, число участников)
+_large: 'set[int]' = set()
+_counters = {'group_sends': 0, 'fanout_sends': 0, 'upgrades': 0}
+_lock = threading.Lock()
+
+
+def room_group(room_id):
+    return f'chat_{room_id}'
+
+
+def threshold():
+    return getattr(settings, 'CHAT_FANOUT_THRESHOLD', 300)
+
+
+def fanout_layer():
+    """Pub/sub-слой для больших комнат или None, если он не настроен."""
+    if FANOUT_ALIAS not in settings.CHANNEL_LAYERS:
+        return None
+    return get_channel_layer(FANOUT_ALIAS)
+
+
+def _member_count(room_id):
+    from .models import ChatMember
+
+    now = time.monotonic()
+    with _lock:
+        entry = _counts.get(room_id)
+        if entry is not None and entry[0] > now:
+            _counts.move_to_end(room_id)
+            return entry[1]
+    count = ChatMember.objects.filter(room_id=room_id).count()
+    with _lock:
+        _counts[room_id] = (now + MEMBER_COUNT_TTL_SEC, count)
+        _counts.move_to_end(room_id)
+        while len(_counts) > _MAX_ROOMS:
+            _counts.popitem(last=False)
+    return count
+
+
+def _classify(room_id):
+    """(большая ли комната, стала ли она большой только что). Синхронно, может читать БД."""
+    with _lock:
+        if room_id in _large:
+            return True, False
+    if fanout_layer() is None or _member_count(room_id) < threshold():
+        return False, False
+    with _lock:
+        upgraded = room_id not in _large
+        _large.add(room_id)
+        if upgraded:
+            _counters['upgrades'] += 1
+    return True, upgraded
+
+
+async def is_large(room_id):
+    with _lock:
+        if room_id in _large:
+            return True
+    large, upgraded = await database_sync_to_async(_classify)(room_id)
+    if upgraded:
+        await get_channel_layer().group_send(room_group(room_id), {'type': 'chat_fanout_upgrade'})
+    return large
+
+
+async def group_send(room_id, event):
+    """Отправить готовое событие группы (consumers.group_event) всем подключениям комнаты."""
+    with _lock:
+        large, upgraded = room_id in _large, False
+    if not large:
+        large, upgraded = await database_sync_to_async(_classify)(room_id)
+    if large and not upgraded:
+        with _lock:
+            _counters['fanout_sends'] += 1
+        await fanout_layer().group_send(room_group(room_id), event)
+        return
+    # Комната небольшая или только что стала большой: открытые подключения
+    # ещё не подписаны на pub/sub, поэтому это событие идёт по группе
+    with _lock:
+        _counters['group_sends'] += 1
+    layer = get_channel_layer()
+    await layer.group_send(room_group(room_id), event)
+    if upgraded:
+        await layer.group_send(room_group(room_id), {'type': 'chat_fanout_upgrade'})
+
+
+def invalidate_count(room_id):
+    with _lock:
+        _counts.pop(room_id, None)
+
+
+def stats():
+    with _lock:
+        return {**_counters, 'large_rooms': len(_large), 'threshold': threshold()}
@@ -0,0 +1,41 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from groups import archive
+
+
+class Command(BaseCommand):
+    help = 'Move chat messages older than CHAT_ARCHIVE_AFTER_DAYS to the archive table in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Archive messages older than this many days (default: CHAT_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Messages per transaction')
+        parser.add_argument('--sleep', type=float, default=0.2,
+                            help='Pause between batches, seconds')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count messages that would be archived')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else archive.archive_after_days()
+        cutoff = timezone.now() - timedelta(days=days)
+        self.stdout.write(f'Cutoff: {cutoff:%Y-%m-%d %H:%M} ({days} days)')
+
+        if options['dry_run']:
+            self.stdout.write(f'Would archive: {archive.candidates(cutoff).count()} messages')
+            return
+
+        total = 0
+        while True:
+            moved = archive.archive_batch(cutoff, batch_size=options['batch_size'])
+            if not moved:
+                break
+            total += moved
+            self.stdout.write(f'Archived {total} messages...')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Done: {total} messages archived'))
@@ -1,21 +1,23 @@
+import logging
 from urllib.parse import parse_qs
 
 from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from jwt import decode as jwt_decode
-from django.conf import settings
-
-
-@database_sync_to_async
-def get_user(user_id):
-    User = get_user_model()
-    try:
-        return User.objects.get(id=user_id)
-    except User.DoesNotExist:
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts import user_cache
+
+logger = logging.getLogger(__name__)
+
+
+async def get_user(user_id):
+    # Попадание в кэш снимков не требует перехода в поток для БД
+    user = user_cache.peek(user_id) or await database_sync_to_async(user_cache.get_user)(user_id)
+    if user is None or not user.is_active:
         return AnonymousUser()
+    return user
 
 
 class JWTAuthMiddleware:
@@ -32,16 +34,19 @@ class JWTAuthMiddleware:
         params = parse_qs(query_string)
         token_list = params.get('token', [])
 
+        scope['user'] = AnonymousUser()
         if token_list:
-            token = token_list[0]
             try:
-                UntypedToken(token)
-                decoded = jwt_decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-                user_id = decoded.get('user_id')
-                scope['user'] = await get_user(user_id)
-            except (InvalidToken, TokenError, Exception):
-                scope['user'] = AnonymousUser()
-        else:
-            scope['user'] = AnonymousUser()
+                # Одна проверка: подпись, срок действия и тип токена (access)
+                user_id = AccessToken(token_list[0])[api_settings.USER_ID_CLAIM]
+            except (TokenError, KeyError):
+                pass
+            else:
+                try:
+                    scope['user'] = await get_user(user_id)
+                except Exception:
+                    # Ошибка БД не должна обрывать рукопожатие: соединение остаётся анонимным,
+                    # и консьюмер закроет его своим кодом
+                    logger.exception('[JWTAuth] user %s lookup failed', user_id)
 
         return await self.inner(scope, receive, send)
@@ -0,0 +1,45 @@
+# Data migration: заполняет ChatRoom.last_message/last_message_at и ChatMember.unread_count.
+
+from django.db import migrations
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def forward(apps, schema_editor):
+    ChatRoom = apps.get_model('groups', 'ChatRoom')
+    ChatMember = apps.get_model('groups', 'ChatMember')
+    ChatMessage = apps.get_model('groups', 'ChatMessage')
+
+    last = ChatMessage.objects.filter(room=OuterRef('pk'), is_deleted=False).order_by('-created_at', '-id')
+    ChatRoom.objects.update(
+        last_message=Subquery(last.values('id')[:1]),
+        last_message_at=Subquery(last.values('created_at')[:1]),
+    )
+
+    def unread(extra):
+        qs = (
+            ChatMessage.objects.filter(room=OuterRef('room'), is_deleted=False)
+            .exclude(sender=OuterRef('user'))
+            .filter(extra)
+            .order_by()
+            .values('room')
+            .annotate(c=Count('id'))
+            .values('c')
+        )
+        return Coalesce(Subquery(qs, output_field=IntegerField()), Value(0))
+
+    ChatMember.objects.filter(last_read_at__isnull=True).update(unread_count=unread(Q()))
+    ChatMember.objects.filter(last_read_at__isnull=False).update(
+        unread_count=unread(Q(created_at__gt=OuterRef('last_read_at'))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0009_chat_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Полнотекстовый индекс сообщений чата (см. groups/search.py):
+# PostgreSQL — GIN-индекс по to_tsvector('russian', text),
+# SQLite — теневая FTS5-таблица с триггерами синхронизации.
+
+from django.db import migrations
+
+_SQLITE_FORWARD = [
+    '''CREATE VIRTUAL TABLE groups_chatmessage_fts USING fts5(
+        text, tokenize = 'unicode61 remove_diacritics 2'
+    )''',
+    '''INSERT INTO groups_chatmessage_fts(rowid, text)
+        SELECT id, text FROM groups_chatmessage WHERE NOT is_deleted AND text != \'\'''',
+    '''CREATE TRIGGER groups_chatmessage_fts_ai AFTER INSERT ON groups_chatmessage
+        WHEN NOT new.is_deleted AND new.text != \'\'
+        BEGIN
+            INSERT INTO groups_chatmessage_fts(rowid, text) VALUES (new.id, new.text);
+        END''',
+    '''CREATE TRIGGER groups_chatmessage_fts_au AFTER UPDATE OF text, is_deleted ON groups_chatmessage
+        BEGIN
+            DELETE FROM groups_chatmessage_fts WHERE rowid = old.id;
+            INSERT INTO groups_chatmessage_fts(rowid, text)
+                SELECT new.id, new.text WHERE NOT new.is_deleted AND new.text != \'\';
+        END''',
+    '''CREATE TRIGGER groups_chatmessage_fts_ad AFTER DELETE ON groups_chatmessage
+        BEGIN
+            DELETE FROM groups_chatmessage_fts WHERE rowid = old.id;
+        END''',
+]
+
+_SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS groups_chatmessage_fts_ad',
+    'DROP TRIGGER IF EXISTS groups_chatmessage_fts_au',
+    'DROP TRIGGER IF EXISTS groups_chatmessage_fts_ai',
+    'DROP TABLE IF EXISTS groups_chatmessage_fts',
+]
+
+_POSTGRES_FORWARD = [
+    '''CREATE INDEX IF NOT EXISTS groups_chatmessage_text_fts ON groups_chatmessage
+        USING GIN (to_tsvector('russian', text)) WHERE NOT is_deleted''',
+]
+
+_POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS groups_chatmessage_text_fts',
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for sql in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0011_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': _SQLITE_FORWARD, 'postgresql': _POSTGRES_FORWARD}),
+            _run({'sqlite': _SQLITE_BACKWARD, 'postgresql': _POSTGRES_BACKWARD}),
+        ),
+    ]
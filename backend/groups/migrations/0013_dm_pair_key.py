@@ -0,0 +1,82 @@
+# Generated by Django 5.1.4 on 2026-10-16 22:57
+# Заполняет канонический ключ пары для личных чатов. Дубли DM одной пары
+# сливаются в самый старый: сообщения переносятся, участие объединяется,
+# last_message и unread_count пересчитываются.
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _merge(apps, keep_id, dup_ids):
+    ChatRoom = apps.get_model('groups', 'ChatRoom')
+    ChatMember = apps.get_model('groups', 'ChatMember')
+    ChatMessage = apps.get_model('groups', 'ChatMessage')
+
+    ChatMessage.objects.filter(room_id__in=dup_ids).update(room_id=keep_id)
+    for member in ChatMember.objects.filter(room_id=keep_id):
+        read_at = [member.last_read_at] + list(
+            ChatMember.objects.filter(room_id__in=dup_ids, user_id=member.user_id)
+            .values_list('last_read_at', flat=True)
+        )
+        read_at = [t for t in read_at if t is not None]
+        member.last_read_at = max(read_at) if read_at else None
+        unread = ChatMessage.objects.filter(room_id=keep_id, is_deleted=False).exclude(sender_id=member.user_id)
+        if member.last_read_at:
+            unread = unread.filter(created_at__gt=member.last_read_at)
+        member.unread_count = unread.count()
+        member.save(update_fields=['last_read_at', 'unread_count'])
+    ChatRoom.objects.filter(id__in=dup_ids).delete()
+
+    last = (
+        ChatMessage.objects.filter(room_id=keep_id, is_deleted=False)
+        .order_by('-created_at', '-id')
+        .first()
+    )
+    ChatRoom.objects.filter(id=keep_id).update(
+        last_message=last, last_message_at=last.created_at if last else None,
+    )
+
+
+def forward(apps, schema_editor):
+    ChatRoom = apps.get_model('groups', 'ChatRoom')
+    ChatMember = apps.get_model('groups', 'ChatMember')
+
+    users_by_room = defaultdict(set)
+    for room_id, user_id in ChatMember.objects.filter(room__room_type='direct').values_list('room_id', 'user_id'):
+        users_by_room[room_id].add(user_id)
+
+    # DM, где осталось меньше двух участников, ключа не получает
+    rooms_by_pair = defaultdict(list)
+    for room_id, users in users_by_room.items():
+        if len(users) == 2:
+            rooms_by_pair[tuple(sorted(users))].append(room_id)
+
+    for (low, high), room_ids in rooms_by_pair.items():
+        keep_id, *dup_ids = sorted(room_ids)
+        if dup_ids:
+            _merge(apps, keep_id, dup_ids)
+        ChatRoom.objects.filter(id=keep_id).update(dm_user_min=low, dm_user_max=high)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0012_message_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='dm_user_max',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='dm_user_min',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(forward, migrations.RunPython.noop),
+    ]
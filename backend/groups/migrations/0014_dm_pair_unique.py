@@ -0,0 +1,18 @@
+# Уникальность ключа пары — отдельной миграцией: в PostgreSQL ALTER TABLE
+# в одной транзакции со слиянием дублей (0013) упирается в отложенные FK-триггеры.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0013_dm_pair_key'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='chatroom',
+            constraint=models.UniqueConstraint(fields=('dm_user_min', 'dm_user_max'), name='chatroom_dm_pair_unique'),
+        ),
+    ]
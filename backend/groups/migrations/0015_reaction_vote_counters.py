@@ -0,0 +1,68 @@
+# Generated by Django 5.1.4 on 2026-10-16 23:15
+# Денормализованные счётчики голосов и реакций, заполняются по существующим данным.
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill(apps, schema_editor):
+    ChatPoll = apps.get_model('groups', 'ChatPoll')
+    ChatPollOption = apps.get_model('groups', 'ChatPollOption')
+    ChatPollVote = apps.get_model('groups', 'ChatPollVote')
+    ChatReaction = apps.get_model('groups', 'ChatReaction')
+    ChatReactionCount = apps.get_model('groups', 'ChatReactionCount')
+
+    options = list(ChatPollOption.objects.annotate(n=Count('votes')).filter(n__gt=0))
+    for option in options:
+        option.vote_count = option.n
+    ChatPollOption.objects.bulk_update(options, ['vote_count'], batch_size=500)
+
+    voters = (
+        ChatPollVote.objects.values('option__poll_id')
+        .annotate(n=Count('user_id', distinct=True))
+        .values_list('option__poll_id', 'n')
+    )
+    polls = [ChatPoll(id=poll_id, voter_count=n) for poll_id, n in voters]
+    ChatPoll.objects.bulk_update(polls, ['voter_count'], batch_size=500)
+
+    rows = ChatReaction.objects.values('message_id', 'emoji').annotate(n=Count('id')).order_by()
+    ChatReactionCount.objects.bulk_create(
+        [ChatReactionCount(message_id=r['message_id'], emoji=r['emoji'], count=r['n']) for r in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0014_dm_pair_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatpoll',
+            name='voter_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Проголосовало'),
+        ),
+        migrations.AddField(
+            model_name='chatpolloption',
+            name='vote_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Голосов'),
+        ),
+        migrations.CreateModel(
+            name='ChatReactionCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('emoji', models.CharField(max_length=10, verbose_name='Эмодзи')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reaction_counts', to='groups.chatmessage')),
+            ],
+            options={
+                'verbose_name': 'Счётчик реакций',
+                'verbose_name_plural': 'Счётчики реакций',
+                'unique_together': {('message', 'emoji')},
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-16 23:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0015_reaction_vote_counters'),
+        ('tasks', '0005_task_priority'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['updated_at', 'id'], name='chatmessage_updated_idx'),
+        ),
+    ]
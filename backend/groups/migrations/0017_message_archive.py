@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-16 23:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0016_message_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='messages_archived_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedChatMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('academic_year', models.PositiveSmallIntegerField(verbose_name='Учебный год')),
+                ('created_at', models.DateTimeField()),
+                ('payload', models.JSONField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='groups.chatroom')),
+            ],
+            options={
+                'verbose_name': 'Архивное сообщение',
+                'verbose_name_plural': 'Архивные сообщения',
+                'indexes': [models.Index(fields=['room', 'created_at', 'id'], name='archivedmsg_room_created_idx'), models.Index(fields=['academic_year'], name='archivedmsg_year_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-17 00:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0017_message_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmember',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 class ChatRoom(models.Model):
@@ -22,11 +23,32 @@ class ChatRoom(models.Model):
     )
     is_archived = models.BooleanField('Архив', default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Последнее неудалённое сообщение — денормализация для списка чатов,
+    # поддерживается groups/services.py
+    last_message = models.ForeignKey(
+        'ChatMessage',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Канонический ключ личного чата: (меньший id, больший id) собеседников.
+    # Уникален, поэтому на пару пользователей существует не больше одного DM.
+    # У групповых чатов — NULL.
+    dm_user_min = models.PositiveIntegerField(null=True, blank=True)
+    dm_user_max = models.PositiveIntegerField(null=True, blank=True)
+    # created_at самого нового сообщения, перенесённого в ArchivedChatMessage;
+    # NULL — архива у комнаты нет (groups/archive.py)
+    messages_archived_until = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         verbose_name = 'Чат'
         verbose_name_plural = 'Чаты'
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['dm_user_min', 'dm_user_max'], name='chatroom_dm_pair_unique'),
+        ]
 
     def __str__(self):
         return self.name or f'DM #{self.pk}'
@@ -47,7 +69,11 @@ class ChatMember(models.Model):
         related_name='chat_memberships',
     )
     role = models.CharField(max_length=10, choices=ROLES, default=ROLE_MEMBER)
-    last_read_at = models.DateTimeField(null=True, blank=True)
+    # Новый участник начинает с прочитанной историей: unread_count=0 должен
+    # совпадать с числом сообщений после last_read_at (delete_message на это опирается)
+    last_read_at = models.DateTimeField(null=True, blank=True, default=timezone.now)
+    # Чужие неудалённые сообщения после last_read_at, см. groups/services.py
+    unread_count = models.PositiveIntegerField(default=0)
     joined_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -91,6 +117,12 @@ class ChatMessage(models.Model):
         verbose_name = 'Сообщение'
         verbose_name_plural = 'Сообщения'
         ordering = ['created_at']
+        indexes = [
+            # Keyset-пагинация истории: core.pagination.keyset_page
+            models.Index(fields=['room', 'created_at', 'id']),
+            # Догоняющая синхронизация по изменениям: ChatSyncView
+            models.Index(fields=['updated_at', 'id'], name='chatmessage_updated_idx'),
+        ]
 
     def __str__(self):
         return f'{self.sender} → {self.room}: {self.text[:50]}'
@@ -115,6 +147,8 @@ class ChatPoll(models.Model):
     message = models.OneToOneField(ChatMessage, on_delete=models.CASCADE, related_name='poll')
     question = models.TextField('Вопрос')
     is_multiple = models.BooleanField('Мультивыбор', default=False)
+    # Число проголосовавших (не голосов); ведёт groups/services.vote
+    voter_count = models.PositiveIntegerField('Проголосовало', default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -129,6 +163,7 @@ class ChatPollOption(models.Model):
     poll = models.ForeignKey(ChatPoll, on_delete=models.CASCADE, related_name='options')
     text = models.CharField('Текст варианта', max_length=500)
     order = models.PositiveSmallIntegerField('Порядок', default=0)
+    vote_count = models.PositiveIntegerField('Голосов', default=0)   # ведёт groups/services.vote
 
     class Meta:
         verbose_name = 'Вариант опроса'
@@ -216,6 +251,47 @@ class ChatReaction(models.Model):
         return f'{self.user} {self.emoji} → msg#{self.message_id}'
 
 
+class ArchivedChatMessage(models.Model):
+    """
+    Сообщение, перенесённое из ChatMessage в архив (groups/archive.py).
+    id совпадает с исходным. payload — сериализованное сообщение, снятое при
+    архивации (реакции — с id поставивших), только для чтения.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='archived_messages')
+    academic_year = models.PositiveSmallIntegerField('Учебный год')   # 2024 — 2024/25
+    created_at = models.DateTimeField()
+    payload = models.JSONField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Архивное сообщение'
+        verbose_name_plural = 'Архивные сообщения'
+        indexes = [
+            # Keyset-пагинация истории с догрузкой из архива: core.pagination.keyset_page
+            models.Index(fields=['room', 'created_at', 'id'], name='archivedmsg_room_created_idx'),
+            models.Index(fields=['academic_year'], name='archivedmsg_year_idx'),
+        ]
+
+    def __str__(self):
+        return f'[архив {self.academic_year}] msg#{self.id} → room#{self.room_id}'
+
+
+class ChatReactionCount(models.Model):
+    """Число реакций emoji на сообщение; ведёт groups/services.toggle_reaction."""
+    message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, related_name='reaction_counts')
+    emoji = models.CharField('Эмодзи', max_length=10)
+    count = models.PositiveIntegerField('Количество', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчик реакций'
+        verbose_name_plural = 'Счётчики реакций'
+        unique_together = [['message', 'emoji']]
+
+    def __str__(self):
+        return f'{self.emoji}×{self.count} → msg#{self.message_id}'
+
+
 class ChatTaskTake(models.Model):
     """Фиксирует, кто взял задачу из чата. Каждый участник получает личную копию задачи."""
     message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, related_name='task_takes')
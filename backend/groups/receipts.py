@@ -0,0 +1,82 @@
+"""
+Ограничение частоты «печатает…» и отметок о прочтении в чатах.
+
+Клиент шлёт typing на каждое нажатие клавиши, а mark_read — на каждую прокрутку
+и фокус окна. Раньше каждый такой кадр превращался в рассылку по комнате (а
+mark_read — ещё и в UPDATE ChatMember). Теперь, по (room_id, user_id):
+- typing рассылается не чаще раза в TYPING_INTERVAL_SEC, остальные отбрасываются;
+- mark_read записывается и рассылается сразу, если с прошлой записи прошло
+  READ_INTERVAL_SEC, иначе откладывается до конца интервала, и все отметки за
+  это время сливаются в одну запись и одно событие room_read.
+
+Состояние общее для всех подключений процесса, поэтому несколько вкладок одного
+пользователя делят один интервал. Счётчики — stats(), в /api/admin/cache-stats/.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+TYPING_INTERVAL_SEC = 2.5
+READ_INTERVAL_SEC = 5
+
+_MAX_ENTRIES = 8192
+
+_typing: 'OrderedDict[tuple, float]' = OrderedDict()   # (room_id, user_id) → время последней рассылки
+_reads: 'OrderedDict[tuple, list]' = OrderedDict()     # (room_id, user_id) → [время последней записи, ждёт ли запись]
+_counters = {'typing_sent': 0, 'typing_suppressed': 0, 'read_flushes': 0, 'read_coalesced': 0}
+_lock = threading.Lock()
+
+
+def _remember(store, key, value):
+    store[key] = value
+    store.move_to_end(key)
+    while len(store) > _MAX_ENTRIES:
+        store.popitem(last=False)
+
+
+def allow_typing(room_id, user_id):
+    """Разослать ли typing сейчас; если да — интервал начинается заново."""
+    key = (room_id, user_id)
+    now = time.monotonic()
+    with _lock:
+        last = _typing.get(key)
+        if last is not None and now - last < TYPING_INTERVAL_SEC:
+            _counters['typing_suppressed'] += 1
+            return False
+        _remember(_typing, key, now)
+        _counters['typing_sent'] += 1
+        return True
+
+
+def read_delay(room_id, user_id):
+    """
+    Когда записать отметку о прочтении: (0, True) — сейчас; (секунд, True) —
+    вызывающий откладывает запись на это время; (секунд, False) — отложенная
+    запись уже запланирована, отметка сольётся с ней.
+    """
+    key = (room_id, user_id)
+    now = time.monotonic()
+    with _lock:
+        entry = _reads.get(key)
+        if entry is None:
+            return 0, True
+        delay = entry[0] + READ_INTERVAL_SEC - now
+        if delay <= 0 and not entry[1]:
+            return 0, True
+        _counters['read_coalesced'] += 1
+        if entry[1]:
+            return max(delay, 0), False
+        entry[1] = True
+        return delay, True
+
+
+def note_read_flushed(room_id, user_id):
+    """Отметка записана и разослана — новый интервал начинается отсюда."""
+    with _lock:
+        _remember(_reads, (room_id, user_id), [time.monotonic(), False])
+        _counters['read_flushes'] += 1
+
+
+def stats():
+    with _lock:
+        return dict(_counters)
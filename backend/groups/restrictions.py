@@ -0,0 +1,68 @@
+"""
+Кэш ограничений учеников (StudentChatRestriction) и времени последней отправки.
+
+Ограничения есть у единиц учеников, а проверяются на каждое сообщение чата и
+поста проекта. Поэтому результат — включая «ограничений нет» — кэшируется в
+памяти процесса на RESTRICTION_TTL_SEC. Сигналы (groups/signals.py) сбрасывают
+запись при сохранении или удалении ограничения (StudentRestrictionView.put, админка).
+
+Для паузы между сообщениями (message_cooldown) время последней отправки
+хранится в памяти по (scope, user_id), scope — 'chat' или 'project'. Из БД оно
+читается один раз, при первой проверке. Дальше его обновляет note_sent(), и
+только для уже отслеживаемых учеников, поэтому словарь не растёт за счёт
+учеников без паузы.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+RESTRICTION_TTL_SEC = 60
+
+_MAX_ENTRIES = 4096
+
+_restrictions: 'OrderedDict[int, tuple]' = OrderedDict()   # user_id → (expires_at, restriction | None)
+_last_sent: 'dict[tuple, object]' = {}                     # (scope, user_id) → datetime | None
+_lock = threading.Lock()
+
+
+def get_restriction(user_id):
+    """StudentChatRestriction ученика или None; из кэша, если запись не устарела."""
+    from .models import StudentChatRestriction
+
+    now = time.monotonic()
+    with _lock:
+        entry = _restrictions.get(user_id)
+        if entry is not None and entry[0] > now:
+            _restrictions.move_to_end(user_id)
+            return entry[1]
+    restriction = StudentChatRestriction.objects.filter(student_id=user_id).first()
+    with _lock:
+        _restrictions[user_id] = (now + RESTRICTION_TTL_SEC, restriction)
+        _restrictions.move_to_end(user_id)
+        while len(_restrictions) > _MAX_ENTRIES:
+            _restrictions.popitem(last=False)
+    return restriction
+
+
+def invalidate(user_id):
+    with _lock:
+        _restrictions.pop(user_id, None)
+
+
+def last_sent_at(scope, user_id, load):
+    """Время последней отправки; load() читает его из БД, если в памяти ещё нет."""
+    key = (scope, user_id)
+    with _lock:
+        if key in _last_sent:
+            return _last_sent[key]
+    value = load()
+    with _lock:
+        return _last_sent.setdefault(key, value)
+
+
+def note_sent(scope, user_id, at):
+    """Запомнить отправку, если для пользователя отслеживается пауза."""
+    key = (scope, user_id)
+    with _lock:
+        if key in _last_sent:
+            _last_sent[key] = at
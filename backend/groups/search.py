@@ -0,0 +1,81 @@
+"""
+Полнотекстовый поиск по истории чатов.
+
+Индекс поддерживается самой БД, поэтому не зависит от того, каким путём
+сообщение создано, отредактировано или мягко удалено (text='', is_deleted):
+
+- PostgreSQL (prod): частичный GIN-индекс по to_tsvector('russian', text)
+  для неудалённых сообщений; ранжирование — ts_rank, запрос — websearch_to_tsquery.
+- SQLite (dev): теневая FTS5-таблица groups_chatmessage_fts (rowid = id
+  сообщения), которую синхронизируют триггеры на INSERT/UPDATE/DELETE;
+  ранжирование — bm25. Русского стемминга в FTS5 нет, слова ищутся по префиксу.
+
+Таблицы и индекс создаёт миграция 0012_message_search.
+Миграции, пересоздающие groups_chatmessage в SQLite (_remake_table), удаляют
+триггеры — такие миграции должны создать их заново.
+"""
+import re
+
+from django.db import connection
+
+from .models import ChatMember, ChatMessage
+
+MESSAGE_TABLE = ChatMessage._meta.db_table
+MEMBER_TABLE = ChatMember._meta.db_table
+FTS_TABLE = f'{MESSAGE_TABLE}_fts'
+PG_INDEX = f'{MESSAGE_TABLE}_text_fts'
+
+# Ограничение числа слов в запросе к FTS5
+_MAX_TERMS = 10
+
+
+def _fts5_query(query):
+    """Запрос пользователя → выражение MATCH: все слова, каждое по префиксу."""
+    terms = re.findall(r'\w+', query)[:_MAX_TERMS]
+    return ' '.join(f'"{t}"*' for t in terms)
+
+
+def _search_ids_postgres(user_id, query, limit, offset):
+    sql = f'''
+        SELECT m.id
+        FROM {MESSAGE_TABLE} m
+        JOIN {MEMBER_TABLE} cm ON cm.room_id = m.room_id AND cm.user_id = %s
+        CROSS JOIN websearch_to_tsquery('russian', %s) q
+        WHERE NOT m.is_deleted AND to_tsvector('russian', m.text) @@ q
+        ORDER BY ts_rank(to_tsvector('russian', m.text), q) DESC, m.created_at DESC, m.id DESC
+        LIMIT %s OFFSET %s
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, query, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_ids_sqlite(user_id, query, limit, offset):
+    match = _fts5_query(query)
+    if not match:
+        return []
+    sql = f'''
+        SELECT m.id
+        FROM {FTS_TABLE} f
+        JOIN {MESSAGE_TABLE} m ON m.id = f.rowid
+        JOIN {MEMBER_TABLE} cm ON cm.room_id = m.room_id AND cm.user_id = %s
+        WHERE {FTS_TABLE} MATCH %s AND NOT m.is_deleted
+        ORDER BY bm25({FTS_TABLE}), m.created_at DESC, m.id DESC
+        LIMIT %s OFFSET %s
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, match, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_messages(user, query, limit=20, offset=0):
+    """
+    Сообщения из комнат, где user — участник, по релевантности.
+    Возвращает (список ChatMessage, has_more).
+    """
+    search_ids = _search_ids_postgres if connection.vendor == 'postgresql' else _search_ids_sqlite
+    ids = search_ids(user.id, query, limit + 1, offset)
+    has_more = len(ids) > limit
+    ids = ids[:limit]
+    by_id = ChatMessage.objects.select_related('sender', 'reply_to__sender').in_bulk(ids)
+    return [by_id[i] for i in ids if i in by_id], has_more
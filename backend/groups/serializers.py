@@ -1,7 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
-from .models import ChatRoom, ChatMember, ChatMessage, MessageAttachment, ChatPoll, ChatPollOption, ChatReaction
+from .models import (
+    ChatRoom, ChatMember, ChatMessage, MessageAttachment, ChatPoll, ChatPollOption, ChatPollVote, ChatReaction,
+)
 
 User = get_user_model()
 
@@ -30,7 +33,6 @@ class MessageAttachmentSerializer(serializers.ModelSerializer):
 
 
 class ChatPollOptionSerializer(serializers.ModelSerializer):
-    vote_count = serializers.SerializerMethodField()
     user_voted = serializers.SerializerMethodField()
     voters = serializers.SerializerMethodField()
 
@@ -38,16 +40,26 @@ class ChatPollOptionSerializer(serializers.ModelSerializer):
         model = ChatPollOption
         fields = ['id', 'text', 'order', 'vote_count', 'user_voted', 'voters']
 
-    def get_vote_count(self, obj):
-        return obj.votes.count()
+    def _batch_voters(self, obj):
+        # Голоса всех опросов страницы, загруженные ChatMessageListSerializer одним запросом
+        poll_votes = self.context.get('poll_votes')
+        if poll_votes is None:
+            return None
+        return poll_votes.get(obj.id, [])
 
     def get_user_voted(self, obj):
         request = self.context.get('request')
         if not request:
             return False
+        voters = self._batch_voters(obj)
+        if voters is not None:
+            return any(v['id'] == request.user.id for v in voters)
         return obj.votes.filter(user=request.user).exists()
 
     def get_voters(self, obj):
+        voters = self._batch_voters(obj)
+        if voters is not None:
+            return voters
         return [
             {'id': v.user_id, 'name': f'{v.user.last_name} {v.user.first_name}'.strip()}
             for v in obj.votes.select_related('user').all()
@@ -56,15 +68,63 @@ class ChatPollOptionSerializer(serializers.ModelSerializer):
 
 class ChatPollSerializer(serializers.ModelSerializer):
     options = ChatPollOptionSerializer(many=True, read_only=True)
-    total_votes = serializers.SerializerMethodField()
+    total_votes = serializers.IntegerField(source='voter_count', read_only=True)
 
     class Meta:
         model = ChatPoll
         fields = ['id', 'question', 'is_multiple', 'options', 'total_votes']
 
-    def get_total_votes(self, obj):
-        from .models import ChatPollVote
-        return ChatPollVote.objects.filter(option__poll=obj).values('user').distinct().count()
+
+class ChatMessageListSerializer(serializers.ListSerializer):
+    """
+    Страница сообщений за фиксированное число запросов, независимо от её размера:
+    связи подгружаются prefetch_related_objects, голоса опросов — одним запросом.
+    Используется для истории и для WS-кадров message_new (страница из одного сообщения).
+    """
+
+    def to_representation(self, data):
+        messages = list(data.all() if hasattr(data, 'all') else data)
+        lookups = [
+            'sender', 'attachments', 'reaction_counts',
+            'reply_to__sender', 'reply_to__attachments',
+            'task__created_by', 'task_takes__user',
+            'poll__options',
+        ]
+        request = self.context.get('request')
+        if request is not None:
+            # Из реакций нужны только свои (user_reacted); счётчики — в reaction_counts
+            lookups.append(Prefetch(
+                'reactions', queryset=ChatReaction.objects.filter(user_id=request.user.id), to_attr='my_reactions',
+            ))
+        prefetch_related_objects(messages, *lookups)
+        option_ids = [
+            option.id
+            for m in messages if _cached_poll(m) is not None
+            for option in _cached_poll(m).options.all()
+        ]
+        poll_votes = {option_id: [] for option_id in option_ids}
+        if option_ids:
+            votes = ChatPollVote.objects.filter(option_id__in=option_ids).values_list(
+                'option_id', 'user_id', 'user__last_name', 'user__first_name',
+            ).order_by('id')
+            for option_id, user_id, last_name, first_name in votes:
+                poll_votes[option_id].append({'id': user_id, 'name': f'{last_name} {first_name}'.strip()})
+        self.context['poll_votes'] = poll_votes
+        return [self.child.to_representation(m) for m in messages]
+
+
+def serialize_message(message, request=None):
+    """Одно сообщение через пакетный путь ChatMessageListSerializer (ответ на создание, WS message_new)."""
+    context = {'request': request} if request else {}
+    return ChatMessageSerializer([message], many=True, context=context).data[0]
+
+
+def _cached_poll(message):
+    """Опрос сообщения из prefetch-кэша (None, если его нет)."""
+    try:
+        return message.poll
+    except ChatPoll.DoesNotExist:
+        return None
 
 
 class ChatMessageSerializer(serializers.ModelSerializer):
@@ -80,6 +140,7 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         fields = ['id', 'room', 'sender', 'text', 'reply_to', 'reply_to_preview',
                   'attachments', 'poll', 'task_preview', 'reactions',
                   'created_at', 'updated_at', 'is_deleted']
+        list_serializer_class = ChatMessageListSerializer
 
     def get_reply_to_preview(self, obj):
         if not obj.reply_to_id:
@@ -88,13 +149,12 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         if r.is_deleted:
             return {'id': r.id, 'text': '[удалено]', 'sender_name': ''}
         sender_name = f'{r.sender.last_name} {r.sender.first_name}'.strip() if r.sender else ''
-        text = r.text or ('[файл]' if r.attachments.exists() else '')
+        text = r.text or ('[файл]' if r.attachments.all() else '')
         return {'id': r.id, 'text': text[:100], 'sender_name': sender_name}
 
     def get_poll(self, obj):
-        try:
-            poll = obj.poll
-        except Exception:
+        poll = _cached_poll(obj)
+        if poll is None:
             return None
         return ChatPollSerializer(poll, context=self.context).data
 
@@ -105,13 +165,13 @@ class ChatMessageSerializer(serializers.ModelSerializer):
         created_by_name = ''
         if task.created_by:
             created_by_name = f'{task.created_by.last_name} {task.created_by.first_name}'.strip()
-        takes = obj.task_takes.select_related('user').all()
+        takes = obj.task_takes.all()  # prefetch-кэш ChatMessageListSerializer
         takers = [
             {'id': t.user_id, 'name': f'{t.user.last_name} {t.user.first_name}'.strip()}
             for t in takes
         ]
         request = self.context.get('request')
-        user_took = bool(request and takes.filter(user=request.user).exists())
+        user_took = bool(request and any(t.user_id == request.user.id for t in takes))
         return {
             'id': task.id,
             'title': task.title,
@@ -124,15 +184,18 @@ class ChatMessageSerializer(serializers.ModelSerializer):
 
     def get_reactions(self, obj):
         request = self.context.get('request')
-        reactions = list(obj.reactions.all())  # uses prefetch cache when available
-        if not reactions:
+        counts = [c for c in obj.reaction_counts.all() if c.count > 0]  # prefetch-кэш, если есть
+        if not counts:
             return []
-        from collections import Counter
-        counts = Counter(r.emoji for r in reactions)
-        my_emojis = set(r.emoji for r in reactions if request and r.user_id == request.user.id)
+        if request is None:
+            my_emojis = set()
+        elif hasattr(obj, 'my_reactions'):
+            my_emojis = {r.emoji for r in obj.my_reactions}
+        else:
+            my_emojis = set(obj.reactions.filter(user_id=request.user.id).values_list('emoji', flat=True))
         return [
-            {'emoji': emoji, 'count': count, 'user_reacted': emoji in my_emojis}
-            for emoji, count in sorted(counts.items())
+            {'emoji': c.emoji, 'count': c.count, 'user_reacted': c.emoji in my_emojis}
+            for c in sorted(counts, key=lambda c: c.emoji)
         ]
 
 
@@ -156,17 +219,16 @@ class ChatRoomSerializer(serializers.ModelSerializer):
                   'last_message', 'unread_count', 'other_user', 'members_count']
 
     def get_last_message(self, obj):
-        # Используем prefetch-кэш active_messages если доступен (ChatRoomListView),
-        # иначе fallback на DB-запрос (ChatRoomDetailView, ChatDirectView).
-        active = getattr(obj, 'active_messages', None)
-        msg = active[0] if active else obj.messages.filter(is_deleted=False).last()
+        # Денормализованный last_message; ChatRoomListView подтягивает его
+        # select_related/prefetch_related вместе с sender, poll и attachments.
+        msg = obj.last_message
         if not msg:
             return None
         if msg.is_deleted:
             text = '[удалено]'
         elif msg.text:
             text = msg.text
-        elif msg.attachments.exists():
+        elif msg.attachments.all():
             text = '[файл]'
         elif msg.task_id:
             text = '[задача]'
@@ -191,23 +253,12 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if not request:
             return 0
-        # members_rel__user prefetch-нут в ChatRoomListView — .all() использует кэш.
+        # ChatRoomListView аннотирует счётчик текущего пользователя
+        my_unread = getattr(obj, 'my_unread', None)
+        if my_unread is not None:
+            return my_unread
         member = next((m for m in obj.members_rel.all() if m.user_id == request.user.id), None)
-        if not member:
-            return 0
-        active = getattr(obj, 'active_messages', None)
-        if active is None:
-            # Fallback для views без prefetch (ChatRoomDetailView и др.)
-            qs = obj.messages.filter(is_deleted=False).exclude(sender=request.user)
-            if member.last_read_at:
-                qs = qs.filter(created_at__gt=member.last_read_at)
-            return qs.count()
-        # Фильтруем в Python по уже загруженным данным — 0 DB-запросов.
-        return sum(
-            1 for m in active
-            if m.sender_id != request.user.id
-            and (not member.last_read_at or m.created_at > member.last_read_at)
-        )
+        return member.unread_count if member else 0
 
     def get_other_user(self, obj):
         request = self.context.get('request')
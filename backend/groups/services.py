@@ -0,0 +1,206 @@
+"""
+Создание/удаление сообщений чата вместе с денормализованными полями:
+ChatRoom.last_message / last_message_at и ChatMember.unread_count.
+
+Все изменения сообщений чата должны идти через эти функции, иначе список
+чатов (ChatRoomListView) покажет устаревшее последнее сообщение и счётчики.
+
+Так же голоса в опросах и реакции меняются только через vote / toggle_reaction:
+они ведут ChatPollOption.vote_count, ChatPoll.voter_count и ChatReactionCount
+(F()-обновления в той же транзакции) и возвращают изменение для рассылки.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core import authz, membership
+
+from . import fanout, restrictions
+from .models import ChatRoom, ChatMember, ChatMessage, ChatPoll, ChatPollOption, ChatPollVote, ChatReaction, ChatReactionCount
+
+
+def create_message(room, sender, text='', **fields):
+    """Создать сообщение, сдвинуть last_message комнаты и счётчики непрочитанных."""
+    with transaction.atomic():
+        msg = ChatMessage.objects.create(room=room, sender=sender, text=text, **fields)
+        # auto_now и auto_now_add берут разные timezone.now(): выравниваем, чтобы
+        # неизменённое сообщение стояло в порядке синхронизации ровно на created_at
+        ChatMessage.objects.filter(pk=msg.pk).update(updated_at=msg.created_at)
+        msg.updated_at = msg.created_at
+        ChatRoom.objects.filter(id=room.id).filter(
+            Q(last_message_at__isnull=True) | Q(last_message_at__lte=msg.created_at),
+        ).update(last_message=msg, last_message_at=msg.created_at)
+        ChatMember.objects.filter(room_id=room.id).exclude(user_id=sender.id).update(
+            unread_count=F('unread_count') + 1,
+        )
+    restrictions.note_sent('chat', sender.id, msg.created_at)
+    return msg
+
+
+def delete_message(msg):
+    """
+    Мягко удалить сообщение. Возвращает False, если оно уже было удалено.
+    Счётчики уменьшаются только у тех, для кого сообщение было непрочитанным.
+    """
+    with transaction.atomic():
+        updated = ChatMessage.objects.filter(pk=msg.pk, is_deleted=False).update(
+            is_deleted=True, text='', updated_at=timezone.now(),
+        )
+        if not updated:
+            return False
+        msg.is_deleted = True
+        msg.text = ''
+
+        ChatMember.objects.filter(room_id=msg.room_id, unread_count__gt=0).exclude(
+            user_id=msg.sender_id,
+        ).filter(
+            Q(last_read_at__isnull=True) | Q(last_read_at__lt=msg.created_at),
+        ).update(unread_count=F('unread_count') - 1)
+
+        room = ChatRoom.objects.select_for_update().get(pk=msg.room_id)
+        if room.last_message_id == msg.id:
+            last = (
+                ChatMessage.objects.filter(room_id=room.id, is_deleted=False)
+                .order_by('-created_at', '-id')
+                .only('id', 'created_at')
+                .first()
+            )
+            room.last_message = last
+            room.last_message_at = last.created_at if last else None
+            room.save(update_fields=['last_message', 'last_message_at'])
+    return True
+
+
+def touch_message(message_id):
+    """
+    Сдвинуть updated_at сообщения: изменились его реакции, опрос или задача.
+    По updated_at клиент догоняет пропущенные изменения (ChatSyncView).
+    """
+    ChatMessage.objects.filter(pk=message_id).update(updated_at=timezone.now())
+
+
+def vote(poll, option, user):
+    """
+    Голос user за option. В опросе с одним ответом прежний голос снимается.
+    Возвращает изменение: {'options': [{'id', 'vote_count', 'voted'}],
+    'total_votes'} — только затронутые варианты, с новыми значениями.
+    Голоса опроса сериализуются блокировкой строки ChatPoll: иначе два параллельных
+    первых голоса одного пользователя оба увидят «голоса не было» и дважды
+    увеличат voter_count.
+    """
+    with transaction.atomic():
+        ChatPoll.objects.select_for_update().filter(pk=poll.pk).values_list('pk', flat=True).first()
+        previous = set(
+            ChatPollVote.objects.filter(option__poll=poll, user=user).values_list('option_id', flat=True)
+        )
+        changed = {}
+        if not poll.is_multiple:
+            for option_id in previous - {option.id}:
+                deleted, _ = ChatPollVote.objects.filter(option_id=option_id, user=user).delete()
+                if deleted:
+                    ChatPollOption.objects.filter(pk=option_id).update(vote_count=F('vote_count') - 1)
+                    changed[option_id] = False
+        if option.id not in previous:
+            _, created = ChatPollVote.objects.get_or_create(option=option, user=user)
+            if created:
+                ChatPollOption.objects.filter(pk=option.id).update(vote_count=F('vote_count') + 1)
+                changed[option.id] = True
+        if not previous and changed.get(option.id):
+            ChatPoll.objects.filter(pk=poll.pk).update(voter_count=F('voter_count') + 1)
+        if changed:
+            touch_message(poll.message_id)
+        counts = dict(ChatPollOption.objects.filter(pk__in=changed).values_list('id', 'vote_count'))
+        total = ChatPoll.objects.filter(pk=poll.pk).values_list('voter_count', flat=True).get()
+    return {
+        'options': [
+            {'id': option_id, 'vote_count': counts[option_id], 'voted': voted}
+            for option_id, voted in changed.items()
+        ],
+        'total_votes': total,
+    }
+
+
+def toggle_reaction(msg, user, emoji):
+    """
+    Переключить реакцию: у пользователя одна реакция на сообщение, повтор того же
+    emoji её снимает. Возвращает изменение: [{'emoji', 'count', 'reacted'}] —
+    только затронутые emoji, с новыми значениями.
+    Реакции сообщения сериализуются блокировкой строки ChatMessage: строка
+    ChatReactionCount создаётся и удаляется (при count=0) только под ней, без
+    гонки get_or_create → IntegrityError и без потери параллельного +1.
+    """
+    with transaction.atomic():
+        ChatMessage.objects.select_for_update().filter(pk=msg.pk).values_list('pk', flat=True).first()
+        current = list(ChatReaction.objects.filter(message=msg, user=user).values_list('emoji', flat=True))
+        changed = {}
+        for old in current:
+            deleted, _ = ChatReaction.objects.filter(message=msg, user=user, emoji=old).delete()
+            if deleted:
+                ChatReactionCount.objects.filter(message=msg, emoji=old).update(count=F('count') - 1)
+                changed[old] = False
+        if emoji not in current:
+            _, created = ChatReaction.objects.get_or_create(message=msg, user=user, emoji=emoji)
+            if created:
+                # Под блокировкой сообщения: строку счётчика никто не создаст и не удалит параллельно
+                if not ChatReactionCount.objects.filter(message=msg, emoji=emoji).update(count=F('count') + 1):
+                    ChatReactionCount.objects.create(message=msg, emoji=emoji, count=1)
+                changed[emoji] = True
+        counts = dict(
+            ChatReactionCount.objects.filter(message=msg, emoji__in=changed).values_list('emoji', 'count')
+        )
+        ChatReactionCount.objects.filter(message=msg, emoji__in=changed, count=0).delete()
+        if changed:
+            touch_message(msg.id)
+    return [
+        {'emoji': e, 'count': counts.get(e, 0), 'reacted': reacted}
+        for e, reacted in sorted(changed.items())
+    ]
+
+
+def mark_read(room_id, user):
+    """Отметить комнату прочитанной. Возвращает число обновлённых участий (0 — не участник)."""
+    return ChatMember.objects.filter(room_id=room_id, user=user).update(
+        last_read_at=timezone.now(), unread_count=0,
+    )
+
+
+def dm_pair_key(user_a_id, user_b_id):
+    """Канонический ключ личного чата — (меньший id, больший id)."""
+    return min(user_a_id, user_b_id), max(user_a_id, user_b_id)
+
+
+def get_or_create_direct(user, other):
+    """
+    Личный чат двух пользователей: один запрос по уникальному ключу пары.
+    Параллельный запрос, создавший DM первым, выигрывает — второй получает его чат.
+    Возвращает (room, created).
+    """
+    low, high = dm_pair_key(user.id, other.id)
+    room = ChatRoom.objects.filter(dm_user_min=low, dm_user_max=high).first()
+    if room:
+        return room, False
+    try:
+        with transaction.atomic():
+            room = ChatRoom.objects.create(
+                room_type=ChatRoom.TYPE_DIRECT, created_by=user, dm_user_min=low, dm_user_max=high,
+            )
+            ChatMember.objects.bulk_create([
+                ChatMember(room=room, user=user),
+                ChatMember(room=room, user=other),
+            ])
+    except IntegrityError:
+        return ChatRoom.objects.get(dm_user_min=low, dm_user_max=high), False
+    # bulk_create не шлёт post_save
+    authz.invalidate('chat_room', resource_id=room.id)
+    return room, True
+
+
+def add_members(room, user_ids, exclude_user_id=None):
+    """Добавить в комнату пользователей по списку id (core/membership.py). Возвращает новые ChatMember."""
+    users = [u for u in membership.resolve_users(user_ids) if u.id != exclude_user_id]
+    added = membership.add_members(ChatMember, 'room', room, users, lambda user: ChatMember(room=room, user=user))
+    if added:
+        # bulk_create не шлёт post_save (groups/signals.py)
+        authz.invalidate('chat_room', resource_id=room.id)
+        fanout.invalidate_count(room.id)
+    return added
@@ -0,0 +1,43 @@
+"""
+Сброс кэшей чата при изменении данных:
+- граф собеседников (groups/eligibility.py) — при изменении школьных связей;
+- ограничения учеников (groups/restrictions.py) — при изменении StudentChatRestriction;
+- решения о доступе к комнатам (core/authz.py) и число участников для выбора
+  способа рассылки (groups/fanout.py) — при изменении участников.
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from school.models import ParentProfile, ScheduleLesson, SchoolClass, StudentProfile
+
+from core import authz
+
+from . import eligibility, fanout, restrictions
+from .models import ChatMember, ChatRoom, StudentChatRestriction
+
+for model in (ScheduleLesson, SchoolClass, StudentProfile, ParentProfile):
+    post_save.connect(eligibility.invalidate, sender=model, dispatch_uid=f'dm_graph_save_{model.__name__}')
+    post_delete.connect(eligibility.invalidate, sender=model, dispatch_uid=f'dm_graph_delete_{model.__name__}')
+
+m2m_changed.connect(eligibility.invalidate, sender=ParentProfile.children.through, dispatch_uid='dm_graph_children')
+
+
+def _invalidate_restriction(sender, instance, **kwargs):
+    restrictions.invalidate(instance.student_id)
+
+
+post_save.connect(_invalidate_restriction, sender=StudentChatRestriction, dispatch_uid='chat_restriction_save')
+post_delete.connect(_invalidate_restriction, sender=StudentChatRestriction, dispatch_uid='chat_restriction_delete')
+
+
+def _invalidate_member(sender, instance, **kwargs):
+    authz.invalidate('chat_room', resource_id=instance.room_id, user_id=instance.user_id)
+    fanout.invalidate_count(instance.room_id)
+
+
+def _invalidate_room(sender, instance, **kwargs):
+    authz.invalidate('chat_room', resource_id=instance.id)
+
+
+post_save.connect(_invalidate_member, sender=ChatMember, dispatch_uid='authz_chat_member_save')
+post_delete.connect(_invalidate_member, sender=ChatMember, dispatch_uid='authz_chat_member_delete')
+post_delete.connect(_invalidate_room, sender=ChatRoom, dispatch_uid='authz_chat_room_delete')
@@ -0,0 +1,335 @@
+from datetime import timedelta
+
+from django.db.models import Count
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import User
+from core.testing import MigrationTestCase
+
+from . import archive, services
+from .models import (
+    ArchivedChatMessage, ChatMember, ChatMessage, ChatPoll, ChatPollOption, ChatPollVote, ChatReaction,
+    ChatReactionCount, ChatRoom,
+)
+
+
+def make_user(username):
+    return User.objects.create(username=username, first_name=username, last_name='T')
+
+
+class CounterTests(TestCase):
+    """Денормализованные счётчики голосов и реакций совпадают с пересчётом по строкам."""
+
+    def setUp(self):
+        self.alice, self.bob, self.carol = (make_user(n) for n in ('alice', 'bob', 'carol'))
+        self.room = ChatRoom.objects.create(name='9А', created_by=self.alice)
+        for user in (self.alice, self.bob, self.carol):
+            ChatMember.objects.create(room=self.room, user=user)
+        self.msg = services.create_message(self.room, self.alice, 'Опрос')
+
+    def make_poll(self, is_multiple=False):
+        poll = ChatPoll.objects.create(message=self.msg, question='Когда контрольная?', is_multiple=is_multiple)
+        options = [ChatPollOption.objects.create(poll=poll, text=t, order=i) for i, t in enumerate('АБВ')]
+        return poll, options
+
+    def assertPollConsistent(self, poll):
+        poll.refresh_from_db()
+        for option in poll.options.annotate(n=Count('votes')):
+            self.assertEqual(option.vote_count, option.n, option.text)
+        voters = ChatPollVote.objects.filter(option__poll=poll).values('user').distinct().count()
+        self.assertEqual(poll.voter_count, voters)
+
+    def assertReactionsConsistent(self):
+        actual = dict(
+            ChatReaction.objects.filter(message=self.msg).values_list('emoji').annotate(n=Count('id'))
+        )
+        stored = dict(ChatReactionCount.objects.filter(message=self.msg).values_list('emoji', 'count'))
+        self.assertEqual(stored, actual)
+
+    def test_single_choice_revote(self):
+        poll, (a, b, c) = self.make_poll()
+        services.vote(poll, a, self.alice)
+        services.vote(poll, a, self.bob)
+        change = services.vote(poll, b, self.alice)
+        self.assertEqual(
+            sorted(change['options'], key=lambda o: o['id']),
+            [{'id': a.id, 'vote_count': 1, 'voted': False}, {'id': b.id, 'vote_count': 1, 'voted': True}],
+        )
+        self.assertEqual(change['total_votes'], 2)
+        self.assertPollConsistent(poll)
+
+    def test_repeat_vote_is_noop(self):
+        poll, (a, b, c) = self.make_poll()
+        services.vote(poll, a, self.alice)
+        change = services.vote(poll, a, self.alice)
+        self.assertEqual(change['options'], [])
+        self.assertEqual(change['total_votes'], 1)
+        self.assertPollConsistent(poll)
+
+    def test_multiple_choice_counts_voters_once(self):
+        poll, (a, b, c) = self.make_poll(is_multiple=True)
+        for option in (a, b, c):
+            services.vote(poll, option, self.alice)
+        services.vote(poll, c, self.carol)
+        self.assertPollConsistent(poll)
+        self.assertEqual(poll.voter_count, 2)
+
+    def test_toggle_reaction(self):
+        services.toggle_reaction(self.msg, self.alice, '👍')
+        services.toggle_reaction(self.msg, self.bob, '👍')
+        change = services.toggle_reaction(self.msg, self.alice, '❤️')
+        self.assertEqual(change, [
+            {'emoji': '❤️', 'count': 1, 'reacted': True},
+            {'emoji': '👍', 'count': 1, 'reacted': False},
+        ])
+        self.assertReactionsConsistent()
+
+    def test_last_reaction_removes_counter_row(self):
+        services.toggle_reaction(self.msg, self.alice, '👍')
+        change = services.toggle_reaction(self.msg, self.alice, '👍')
+        self.assertEqual(change, [{'emoji': '👍', 'count': 0, 'reacted': False}])
+        self.assertFalse(ChatReactionCount.objects.filter(message=self.msg).exists())
+
+
+class ReactionVoteCountersMigrationTests(MigrationTestCase):
+    app = 'groups'
+    migrate_from = '0014_dm_pair_unique'
+    migrate_to = '0015_reaction_vote_counters'
+
+    def test_backfill_and_rollback(self):
+        User = self.apps.get_model('accounts', 'User')
+        ChatRoom = self.apps.get_model('groups', 'ChatRoom')
+        ChatMessage = self.apps.get_model('groups', 'ChatMessage')
+        ChatPoll = self.apps.get_model('groups', 'ChatPoll')
+        ChatPollOption = self.apps.get_model('groups', 'ChatPollOption')
+        ChatPollVote = self.apps.get_model('groups', 'ChatPollVote')
+        ChatReaction = self.apps.get_model('groups', 'ChatReaction')
+
+        alice, bob = (User.objects.create(username=n) for n in ('alice', 'bob'))
+        room = ChatRoom.objects.create(name='9А')
+        msg = ChatMessage.objects.create(room=room, sender=alice, text='Опрос')
+        poll = ChatPoll.objects.create(message=msg, question='?', is_multiple=True)
+        a = ChatPollOption.objects.create(poll=poll, text='А', order=0)
+        b = ChatPollOption.objects.create(poll=poll, text='Б', order=1)
+        ChatPollOption.objects.create(poll=poll, text='В', order=2)
+        ChatPollVote.objects.create(option=a, user=alice)
+        ChatPollVote.objects.create(option=b, user=alice)
+        ChatPollVote.objects.create(option=a, user=bob)
+        ChatReaction.objects.create(message=msg, user=alice, emoji='👍')
+        ChatReaction.objects.create(message=msg, user=bob, emoji='👍')
+        ChatReaction.objects.create(message=msg, user=bob, emoji='❤️')
+
+        apps = self.forward()
+        ChatPoll = apps.get_model('groups', 'ChatPoll')
+        ChatPollOption = apps.get_model('groups', 'ChatPollOption')
+        ChatReactionCount = apps.get_model('groups', 'ChatReactionCount')
+        self.assertEqual(ChatPoll.objects.get(pk=poll.pk).voter_count, 2)
+        self.assertEqual(
+            list(ChatPollOption.objects.filter(poll_id=poll.pk).order_by('order').values_list('vote_count', flat=True)),
+            [2, 1, 0],
+        )
+        self.assertEqual(
+            dict(ChatReactionCount.objects.filter(message_id=msg.pk).values_list('emoji', 'count')),
+            {'👍': 2, '❤️': 1},
+        )
+
+        apps = self.backward()
+        self.assertEqual(apps.get_model('groups', 'ChatPollVote').objects.count(), 3)
+        self.assertEqual(apps.get_model('groups', 'ChatReaction').objects.count(), 3)
+
+
+class UnreadCounterTests(TestCase):
+    """ChatMember.unread_count совпадает с числом непрочитанных сообщений."""
+
+    def setUp(self):
+        self.alice, self.bob, self.carol = (make_user(n) for n in ('alice', 'bob', 'carol'))
+        self.room = ChatRoom.objects.create(name='9А', created_by=self.alice)
+        for user in (self.alice, self.bob):
+            ChatMember.objects.create(room=self.room, user=user)
+
+    def unread(self, user):
+        return ChatMember.objects.get(room=self.room, user=user).unread_count
+
+    def recount(self, user):
+        member = ChatMember.objects.get(room=self.room, user=user)
+        qs = ChatMessage.objects.filter(room=self.room, is_deleted=False).exclude(sender=user)
+        if member.last_read_at:
+            qs = qs.filter(created_at__gt=member.last_read_at)
+        return qs.count()
+
+    def test_new_member_starts_read(self):
+        old = services.create_message(self.room, self.alice, 'до вступления')
+        services.add_members(self.room, [self.carol.id])
+        self.assertEqual(self.unread(self.carol), 0)
+        self.assertEqual(self.recount(self.carol), 0)
+
+        services.create_message(self.room, self.alice, 'после вступления')
+        self.assertEqual(self.unread(self.carol), 1)
+        # Удаление сообщения, отправленного до вступления, счётчик не трогает
+        services.delete_message(old)
+        self.assertEqual(self.unread(self.carol), 1)
+        self.assertEqual(self.recount(self.carol), 1)
+
+    def test_delete_decrements_only_unread(self):
+        first = services.create_message(self.room, self.alice, 'раз')
+        services.mark_read(self.room.id, self.bob)
+        second = services.create_message(self.room, self.alice, 'два')
+        self.assertEqual(self.unread(self.bob), 1)
+
+        services.delete_message(first)
+        self.assertEqual(self.unread(self.bob), 1)
+        services.delete_message(second)
+        self.assertEqual(self.unread(self.bob), 0)
+        self.assertFalse(services.delete_message(second))
+        self.assertEqual(self.unread(self.bob), self.recount(self.bob))
+        self.assertEqual(self.unread(self.alice), 0)
+
+
+class ChatCountersBackfillMigrationTests(MigrationTestCase):
+    app = 'groups'
+    migrate_from = '0008_add_chat_reactions'
+    migrate_to = '0010_backfill_chat_counters'
+
+    def test_backfill_and_rollback(self):
+        User = self.apps.get_model('accounts', 'User')
+        ChatRoom = self.apps.get_model('groups', 'ChatRoom')
+        ChatMember = self.apps.get_model('groups', 'ChatMember')
+        ChatMessage = self.apps.get_model('groups', 'ChatMessage')
+
+        alice, bob, carol = (User.objects.create(username=n) for n in ('alice', 'bob', 'carol'))
+        room = ChatRoom.objects.create(name='9А')
+        empty = ChatRoom.objects.create(name='Пустой')
+        ChatMember.objects.create(room=room, user=alice)
+        first = ChatMessage.objects.create(room=room, sender=alice, text='раз')
+        ChatMember.objects.create(room=room, user=bob, last_read_at=first.created_at)
+        ChatMember.objects.create(room=room, user=carol, last_read_at=None)
+        second = ChatMessage.objects.create(room=room, sender=alice, text='два')
+        ChatMessage.objects.create(room=room, sender=bob, text='удалено', is_deleted=True)
+
+        apps = self.forward()
+        ChatRoom = apps.get_model('groups', 'ChatRoom')
+        ChatMember = apps.get_model('groups', 'ChatMember')
+        room = ChatRoom.objects.get(pk=room.pk)
+        self.assertEqual(room.last_message_id, second.pk)
+        self.assertEqual(room.last_message_at, second.created_at)
+        self.assertIsNone(ChatRoom.objects.get(pk=empty.pk).last_message_id)
+        unread = dict(ChatMember.objects.filter(room=room).values_list('user_id', 'unread_count'))
+        # last_read_at=None — ничего не прочитано
+        self.assertEqual(unread, {alice.pk: 0, bob.pk: 1, carol.pk: 2})
+
+        apps = self.backward()
+        self.assertEqual(apps.get_model('groups', 'ChatMessage').objects.count(), 3)
+        self.assertEqual(apps.get_model('groups', 'ChatMember').objects.count(), 3)
+
+
+class DmPairKeyMigrationTests(MigrationTestCase):
+    app = 'groups'
+    migrate_from = '0012_message_search'
+    migrate_to = '0014_dm_pair_unique'
+
+    def test_duplicates_merge_into_oldest(self):
+        User = self.apps.get_model('accounts', 'User')
+        ChatRoom = self.apps.get_model('groups', 'ChatRoom')
+        ChatMember = self.apps.get_model('groups', 'ChatMember')
+        ChatMessage = self.apps.get_model('groups', 'ChatMessage')
+
+        alice, bob, carol = (User.objects.create(username=n) for n in ('alice', 'bob', 'carol'))
+        keep = ChatRoom.objects.create(room_type='direct')
+        dup = ChatRoom.objects.create(room_type='direct')
+        lonely = ChatRoom.objects.create(room_type='direct')
+        for room in (keep, dup):
+            ChatMember.objects.create(room=room, user=alice)
+            ChatMember.objects.create(room=room, user=bob)
+        ChatMember.objects.create(room=lonely, user=carol)
+        ChatMessage.objects.create(room=keep, sender=alice, text='раз')
+        last = ChatMessage.objects.create(room=dup, sender=alice, text='два')
+
+        apps = self.forward()
+        ChatRoom = apps.get_model('groups', 'ChatRoom')
+        ChatMember = apps.get_model('groups', 'ChatMember')
+        ChatMessage = apps.get_model('groups', 'ChatMessage')
+        self.assertFalse(ChatRoom.objects.filter(pk=dup.pk).exists())
+        room = ChatRoom.objects.get(pk=keep.pk)
+        self.assertEqual((room.dm_user_min, room.dm_user_max), (alice.pk, bob.pk))
+        self.assertEqual(room.last_message_id, last.pk)
+        self.assertEqual(ChatMessage.objects.filter(room=room).count(), 2)
+        self.assertEqual(
+            dict(ChatMember.objects.filter(room=room).values_list('user_id', 'unread_count')),
+            {alice.pk: 0, bob.pk: 2},
+        )
+        self.assertIsNone(ChatRoom.objects.get(pk=lonely.pk).dm_user_min)
+
+        apps = self.backward()
+        self.assertEqual(apps.get_model('groups', 'ChatRoom').objects.count(), 2)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob = make_user('alice'), make_user('bob')
+        self.room = ChatRoom.objects.create(name='9А', created_by=self.alice)
+        for user in (self.alice, self.bob):
+            ChatMember.objects.create(room=self.room, user=user)
+        self.cutoff = timezone.now() - timedelta(days=365)
+
+    def message(self, text, days_ago, **fields):
+        msg = services.create_message(self.room, self.alice, text, **fields)
+        created_at = timezone.now() - timedelta(days=days_ago)
+        ChatMessage.objects.filter(pk=msg.pk).update(created_at=created_at, updated_at=created_at)
+        msg.refresh_from_db()
+        return msg
+
+    def test_candidates_keep_reply_chains_and_last_message(self):
+        plain = self.message('старое', 500)
+        root = self.message('корень цепочки', 480)
+        middle = self.message('ответ', 470, reply_to=root)
+        self.message('свежий ответ', 10, reply_to=middle)
+        last = self.message('последнее', 400)
+        ChatRoom.objects.filter(pk=self.room.pk).update(last_message=last, last_message_at=last.created_at)
+
+        self.assertEqual(list(archive.candidates(self.cutoff)), [plain])
+
+    def test_archive_batch_moves_message_with_reactions(self):
+        old = self.message('старое', 500)
+        services.toggle_reaction(old, self.bob, '👍')
+        fresh = self.message('свежее', 1)
+
+        self.assertEqual(archive.archive_batch(self.cutoff), 1)
+        self.assertFalse(ChatMessage.objects.filter(pk=old.pk).exists())
+        self.assertFalse(ChatReactionCount.objects.filter(message_id=old.pk).exists())
+        archived = ArchivedChatMessage.objects.get(pk=old.pk)
+        self.assertEqual(archived.room_id, self.room.pk)
+        self.assertEqual(archived.academic_year, archive.academic_year(old.created_at))
+        self.assertEqual(archived.payload['reactions'], [{'emoji': '👍', 'count': 1, 'user_ids': [self.bob.pk]}])
+        self.assertTrue(archive.represent(archived, self.bob)['reactions'][0]['user_reacted'])
+
+        room = ChatRoom.objects.get(pk=self.room.pk)
+        self.assertEqual(room.messages_archived_until, old.created_at)
+        self.assertEqual(room.last_message_id, fresh.pk)
+        self.assertEqual(archive.archive_batch(self.cutoff), 0)
+
+
+class MessageArchiveMigrationTests(MigrationTestCase):
+    app = 'groups'
+    migrate_from = '0016_message_updated_index'
+    migrate_to = '0017_message_archive'
+
+    def test_forward_and_rollback(self):
+        User = self.apps.get_model('accounts', 'User')
+        ChatRoom = self.apps.get_model('groups', 'ChatRoom')
+        ChatMessage = self.apps.get_model('groups', 'ChatMessage')
+        alice = User.objects.create(username='alice')
+        room = ChatRoom.objects.create(name='9А')
+        ChatMessage.objects.create(room=room, sender=alice, text='раз')
+
+        apps = self.forward()
+        self.assertIsNone(apps.get_model('groups', 'ChatRoom').objects.get(pk=room.pk).messages_archived_until)
+        ArchivedChatMessage = apps.get_model('groups', 'ArchivedChatMessage')
+        ArchivedChatMessage.objects.create(
+            id=1000, room_id=room.pk, academic_year=2024, created_at=timezone.now(), payload={'text': 'архив'},
+        )
+
+        apps = self.backward()
+        self.assertEqual(apps.get_model('groups', 'ChatMessage').objects.count(), 1)
+        with self.assertRaises(LookupError):
+            apps.get_model('groups', 'ArchivedChatMessage')
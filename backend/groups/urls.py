@@ -9,6 +9,7 @@ from .views import (
     ChatTaskCreateView, ChatTaskTakeView,
     StudentRestrictionView,
     ChatAllowedEmojiView, ChatMessageReactView, ChatBulkDeleteView,
+    ChatSearchView, ChatSyncView,
 )
 
 urlpatterns = [
@@ -27,6 +28,8 @@ urlpatterns = [
     path('polls/<int:poll_id>/vote/', ChatPollVoteView.as_view()),
     path('messages/<int:msg_id>/react/', ChatMessageReactView.as_view()),
     path('emojis/', ChatAllowedEmojiView.as_view()),
+    path('search/', ChatSearchView.as_view()),
+    path('sync/', ChatSyncView.as_view()),
     path('users/', ChatUsersView.as_view()),
     path('direct/', ChatDirectView.as_view()),
     path('restrictions/<int:student_id>/', StudentRestrictionView.as_view()),
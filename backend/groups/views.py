@@ -1,22 +1,28 @@
 from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from django.contrib.auth import get_user_model
-from django.db.models import Prefetch
+from django.db.models import F, prefetch_related_objects
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from django.core.exceptions import ValidationError
 from accounts.permissions import PasswordChanged
+from core.pagination import InvalidCursor, keyset_page, make_cursor
 from core.validators import validate_file_mime, ALLOWED_IMAGES, ALLOWED_PDF, ALLOWED_EXCEL
-from .models import ChatRoom, ChatMember, ChatMessage, MessageAttachment, ChatPoll, ChatPollOption, ChatPollVote, ChatTaskTake, StudentChatRestriction, ChatAllowedEmoji, ChatReaction
+from .models import ChatRoom, ChatMember, ChatMessage, MessageAttachment, ChatPoll, ChatPollOption, ChatTaskTake, StudentChatRestriction, ChatAllowedEmoji
 
 ALLOWED_CHAT_FILES = ALLOWED_IMAGES + ALLOWED_PDF + ALLOWED_EXCEL
-from .permissions import can_start_direct, get_available_dm_users
+from .permissions import can_access_room, can_start_direct, get_available_dm_users
+from . import archive, fanout, restrictions, services
+from .consumers import group_event
+from .search import search_messages
 from .serializers import (
     ChatRoomSerializer, ChatRoomDetailSerializer,
     ChatMessageSerializer, ChatMemberSerializer, ChatUserSerializer,
-    ChatPollSerializer,
+    serialize_message,
 )
 
 User = get_user_model()
@@ -24,19 +30,13 @@ User = get_user_model()
 
 def broadcast(room_id, event):
     """Отправить событие всем WebSocket-клиентам комнаты."""
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(f'chat_{room_id}', event)
+    async_to_sync(fanout.group_send)(room_id, group_event(event))
 
 
 def _is_room_member(room, user):
     """Проверяет право доступа к комнате.
     Admins могут читать групповые чаты (модерация), но не личные переписки."""
-    if room.members_rel.filter(user=user).exists():
-        return True
-    # Admin может видеть групповые чаты, но не личную переписку (direct)
-    if user.is_admin and room.room_type == ChatRoom.TYPE_GROUP:
-        return True
-    return False
+    return can_access_room(user, room.id)
 
 
 # ─── Rooms ────────────────────────────────────────────────────────────────────
@@ -45,25 +45,17 @@ class ChatRoomListView(APIView):
     permission_classes = [PasswordChanged]
 
     def get(self, request):
-        room_ids = ChatMember.objects.filter(user=request.user).values_list('room_id', flat=True)
-        # Prefetch только активные сообщения (не удалённые), отсортированные по убыванию.
-        # to_attr='active_messages' кладёт результат в атрибут объекта — без лишних DB-запросов.
-        rooms = ChatRoom.objects.filter(id__in=room_ids, is_archived=False).prefetch_related(
-            'members_rel__user',
-            Prefetch(
-                'messages',
-                queryset=ChatMessage.objects.filter(is_deleted=False).order_by('-created_at'),
-                to_attr='active_messages',
-            ),
+        # Последнее сообщение и непрочитанные денормализованы (groups/services.py):
+        # комнаты с my_unread — один запрос по членству, без загрузки истории.
+        # Комнаты без сообщений сортируются по дате создания.
+        rooms = (
+            ChatRoom.objects.filter(members_rel__user=request.user, is_archived=False)
+            .annotate(my_unread=F('members_rel__unread_count'))
+            .select_related('last_message__sender', 'last_message__poll')
+            .prefetch_related('members_rel__user', 'last_message__attachments')
+            .order_by(Coalesce('last_message_at', 'created_at').desc())
         )
-        # Сортируем в Python по first элементу active_messages (новейшее сообщение).
-        # Комнаты без сообщений уходят в конец по дате создания.
-        rooms_list = sorted(
-            rooms,
-            key=lambda r: r.active_messages[0].created_at if r.active_messages else r.created_at,
-            reverse=True,
-        )
-        serializer = ChatRoomSerializer(rooms_list, many=True, context={'request': request})
+        serializer = ChatRoomSerializer(rooms, many=True, context={'request': request})
         return Response(serializer.data)
 
     def post(self, request):
@@ -83,15 +75,9 @@ class ChatRoomListView(APIView):
         ChatMember.objects.create(room=room, user=request.user, role=ChatMember.ROLE_ADMIN)
 
         # Добавить участников из запроса
-        member_ids = request.data.get('member_ids', [])
-        for uid in member_ids:
-            try:
-                u = User.objects.get(pk=uid)
-                if u.id != request.user.id:
-                    ChatMember.objects.get_or_create(room=room, user=u)
-            except User.DoesNotExist:
-                pass
+        services.add_members(room, request.data.get('member_ids', []), exclude_user_id=request.user.id)
 
+        prefetch_related_objects([room], 'members_rel__user')
         serializer = ChatRoomDetailSerializer(room, context={'request': request})
         return Response(serializer.data, status=201)
 
@@ -193,13 +179,8 @@ class ChatMembersView(APIView):
             return err
         if room.room_type == ChatRoom.TYPE_DIRECT:
             return Response({'detail': 'Нельзя добавлять участников в личный чат.'}, status=400)
-        user_ids = request.data.get('user_ids', [])
-        for uid in user_ids:
-            try:
-                user = User.objects.get(pk=uid)
-                ChatMember.objects.get_or_create(room=room, user=user)
-            except User.DoesNotExist:
-                pass
+        services.add_members(room, request.data.get('user_ids', []))
+        prefetch_related_objects([room], 'members_rel__user')
         return Response(ChatRoomDetailSerializer(room, context={'request': request}).data)
 
     def delete(self, request, pk, user_pk=None):
@@ -237,20 +218,17 @@ class ChatMessagesView(APIView):
         if err:
             return err
 
-        qs = room.messages.select_related('sender', 'reply_to__sender').prefetch_related('attachments', 'reactions')
-        before_id = request.query_params.get('before')
-        if before_id:
-            qs = qs.filter(id__lt=before_id)
-
-        limit = min(int(request.query_params.get('limit', 50)), 100)
-        messages = list(qs.order_by('-created_at')[:limit])
-        messages.reverse()
-
-        serializer = ChatMessageSerializer(messages, many=True, context={'request': request})
-        return Response({
-            'results': serializer.data,
-            'has_more': qs.filter(id__lt=messages[0].id).exists() if messages else False,
-        })
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 50)), 100))
+            page = archive.history_page(
+                room, request,
+                before=request.query_params.get('before'),
+                after=request.query_params.get('after'),
+                limit=limit,
+            )
+        except (ValueError, InvalidCursor):
+            return Response({'detail': 'Некорректные параметры страницы.'}, status=400)
+        return Response(page)
 
     def delete(self, request, pk, msg_id):
         room, err = self._get_room(pk, request.user)
@@ -264,11 +242,8 @@ class ChatMessagesView(APIView):
         if not request.user.is_admin and msg.sender_id != request.user.id:
             return Response({'detail': 'Нет прав.'}, status=403)
 
-        msg.is_deleted = True
-        msg.text = ''
-        msg.save(update_fields=['is_deleted', 'text'])
-
-        broadcast(pk, {'type': 'chat_message_deleted', 'message_id': msg_id})
+        if services.delete_message(msg):
+            broadcast(pk, {'type': 'chat_message_deleted', 'message_id': msg_id})
         return Response(status=204)
 
 
@@ -292,22 +267,18 @@ class ChatFileUploadView(APIView):
 
         # Проверка ограничений для учеников
         if request.user.is_student:
-            try:
-                r = StudentChatRestriction.objects.get(student=request.user)
-                from django.utils import timezone
-                if r.muted_until and r.muted_until > timezone.now():
-                    return Response({'detail': 'Вы временно лишены возможности писать.'}, status=403)
-                if r.no_files:
-                    return Response({'detail': 'Вам запрещено отправлять файлы.'}, status=403)
-            except StudentChatRestriction.DoesNotExist:
-                pass
+            r = restrictions.get_restriction(request.user.id)
+            if r and r.muted_until and r.muted_until > timezone.now():
+                return Response({'detail': 'Вы временно лишены возможности писать.'}, status=403)
+            if r and r.no_files:
+                return Response({'detail': 'Вам запрещено отправлять файлы.'}, status=403)
 
         try:
             validate_file_mime(uploaded, ALLOWED_CHAT_FILES, label='файл чата')
         except ValidationError as e:
             return Response({'detail': str(e)}, status=400)
 
-        msg = ChatMessage.objects.create(room=room, sender=request.user, text='')
+        msg = services.create_message(room, request.user)
         MessageAttachment.objects.create(
             message=msg,
             file=uploaded,
@@ -316,7 +287,7 @@ class ChatFileUploadView(APIView):
             mime_type=uploaded.content_type or '',
         )
         msg.refresh_from_db()
-        serialized = ChatMessageSerializer(msg, context={'request': request}).data
+        serialized = serialize_message(msg, request)
         broadcast(pk, {'type': 'chat_message_new', 'message': serialized})
         return Response(serialized, status=201)
 
@@ -327,15 +298,100 @@ class ChatReadView(APIView):
     permission_classes = [PasswordChanged]
 
     def post(self, request, pk):
-        from django.utils import timezone
-        updated = ChatMember.objects.filter(
-            room_id=pk, user=request.user,
-        ).update(last_read_at=timezone.now())
+        updated = services.mark_read(pk, request.user)
         if not updated:
             return Response({'detail': 'Вы не участник этого чата.'}, status=403)
         return Response({'ok': True})
 
 
+# ─── Search ───────────────────────────────────────────────────────────────────
+
+class ChatSearchView(APIView):
+    """Полнотекстовый поиск по сообщениям всех чатов пользователя (?q=&limit=&offset=)."""
+    permission_classes = [PasswordChanged]
+
+    def get(self, request):
+        q = request.query_params.get('q', '').strip()
+        if len(q) < 2:
+            return Response({'detail': 'Запрос должен содержать хотя бы 2 символа.'}, status=400)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 50))
+            offset = max(0, int(request.query_params.get('offset', 0)))
+        except ValueError:
+            return Response({'detail': 'Некорректные параметры страницы.'}, status=400)
+
+        messages, has_more = search_messages(request.user, q[:200], limit=limit, offset=offset)
+        serializer = ChatMessageSerializer(messages, many=True, context={'request': request})
+        return Response({'results': serializer.data, 'has_more': has_more})
+
+
+# ─── Sync ─────────────────────────────────────────────────────────────────────
+
+class ChatSyncView(APIView):
+    """
+    Догоняющая синхронизация после сна/обрыва связи: новые и изменённые сообщения
+    (удаления, реакции, опросы, взятые задачи) во всех чатах пользователя одним
+    запросом, по возрастанию updated_at.
+
+    Начало — ?since=<ISO-время> или ?after_id=<последнее виденное сообщение>
+    (строго после его (created_at, id): сам якорь повторно не приходит, пока не изменился);
+    продолжение — ?cursor=<next_cursor>. Пока has_more, клиент запрашивает
+    следующую страницу; последний next_cursor — точка для следующей синхронизации.
+    """
+    permission_classes = [PasswordChanged]
+
+    def get(self, request):
+        params = request.query_params
+        cursor = params.get('cursor')
+        try:
+            limit = max(1, min(int(params.get('limit', 200)), 500))
+            if not cursor:
+                cursor = self._start_cursor(request)
+                if cursor is None:
+                    return Response({'detail': 'Требуется since, after_id или cursor.'}, status=400)
+            my_rooms = ChatMember.objects.filter(user=request.user).values('room_id')
+            page = keyset_page(
+                ChatMessage.objects.filter(room_id__in=my_rooms).select_related('sender', 'reply_to__sender'),
+                after=cursor, limit=limit, field='updated_at',
+            )
+        except (ValueError, InvalidCursor):
+            return Response({'detail': 'Некорректные параметры синхронизации.'}, status=400)
+
+        rooms = ChatMember.objects.filter(user=request.user).values_list(
+            'room_id', 'unread_count', 'room__last_message_at',
+        )
+        return Response({
+            'messages': ChatMessageSerializer(page['items'], many=True, context={'request': request}).data,
+            'rooms': [
+                {'id': room_id, 'unread_count': unread, 'last_message_at': last_at}
+                for room_id, unread, last_at in rooms
+            ],
+            'has_more': page['has_more'],
+            'next_cursor': page['next_cursor'],
+        })
+
+    def _start_cursor(self, request):
+        """Курсор начала синхронизации или None; ValueError — некорректное значение."""
+        since = request.query_params.get('since')
+        if since:
+            ts = parse_datetime(since)
+            if ts is None:
+                raise ValueError(since)
+            return make_cursor(ts if timezone.is_aware(ts) else timezone.make_aware(ts))
+        after_id = request.query_params.get('after_id')
+        if after_id:
+            created_at = (
+                ChatMessage.objects.filter(pk=int(after_id), room__members_rel__user=request.user)
+                .values_list('created_at', flat=True).first()
+            )
+            if created_at is None:
+                raise ValueError(after_id)
+            # Строго после (created_at, id) якоря: сам якорь и сообщения с тем же
+            # временем и меньшим id клиент уже видел, пока они не изменились
+            return make_cursor(created_at, int(after_id))
+        return None
+
+
 # ─── Available DM users ───────────────────────────────────────────────────────
 
 class ChatUsersView(APIView):
@@ -370,23 +426,11 @@ class ChatDirectView(APIView):
         if not can_start_direct(request.user, other):
             return Response({'detail': 'Вам нельзя писать этому пользователю.'}, status=403)
 
-        # Найти существующий DM
-        my_rooms = ChatMember.objects.filter(user=request.user).values_list('room_id', flat=True)
-        other_rooms = ChatMember.objects.filter(user=other).values_list('room_id', flat=True)
-        common = ChatRoom.objects.filter(
-            id__in=set(my_rooms) & set(other_rooms),
-            room_type=ChatRoom.TYPE_DIRECT,
-        ).first()
-
-        if common:
-            return Response(ChatRoomSerializer(common, context={'request': request}).data)
-
-        # Создать новый DM
-        room = ChatRoom.objects.create(room_type=ChatRoom.TYPE_DIRECT, created_by=request.user)
-        ChatMember.objects.create(room=room, user=request.user)
-        ChatMember.objects.create(room=room, user=other)
-
-        return Response(ChatRoomSerializer(room, context={'request': request}).data, status=201)
+        room, created = services.get_or_create_direct(request.user, other)
+        return Response(
+            ChatRoomSerializer(room, context={'request': request}).data,
+            status=201 if created else 200,
+        )
 
 
 # ─── Poll ──────────────────────────────────────────────────────────────────────
@@ -404,15 +448,11 @@ class ChatPollCreateView(APIView):
 
         # Проверка ограничений для учеников
         if request.user.is_student:
-            try:
-                r = StudentChatRestriction.objects.get(student=request.user)
-                from django.utils import timezone
-                if r.muted_until and r.muted_until > timezone.now():
-                    return Response({'detail': 'Вы временно лишены возможности писать.'}, status=403)
-                if r.no_polls:
-                    return Response({'detail': 'Вам запрещено создавать опросы.'}, status=403)
-            except StudentChatRestriction.DoesNotExist:
-                pass
+            r = restrictions.get_restriction(request.user.id)
+            if r and r.muted_until and r.muted_until > timezone.now():
+                return Response({'detail': 'Вы временно лишены возможности писать.'}, status=403)
+            if r and r.no_polls:
+                return Response({'detail': 'Вам запрещено создавать опросы.'}, status=403)
 
         question = request.data.get('question', '').strip()
         options_data = request.data.get('options', [])
@@ -423,7 +463,7 @@ class ChatPollCreateView(APIView):
         if len(options_data) < 2:
             return Response({'detail': 'Нужно минимум 2 варианта.'}, status=400)
 
-        msg = ChatMessage.objects.create(room=room, sender=request.user, text='')
+        msg = services.create_message(room, request.user)
         poll = ChatPoll.objects.create(message=msg, question=question, is_multiple=is_multiple)
         for i, text in enumerate(options_data[:10]):
             text = str(text).strip()
@@ -431,7 +471,7 @@ class ChatPollCreateView(APIView):
                 ChatPollOption.objects.create(poll=poll, text=text, order=i)
 
         msg.refresh_from_db()
-        serialized = ChatMessageSerializer(msg, context={'request': request}).data
+        serialized = serialize_message(msg, request)
         broadcast(room_id, {'type': 'chat_message_new', 'message': serialized})
         return Response(serialized, status=201)
 
@@ -458,21 +498,16 @@ class ChatPollVoteView(APIView):
         except ChatPollOption.DoesNotExist:
             return Response({'detail': 'Вариант не найден.'}, status=404)
 
-        if not poll.is_multiple:
-            # Удалить старые голоса в этом опросе
-            ChatPollVote.objects.filter(option__poll=poll, user=request.user).delete()
-
-        ChatPollVote.objects.get_or_create(option=option, user=request.user)
-
-        # Broadcast обновление опроса
-        poll_data = ChatPollSerializer(poll, context={'request': request}).data
-        broadcast(room.id, {
-            'type': 'chat_poll_updated',
+        # Рассылается только изменение: затронутые варианты с новыми счётчиками
+        # и проголосовавший (клиент добавляет/убирает его из voters)
+        change = services.vote(poll, option, request.user)
+        event = {
             'poll_id': poll.id,
-            'options': poll_data['options'],
-            'total_votes': poll_data['total_votes'],
-        })
-        return Response(poll_data)
+            'voter': {'id': request.user.id, 'name': f'{request.user.last_name} {request.user.first_name}'.strip()},
+            **change,
+        }
+        broadcast(room.id, {'type': 'chat_poll_updated', **event})
+        return Response(event)
 
 
 # ─── Chat Tasks ────────────────────────────────────────────────────────────────
@@ -506,9 +541,9 @@ class ChatTaskCreateView(APIView):
             created_by=request.user,
             status='new',
         )
-        msg = ChatMessage.objects.create(room=room, sender=request.user, text='', task=task)
+        msg = services.create_message(room, request.user, task=task)
         msg.refresh_from_db()
-        serialized = ChatMessageSerializer(msg, context={'request': request}).data
+        serialized = serialize_message(msg, request)
         broadcast(room_id, {'type': 'chat_message_new', 'message': serialized})
         return Response(serialized, status=201)
 
@@ -638,6 +673,7 @@ class ChatTaskTakeView(APIView):
                 status='in_progress',
             )
         ChatTaskTake.objects.create(message=msg, user=request.user, task=user_task)
+        services.touch_message(msg.id)
 
         # Актуальный список взявших
         takers = [
@@ -694,28 +730,14 @@ class ChatMessageReactView(APIView):
         if not emoji:
             return Response({'detail': 'Требуется emoji.'}, status=400)
 
-        # One reaction per user per message: remove existing, then add new unless toggling same
-        already_same = ChatReaction.objects.filter(message=msg, user=request.user, emoji=emoji).exists()
-        ChatReaction.objects.filter(message=msg, user=request.user).delete()
-        if not already_same:
-            ChatReaction.objects.create(message=msg, user=request.user, emoji=emoji)
-
-        # Aggregate reactions
-        from collections import Counter
-        all_reactions = list(ChatReaction.objects.filter(message=msg))
-        counts = Counter(r.emoji for r in all_reactions)
-        my_emojis = set(r.emoji for r in all_reactions if r.user_id == request.user.id)
-        reactions = [
-            {'emoji': e, 'count': c, 'user_reacted': e in my_emojis}
-            for e, c in sorted(counts.items())
-        ]
-
-        broadcast(msg.room_id, {
-            'type': 'chat_reaction_updated',
+        # Рассылается только изменение: затронутые emoji с новыми счётчиками
+        event = {
             'message_id': msg_id,
-            'reactions': reactions,
-        })
-        return Response(reactions)
+            'user_id': request.user.id,
+            'changes': services.toggle_reaction(msg, request.user, emoji),
+        }
+        broadcast(msg.room_id, {'type': 'chat_reaction_updated', **event})
+        return Response(event)
 
 
 # ─── Bulk delete ──────────────────────────────────────────────────────────────
@@ -744,10 +766,8 @@ class ChatBulkDeleteView(APIView):
                 continue
             if not request.user.is_admin and msg.sender_id != request.user.id:
                 continue
-            msg.is_deleted = True
-            msg.text = ''
-            msg.save(update_fields=['is_deleted', 'text'])
-            broadcast(pk, {'type': 'chat_message_deleted', 'message_id': msg_id})
-            deleted += 1
+            if services.delete_message(msg):
+                broadcast(pk, {'type': 'chat_message_deleted', 'message_id': msg_id})
+                deleted += 1
 
         return Response({'deleted': deleted})
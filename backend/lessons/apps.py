@@ -5,3 +5,6 @@ class LessonsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lessons'
     verbose_name = 'Уроки'
+
+    def ready(self):
+        from . import signals  # noqa: F401
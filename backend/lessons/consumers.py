@@ -1,14 +1,20 @@
+import asyncio
 import json
 import logging
+import time
 import uuid
 from urllib.parse import parse_qs
 
-from asgiref.sync import sync_to_async
+from asgiref.sync import async_to_sync, sync_to_async
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.db import models
+from channels.layers import get_channel_layer
+from django.db import IntegrityError, models, transaction
 
-from .models import Slide, LessonSession, FormAnswer
+from core import authz, frames
+
+from . import discussion, quiz
+from .models import Slide, LessonSession, FormAnswer, QuizAnswer, DiscussionSticker, DiscussionArrow
 from .utils import compute_form_results
 
 logger = logging.getLogger(__name__)
@@ -26,13 +32,86 @@ def _parse_qs_int(scope, key):
     return None
 
 
+def _as_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _as_float(value, default):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+# ── Перетаскивание стикеров ───────────────────────────────────────────────────
+# Фронтенд шлёт update_sticker с x/y на каждый кадр drag. Позиция копится в
+# памяти соединения: в группу уходит не чаще DRAG_BROADCAST_HZ, в БД — одна
+# запись после того, как стикер DRAG_SETTLE_SEC не двигали (или при disconnect).
+DRAG_BROADCAST_HZ = 15
+DRAG_SETTLE_SEC = 0.5
+
+# Счётчики процесса — stats(), в /api/admin/cache-stats/. Меняются только в event loop Daphne.
+drag_stats = {'updates': 0, 'broadcasts': 0, 'db_writes': 0}
+
+# (board_key, sticker_id) → _PendingDrag любого соединения: пока перетаскивание не
+# записано в БД, ответ на обычный update_sticker берёт позицию отсюда.
+_active_drags = {}
+
+
+def stats():
+    """Коалесценция перетаскивания: absorbed — сколько записей в БД сэкономлено."""
+    snapshot = dict(drag_stats)
+    snapshot['absorbed'] = snapshot['updates'] - snapshot['db_writes']
+    return snapshot
+
+
+class _PendingDrag:
+    __slots__ = ('sticker', 'updates', 'last_broadcast', 'broadcast_dirty', 'trailing', 'settle')
+
+    def __init__(self, sticker):
+        self.sticker = sticker          # сериализованный стикер с актуальными x/y
+        self.updates = 0
+        self.last_broadcast = 0.0
+        self.broadcast_dirty = False    # есть позиция, ещё не разосланная группе
+        self.trailing = None            # отложенная рассылка последней позиции
+        self.settle = None              # отложенная запись в БД
+
+
+def serialize_sticker(sticker):
+    return {
+        'id': str(sticker.id),
+        'x': sticker.x,
+        'y': sticker.y,
+        'text': sticker.text,
+        'color': sticker.color,
+        'author_id': sticker.author_id,
+        'author_name': sticker.author_name,
+        'created_at': sticker.created_at.isoformat() if sticker.created_at else '',
+    }
+
+
+def serialize_arrow(arrow):
+    return {
+        'id': str(arrow.id),
+        'from_id': str(arrow.from_sticker_id),
+        'to_id': str(arrow.to_sticker_id),
+        'author_id': arrow.author_id,
+        'author_name': arrow.author_name,
+    }
+
+
 class DiscussionConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.slide_id = self.scope['url_route']['kwargs']['slide_id']
         self.user = self.scope['user']
+        self.drags = {}     # sticker_id → _PendingDrag
         # session_id из query string — если передан, хранить данные в LessonSession
         self.lesson_session_id = _parse_qs_int(self.scope, 'session_id')
 
+        self.board_key = (self.slide_id, self.lesson_session_id)
         if self.lesson_session_id:
             self.room_group_name = f'discussion_{self.slide_id}_{self.lesson_session_id}'
         else:
@@ -60,15 +139,30 @@ class DiscussionConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
+        # Переподключение с ?since=<version>: только пропущенные события,
+        # если журнал доски их ещё покрывает.
+        since = _parse_qs_int(self.scope, 'since')
+        if since is not None:
+            version, events = discussion.events_since(self.board_key, since)
+            if events is not None:
+                await self.send(text_data=json.dumps({'type': 'sync', 'version': version, 'events': events}))
+                return
+
+        # Версию берём до чтения снимка: событие, попавшее между ними, клиент
+        # получит повторно, но не потеряет.
+        version = discussion.current_version(self.board_key)
         init_data = await self.load_init_data()
         await self.send(text_data=json.dumps({
             'type': 'init',
+            'version': version,
             'stickers': init_data.get('stickers', []),
             'arrows': init_data.get('arrows', []),
             'topic': init_data.get('topic', ''),
         }))
 
     async def disconnect(self, close_code):
+        for sticker_id in list(getattr(self, 'drags', {})):
+            await self.settle_drag(sticker_id)
         if hasattr(self, 'room_group_name'):
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
@@ -80,137 +174,184 @@ class DiscussionConsumer(AsyncWebsocketConsumer):
 
         msg_type = data.get('type')
 
-        if msg_type == 'add_sticker':
-            sticker = {
-                'id': str(uuid.uuid4()),
-                'x': data.get('x', 100),
-                'y': data.get('y', 100),
-                'text': data.get('text', ''),
-                'color': data.get('color', '#fef08a'),
-                'author_id': self.user.id,
-                'author_name': f'{self.user.first_name} {self.user.last_name}'.strip(),
-                'created_at': data.get('created_at', ''),
-            }
-            await self.save_sticker(sticker)
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {'type': 'sticker_added', 'sticker': sticker},
+        if msg_type == 'update_sticker' and 'text' not in data and ('x' in data or 'y' in data):
+            await self.drag_sticker(data.get('id'), data)
+
+        elif msg_type == 'add_sticker':
+            sticker = await self.save_sticker(
+                x=_as_float(data.get('x'), 100),
+                y=_as_float(data.get('y'), 100),
+                text=str(data.get('text', '')),
+                color=str(data.get('color', '#fef08a'))[:20],
             )
+            await self.broadcast({'type': 'sticker_added', 'sticker': sticker})
 
         elif msg_type == 'update_sticker':
             sticker_id = data.get('id')
-            updates = {k: data[k] for k in ('x', 'y', 'text') if k in data}
+            updates = {}
+            for k in ('x', 'y'):
+                if k in data:
+                    updates[k] = _as_float(data[k], 0)
+            if 'text' in data:
+                updates['text'] = str(data['text'])
+            await self.settle_drag(sticker_id)
             updated = await self.do_update_sticker(sticker_id, updates)
+            pending = _active_drags.get((self.board_key, sticker_id))
+            if updated and pending is not None:
+                # Стикер сейчас тянут из другого соединения: в БД позиция ещё старая
+                for k in ('x', 'y'):
+                    if k not in updates:
+                        updated[k] = pending.sticker[k]
             if updated:
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {'type': 'sticker_updated', 'sticker': updated},
-                )
+                await self.broadcast({'type': 'sticker_updated', 'sticker': updated})
 
         elif msg_type == 'delete_sticker':
             sticker_id = data.get('id')
             allowed = await self.can_delete_sticker(sticker_id)
             if allowed:
+                self.drop_drag(sticker_id)
                 await self.do_remove_sticker(sticker_id)
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {'type': 'sticker_deleted', 'id': sticker_id},
-                )
+                await self.broadcast({'type': 'sticker_deleted', 'id': sticker_id})
 
         elif msg_type == 'add_arrow':
             from_id = data.get('from_id')
             to_id = data.get('to_id')
             if from_id and to_id:
-                arrow = {
-                    'id': str(uuid.uuid4()),
-                    'from_id': from_id,
-                    'to_id': to_id,
-                    'author_id': self.user.id,
-                    'author_name': f'{self.user.first_name} {self.user.last_name}'.strip(),
-                }
-                await self.save_arrow(arrow)
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {'type': 'arrow_added', 'arrow': arrow},
-                )
+                arrow = await self.save_arrow(from_id, to_id)
+                if arrow:
+                    await self.broadcast({'type': 'arrow_added', 'arrow': arrow})
 
         elif msg_type == 'delete_arrow':
             arrow_id = data.get('id')
             allowed = await self.can_delete_arrow(arrow_id)
             if allowed:
                 await self.do_remove_arrow(arrow_id)
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {'type': 'arrow_deleted', 'id': arrow_id},
-                )
+                await self.broadcast({'type': 'arrow_deleted', 'id': arrow_id})
 
         elif msg_type == 'update_topic':
             if self.user.is_teacher or self.user.is_admin:
                 topic = str(data.get('topic', ''))[:200]
                 await self.do_update_topic(topic)
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {'type': 'topic_updated', 'topic': topic},
-                )
+                await self.broadcast({'type': 'topic_updated', 'topic': topic})
+
+    async def broadcast(self, event):
+        """Разослать событие доски группе, записав его в журнал с очередной версией."""
+        discussion.append(self.board_key, event)
+        await self.channel_layer.group_send(self.room_group_name, event)
 
     # ── Group message handlers ──────────────────────────────────────────────────
 
     async def sticker_added(self, event):
-        await self.send(text_data=json.dumps({'type': 'sticker_added', 'sticker': event['sticker']}))
+        await self.send(text_data=json.dumps({'type': 'sticker_added', 'sticker': event['sticker'], 'version': event['version']}))
 
     async def sticker_updated(self, event):
-        await self.send(text_data=json.dumps({'type': 'sticker_updated', 'sticker': event['sticker']}))
+        await self.send(text_data=json.dumps({'type': 'sticker_updated', 'sticker': event['sticker'], 'version': event['version']}))
 
     async def sticker_deleted(self, event):
-        await self.send(text_data=json.dumps({'type': 'sticker_deleted', 'id': event['id']}))
+        await self.send(text_data=json.dumps({'type': 'sticker_deleted', 'id': event['id'], 'version': event['version']}))
 
     async def arrow_added(self, event):
-        await self.send(text_data=json.dumps({'type': 'arrow_added', 'arrow': event['arrow']}))
+        await self.send(text_data=json.dumps({'type': 'arrow_added', 'arrow': event['arrow'], 'version': event['version']}))
 
     async def arrow_deleted(self, event):
-        await self.send(text_data=json.dumps({'type': 'arrow_deleted', 'id': event['id']}))
+        await self.send(text_data=json.dumps({'type': 'arrow_deleted', 'id': event['id'], 'version': event['version']}))
 
     async def topic_updated(self, event):
-        await self.send(text_data=json.dumps({'type': 'topic_updated', 'topic': event['topic']}))
-
-    # ── Хелперы: загрузка/сохранение с учётом режима (сессия vs редактор) ──────
-
-    @sync_to_async
-    def load_init_data(self):
-        if self.lesson_session_id:
-            try:
-                session = LessonSession.objects.get(id=self.lesson_session_id)
-                return session.discussion_data.get(str(self.slide_id), {})
-            except LessonSession.DoesNotExist:
-                return {}
+        await self.send(text_data=json.dumps({'type': 'topic_updated', 'topic': event['topic'], 'version': event['version']}))
+
+    # ── Перетаскивание: коалесценция позиций ────────────────────────────────────
+
+    async def drag_sticker(self, sticker_id, data):
+        drag = self.drags.get(sticker_id)
+        if drag is None:
+            sticker = await self.get_sticker(sticker_id)
+            if sticker is None:
+                return
+            drag = self.drags.setdefault(sticker_id, _PendingDrag(sticker))
+            _active_drags[(self.board_key, sticker_id)] = drag
+        for k in ('x', 'y'):
+            if k in data:
+                drag.sticker[k] = _as_float(data[k], drag.sticker[k])
+        drag.updates += 1
+        drag_stats['updates'] += 1
+
+        if drag.settle is not None:
+            drag.settle.cancel()
+        drag.settle = asyncio.ensure_future(self._settle_later(sticker_id))
+
+        delay = drag.last_broadcast + 1 / DRAG_BROADCAST_HZ - time.monotonic()
+        if delay <= 0:
+            await self._broadcast_drag(drag)
         else:
-            try:
-                slide = Slide.objects.get(id=self.slide_id)
-                return slide.content or {}
-            except Slide.DoesNotExist:
-                return {}
+            drag.broadcast_dirty = True
+            if drag.trailing is None:
+                drag.trailing = asyncio.ensure_future(self._trailing_broadcast(drag, delay))
+
+    async def _broadcast_drag(self, drag):
+        drag.last_broadcast = time.monotonic()
+        drag.broadcast_dirty = False
+        drag_stats['broadcasts'] += 1
+        await self.broadcast({'type': 'sticker_updated', 'sticker': dict(drag.sticker)})
+
+    async def _trailing_broadcast(self, drag, delay):
+        await asyncio.sleep(delay)
+        drag.trailing = None
+        if drag.broadcast_dirty:
+            await self._broadcast_drag(drag)
+
+    async def _settle_later(self, sticker_id):
+        await asyncio.sleep(DRAG_SETTLE_SEC)
+        await self.settle_drag(sticker_id)
+
+    def drop_drag(self, sticker_id):
+        """Забыть незаписанное перетаскивание (стикер удалён)."""
+        drag = self.drags.pop(sticker_id, None)
+        if drag is not None:
+            if _active_drags.get((self.board_key, sticker_id)) is drag:
+                del _active_drags[(self.board_key, sticker_id)]
+            for task in (drag.trailing, drag.settle):
+                if task is not None and task is not asyncio.current_task():
+                    task.cancel()
+        return drag
+
+    async def settle_drag(self, sticker_id):
+        """Записать итоговую позицию в БД и разослать её, если она ещё не ушла."""
+        drag = self.drop_drag(sticker_id)
+        if drag is None:
+            return
+        if drag.broadcast_dirty:
+            await self._broadcast_drag(drag)
+        await self.save_sticker_position(sticker_id, drag.sticker['x'], drag.sticker['y'])
+        drag_stats['db_writes'] += 1
+        logger.debug(
+            '[Discussion] sticker %s settled: %d updates → 1 write (absorbed total: %d)',
+            sticker_id, drag.updates, drag_stats['updates'] - drag_stats['db_writes'],
+        )
 
-    def _get_board_data(self, obj):
-        if self.lesson_session_id:
-            return obj.discussion_data.get(str(self.slide_id), {})
-        else:
-            return obj.content or {}
+    # ── Хелперы: доска — пара (slide, session), session=None в редакторе ───────
 
-    def _save_board_data(self, obj, board_data):
-        if self.lesson_session_id:
-            data = dict(obj.discussion_data or {})
-            data[str(self.slide_id)] = board_data
-            obj.discussion_data = data
-            obj.save(update_fields=['discussion_data'])
-        else:
-            obj.content = board_data
-            obj.save(update_fields=['content'])
+    def _board(self):
+        return {'slide_id': self.slide_id, 'session_id': self.lesson_session_id}
 
-    def _get_model(self):
+    @sync_to_async
+    def load_init_data(self):
+        stickers = DiscussionSticker.objects.filter(**self._board())
+        arrows = DiscussionArrow.objects.filter(**self._board())
+        return {
+            'stickers': [serialize_sticker(s) for s in stickers],
+            'arrows': [serialize_arrow(a) for a in arrows],
+            'topic': self._load_topic(),
+        }
+
+    def _load_topic(self):
+        # Тема остаётся в JSON: меняется редко и только учителем
         if self.lesson_session_id:
-            return LessonSession.objects.get(id=self.lesson_session_id)
-        else:
-            return Slide.objects.get(id=self.slide_id)
+            data = LessonSession.objects.filter(id=self.lesson_session_id).values_list(
+                'discussion_data', flat=True,
+            ).first() or {}
+            return data.get(str(self.slide_id), {}).get('topic', '')
+        content = Slide.objects.filter(id=self.slide_id).values_list('content', flat=True).first() or {}
+        return content.get('topic', '')
 
     # ── DB helpers ──────────────────────────────────────────────────────────────
 
@@ -222,102 +363,104 @@ class DiscussionConsumer(AsyncWebsocketConsumer):
             return None
 
     @sync_to_async
-    def save_sticker(self, sticker):
-        try:
-            obj = self._get_model()
-            board = dict(self._get_board_data(obj))
-            board['stickers'] = list(board.get('stickers', [])) + [sticker]
-            self._save_board_data(obj, board)
-        except (Slide.DoesNotExist, LessonSession.DoesNotExist):
-            pass
+    def save_sticker(self, **fields):
+        sticker = DiscussionSticker.objects.create(
+            **self._board(),
+            **fields,
+            author=self.user,
+            author_name=f'{self.user.first_name} {self.user.last_name}'.strip(),
+        )
+        return serialize_sticker(sticker)
+
+    @sync_to_async
+    def get_sticker(self, sticker_id):
+        sticker_id = _as_uuid(sticker_id)
+        if sticker_id is None:
+            return None
+        sticker = DiscussionSticker.objects.filter(id=sticker_id, **self._board()).first()
+        return serialize_sticker(sticker) if sticker else None
+
+    @sync_to_async
+    def save_sticker_position(self, sticker_id, x, y):
+        DiscussionSticker.objects.filter(id=_as_uuid(sticker_id), **self._board()).update(x=x, y=y)
 
     @sync_to_async
     def do_update_sticker(self, sticker_id, updates):
-        try:
-            obj = self._get_model()
-            board = dict(self._get_board_data(obj))
-            stickers = list(board.get('stickers', []))
-            for s in stickers:
-                if s.get('id') == sticker_id:
-                    s.update(updates)
-                    board['stickers'] = stickers
-                    self._save_board_data(obj, board)
-                    return s
-        except (Slide.DoesNotExist, LessonSession.DoesNotExist):
-            pass
-        return None
+        sticker_id = _as_uuid(sticker_id)
+        if sticker_id is None or not updates:
+            return None
+        sticker = DiscussionSticker.objects.filter(id=sticker_id, **self._board()).first()
+        if sticker is None:
+            return None
+        for k, v in updates.items():
+            setattr(sticker, k, v)
+        sticker.save(update_fields=list(updates))
+        return serialize_sticker(sticker)
 
     @sync_to_async
     def can_delete_sticker(self, sticker_id):
+        sticker_id = _as_uuid(sticker_id)
+        if sticker_id is None:
+            return False
+        row = DiscussionSticker.objects.filter(id=sticker_id, **self._board()).values_list('author_id', flat=True)
         if self.user.is_admin or self.user.is_teacher:
-            return True
-        try:
-            obj = self._get_model()
-            board = self._get_board_data(obj)
-            for s in board.get('stickers', []):
-                if s.get('id') == sticker_id:
-                    return s.get('author_id') == self.user.id
-        except (Slide.DoesNotExist, LessonSession.DoesNotExist):
-            pass
-        return False
+            return row.exists()
+        return list(row) == [self.user.id]
 
     @sync_to_async
     def do_remove_sticker(self, sticker_id):
-        try:
-            obj = self._get_model()
-            board = dict(self._get_board_data(obj))
-            board['stickers'] = [s for s in board.get('stickers', []) if s.get('id') != sticker_id]
-            board['arrows'] = [
-                a for a in board.get('arrows', [])
-                if a.get('from_id') != sticker_id and a.get('to_id') != sticker_id
-            ]
-            self._save_board_data(obj, board)
-        except (Slide.DoesNotExist, LessonSession.DoesNotExist):
-            pass
+        # Стрелки от/к стикеру удаляются каскадом
+        DiscussionSticker.objects.filter(id=_as_uuid(sticker_id), **self._board()).delete()
 
     @sync_to_async
-    def save_arrow(self, arrow):
-        try:
-            obj = self._get_model()
-            board = dict(self._get_board_data(obj))
-            board['arrows'] = list(board.get('arrows', [])) + [arrow]
-            self._save_board_data(obj, board)
-        except (Slide.DoesNotExist, LessonSession.DoesNotExist):
-            pass
+    def save_arrow(self, from_id, to_id):
+        from_id, to_id = _as_uuid(from_id), _as_uuid(to_id)
+        if from_id is None or to_id is None or from_id == to_id:
+            return None
+        if DiscussionSticker.objects.filter(id__in=[from_id, to_id], **self._board()).count() != 2:
+            return None
+        arrow = DiscussionArrow.objects.create(
+            **self._board(),
+            from_sticker_id=from_id,
+            to_sticker_id=to_id,
+            author=self.user,
+            author_name=f'{self.user.first_name} {self.user.last_name}'.strip(),
+        )
+        return serialize_arrow(arrow)
 
     @sync_to_async
     def can_delete_arrow(self, arrow_id):
+        arrow_id = _as_uuid(arrow_id)
+        if arrow_id is None:
+            return False
+        row = DiscussionArrow.objects.filter(id=arrow_id, **self._board()).values_list('author_id', flat=True)
         if self.user.is_admin or self.user.is_teacher:
-            return True
-        try:
-            obj = self._get_model()
-            board = self._get_board_data(obj)
-            for a in board.get('arrows', []):
-                if a.get('id') == arrow_id:
-                    return a.get('author_id') == self.user.id
-        except (Slide.DoesNotExist, LessonSession.DoesNotExist):
-            pass
-        return False
+            return row.exists()
+        return list(row) == [self.user.id]
 
     @sync_to_async
     def do_remove_arrow(self, arrow_id):
-        try:
-            obj = self._get_model()
-            board = dict(self._get_board_data(obj))
-            board['arrows'] = [a for a in board.get('arrows', []) if a.get('id') != arrow_id]
-            self._save_board_data(obj, board)
-        except (Slide.DoesNotExist, LessonSession.DoesNotExist):
-            pass
+        DiscussionArrow.objects.filter(id=_as_uuid(arrow_id), **self._board()).delete()
 
     @sync_to_async
     def do_update_topic(self, topic):
-        try:
-            obj = self._get_model()
-            board = dict(self._get_board_data(obj))
-            board['topic'] = topic
-            self._save_board_data(obj, board)
-        except (Slide.DoesNotExist, LessonSession.DoesNotExist):
-            pass
+        with transaction.atomic():
+            if self.lesson_session_id:
+                session = LessonSession.objects.select_for_update().filter(id=self.lesson_session_id).first()
+                if session is None:
+                    return
+                data = dict(session.discussion_data or {})
+                board = dict(data.get(str(self.slide_id), {}))
+                board['topic'] = topic
+                data[str(self.slide_id)] = board
+                session.discussion_data = data
+                session.save(update_fields=['discussion_data'])
+            else:
+                slide = Slide.objects.select_for_update().filter(id=self.slide_id).first()
+                if slide is None:
+                    return
+                slide.content = {**(slide.content or {}), 'topic': topic}
+                slide.save(update_fields=['content'])
 
     @database_sync_to_async
     def _can_access_slide(self, user, slide):
@@ -325,27 +468,108 @@ class DiscussionConsumer(AsyncWebsocketConsumer):
             return True
         if not user.is_student:
             return False
-        lesson = slide.lesson
-        try:
-            from school.models import StudentProfile
-            profile = StudentProfile.objects.select_related('school_class').get(user=user)
-            student_class = profile.school_class
-        except Exception:
+        # Доступ зависит только от урока: решение кэшируется по (user, lesson)
+        return authz.check(
+            'lesson', user.id, slide.lesson_id,
+            lambda: self._student_can_access_lesson(user, slide.lesson_id),
+        )
+
+    @staticmethod
+    def _student_can_access_lesson(user, lesson_id):
+        from school.models import StudentProfile
+        from .models import LessonAssignment
+        class_id = StudentProfile.objects.filter(user=user).values_list('school_class_id', flat=True).first()
+        if class_id is None:
             return False
-        if LessonSession.objects.filter(lesson=lesson, school_class=student_class, is_active=True).exists():
+        if LessonSession.objects.filter(lesson_id=lesson_id, school_class_id=class_id, is_active=True).exists():
             return True
-        from .models import LessonAssignment
-        return LessonAssignment.objects.filter(lesson=lesson).filter(
-            models.Q(school_class=student_class) | models.Q(student=user)
+        return LessonAssignment.objects.filter(lesson_id=lesson_id).filter(
+            models.Q(school_class_id=class_id) | models.Q(student=user)
         ).exists()
 
 
 # ─── LessonSessionConsumer ────────────────────────────────────────────────────
 
+# Окно, за которое ответы на форму схлопываются в один пересчёт и один кадр.
+FORM_RESULTS_WINDOW_SEC = 0.25
+
+# (session_id, slide_id) → запланированная отправка результатов формы
+_form_results_pending = {}
+
+
+def _session_event(event):
+    """
+    Событие группы сессии с кадром, закодированным один раз для всех получателей.
+    Тип и поля кадра совпадают с событием; slide_id для slide_changed нужен и
+    самому обработчику (снимок session_state).
+    """
+    route = {'slide_id': event['slide_id']} if event['type'] == 'slide_changed' else {}
+    return frames.group_event(event['type'], event, **route)
+
+
+def _session_group(session_id):
+    return f'lesson_session_{session_id}'
+
+
+def broadcast_session_event(session_id, event):
+    """
+    Событие группы сессии из синхронного кода (PATCH сессии по REST): подключённые
+    клиенты получают тот же кадр и обновляют снимок session_state, как после WS.
+    """
+    try:
+        async_to_sync(get_channel_layer().group_send)(_session_group(session_id), _session_event(event))
+    except Exception as e:
+        logger.error('[LessonSession] %s broadcast failed: %s', event['type'], e)
+
+
+def _presenters_group(session_id):
+    return f'lesson_session_{session_id}_presenters'
+
+
+def _schedule_form_results(channel_layer, session_id, slide):
+    """
+    Планирует пересчёт результатов формы и отправку ведущим. Пока отправка
+    ожидает окна, новые ответы на тот же слайд её не дублируют — они попадут
+    в тот же пересчёт.
+    """
+    key = (session_id, slide.id)
+    if key in _form_results_pending:
+        return
+    _form_results_pending[key] = asyncio.ensure_future(
+        _flush_form_results(channel_layer, session_id, slide),
+    )
+
+
+async def _flush_form_results(channel_layer, session_id, slide):
+    await asyncio.sleep(FORM_RESULTS_WINDOW_SEC)
+    # Снимаем ключ до чтения из БД: ответ, пришедший во время пересчёта,
+    # запланирует следующую отправку и не потеряется.
+    _form_results_pending.pop((session_id, slide.id), None)
+    try:
+        results = await _get_form_results(session_id, slide)
+        await channel_layer.group_send(
+            _presenters_group(session_id),
+            _session_event({'type': 'form_results_updated', 'slide_id': slide.id, 'results': results}),
+        )
+    except Exception as e:
+        logger.error('[LessonSession] form_results broadcast failed: %s', e)
+
+
+@sync_to_async
+def _get_form_results(session_id, slide):
+    try:
+        fa_qs = FormAnswer.objects.filter(
+            session_id=session_id, slide_id=slide.id,
+        ).select_related('student')
+        return compute_form_results(slide, fa_qs)
+    except Exception:
+        return {'summary': {'answered_count': 0, 'total_questions': 0, 'per_question': []}, 'details': []}
+
+
 class LessonSessionConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.session_id = self.scope['url_route']['kwargs']['session_id']
-        self.room_group_name = f'lesson_session_{self.session_id}'
+        self.room_group_name = _session_group(self.session_id)
         self.user = self.scope['user']
 
         if not self.user or not self.user.is_authenticated:
@@ -357,8 +581,8 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
             await self.close(code=4004)
             return
 
-        is_presenter = session.teacher_id == self.user.id or self.user.is_admin
-        if not session.is_active and not is_presenter:
+        self.is_presenter = session.teacher_id == self.user.id or self.user.is_admin
+        if not session.is_active and not self.is_presenter:
             await self.close(code=4403)
             return
 
@@ -370,14 +594,32 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
             await self.close(code=4403)
             return
 
+        # Подгруппа ведущих: подробные результаты (имена и ответы учеников) уходят
+        # только им. Ученикам отдельная группа не нужна — им ничего не шлётся адресно.
+        if self.is_presenter:
+            self.role_group_name = _presenters_group(self.session_id)
+
         try:
             await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+            if self.is_presenter:
+                await self.channel_layer.group_add(self.role_group_name, self.channel_name)
         except Exception as e:
             logger.error('[LessonSession] group_add failed: %s: %s', type(e).__name__, e, exc_info=True)
             await self.accept()
             await self.close(code=1011)
             return
 
+        # Снимок сессии и слайдов урока на всё время соединения: receive не ходит
+        # в БД за сессией на каждый кадр. Актуализируется из slide_changed/session_ended
+        # (их шлёт и PATCH сессии по REST — broadcast_session_event).
+        self.session_state = {
+            'teacher_id': session.teacher_id,
+            'is_active': session.is_active,
+            'current_slide_id': session.current_slide_id,
+        }
+        self.lesson_id = session.lesson_id
+        self.slides = await self.load_slides(session.lesson_id)
+
         await self.accept()
 
         await self.send(text_data=json.dumps({
@@ -387,12 +629,13 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
             'is_active': session.is_active,
         }))
         logger.info('[LessonSession] user %s connected to session %s (presenter=%s)',
-                    self.user.id, self.session_id,
-                    session.teacher_id == self.user.id or self.user.is_admin)
+                    self.user.id, self.session_id, self.is_presenter)
 
     async def disconnect(self, close_code):
         if hasattr(self, 'room_group_name'):
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if hasattr(self, 'role_group_name'):
+            await self.channel_layer.group_discard(self.role_group_name, self.channel_name)
 
     async def receive(self, text_data):
         logger.info('[LessonSession] receive raw: %s', text_data[:120])
@@ -401,37 +644,30 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
         except json.JSONDecodeError:
             return
 
-        session = await self.get_session()
-        if session is None:
-            logger.warning('[LessonSession] session %s not found in receive', self.session_id)
-            return
-
         msg_type = data.get('type')
 
+        if msg_type in ('form_answer', 'quiz_answer') and not self.accepts_answers(data.get('slide_id'), msg_type):
+            logger.info('[LessonSession] %s rejected: user=%s slide_id=%s state=%s',
+                        msg_type, self.user.id, data.get('slide_id'), self.session_state)
+            return
+
         if msg_type == 'form_answer':
             slide_id = data.get('slide_id')
             answers = data.get('answers', [])
             logger.info('[LessonSession] form_answer received: user=%s slide_id=%s answers_count=%s',
                         self.user.id, slide_id, len(answers) if isinstance(answers, list) else '?')
-            if slide_id and isinstance(answers, list):
-                await self.save_form_answer(slide_id, answers)
-                try:
-                    results = await self.get_form_results(slide_id)
-                    logger.info('[LessonSession] form_answer broadcast to group %s', self.room_group_name)
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {'type': 'form_results_updated', 'slide_id': slide_id, 'results': results},
-                    )
-                except Exception as e:
-                    logger.error('[LessonSession] form_answer broadcast failed: %s', e)
+            slide = await self.get_slide(slide_id) if slide_id and isinstance(answers, list) else None
+            if slide is not None:
+                await self.save_form_answer(slide.id, answers)
+                _schedule_form_results(self.channel_layer, self.session_id, slide)
             else:
                 logger.warning('[LessonSession] form_answer bad data: slide_id=%s answers type=%s',
                                slide_id, type(answers).__name__)
             return
 
-        is_presenter = session.teacher_id == self.user.id or self.user.is_admin
+        is_presenter = self.is_presenter
         logger.info('[LessonSession] is_presenter=%s  teacher_id=%s  user_id=%s',
-                    is_presenter, session.teacher_id, self.user.id)
+                    is_presenter, self.session_state['teacher_id'], self.user.id)
 
         if msg_type == 'quiz_answer':
             if not is_presenter:
@@ -439,25 +675,27 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
                 question_idx = int(data.get('question_idx', 0))
                 option_index = data.get('option_index')
                 elapsed_ms = int(data.get('elapsed_ms', 0))
-                if slide_id is not None and option_index is not None:
-                    slide = await self.get_slide_by_id(slide_id)
-                    if slide and slide.slide_type == 'quiz':
-                        questions = (slide.content or {}).get('questions', [])
-                        if 0 <= question_idx < len(questions):
-                            q = questions[question_idx]
-                            correct = q.get('correct', -1)
-                            time_limit_ms = q.get('time_limit', 30) * 1000
-                        else:
-                            correct = -1
-                            time_limit_ms = 30000
+                if slide_id is not None and isinstance(option_index, int) and question_idx >= 0:
+                    slide = await self.get_slide(slide_id)
+                    questions = (slide.content or {}).get('questions', []) if slide else []
+                    # Только вопросы этого слайда: любое другое число ушло бы в QuizAnswer.question_idx
+                    if slide and slide.slide_type == 'quiz' and question_idx < len(questions):
+                        q = questions[question_idx]
+                        correct = q.get('correct', -1)
+                        time_limit_ms = q.get('time_limit', 30) * 1000
                         is_correct = (option_index == correct)
                         points = max(100, round(1000 - (elapsed_ms / max(time_limit_ms, 1)) * 900)) if is_correct else 0
-                        await self.save_quiz_answer(slide_id, question_idx, option_index, elapsed_ms, points)
-                        answered_count = await self.get_quiz_answered_count(slide_id, question_idx)
+                        answered_count = await self.save_quiz_answer(
+                            slide_id, question_idx, option_index, elapsed_ms, points,
+                        )
                         try:
+                            # Счётчик ответивших показывается только на экране ведущего
                             await self.channel_layer.group_send(
-                                self.room_group_name,
-                                {'type': 'quiz_answer_received', 'slide_id': slide_id, 'question_idx': question_idx, 'answered_count': answered_count},
+                                _presenters_group(self.session_id),
+                                _session_event({
+                                    'type': 'quiz_answer_received', 'slide_id': slide_id,
+                                    'question_idx': question_idx, 'answered_count': answered_count,
+                                }),
                             )
                         except Exception as e:
                             logger.error('[LessonSession] quiz_answer_received broadcast failed: %s', e)
@@ -476,12 +714,12 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
 
         if msg_type == 'set_slide':
             slide_id = data.get('slide_id')
-            if slide_id:
+            if slide_id and await self.get_slide(slide_id) is not None:
                 await self.do_set_slide(slide_id)
                 try:
                     await self.channel_layer.group_send(
                         self.room_group_name,
-                        {'type': 'slide_changed', 'slide_id': slide_id},
+                        _session_event({'type': 'slide_changed', 'slide_id': slide_id}),
                     )
                     logger.info('[LessonSession] group_send slide_changed slide_id=%s to %s',
                                 slide_id, self.room_group_name)
@@ -491,7 +729,7 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
         elif msg_type == 'end_session':
             await self.do_end_session()
             try:
-                await self.channel_layer.group_send(self.room_group_name, {'type': 'session_ended'})
+                await self.channel_layer.group_send(self.room_group_name, _session_event({'type': 'session_ended'}))
             except Exception as e:
                 logger.error('[LessonSession] group_send end_session failed: %s', e)
 
@@ -500,7 +738,7 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
             if action in ('play', 'pause'):
                 try:
                     await self.channel_layer.group_send(
-                        self.room_group_name, {'type': 'video_control', 'action': action},
+                        self.room_group_name, _session_event({'type': 'video_control', 'action': action}),
                     )
                 except Exception as e:
                     logger.error('[LessonSession] video_control broadcast failed: %s', e)
@@ -509,14 +747,17 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
             slide_id = data.get('slide_id')
             question_idx = int(data.get('question_idx', 0))
             if is_presenter and slide_id:
-                slide = await self.get_slide_by_id(slide_id)
+                slide = await self.get_slide(slide_id)
                 if slide and slide.slide_type == 'quiz':
                     questions = (slide.content or {}).get('questions', [])
                     time_limit = questions[question_idx].get('time_limit', 30) if 0 <= question_idx < len(questions) else 30
                     try:
                         await self.channel_layer.group_send(
                             self.room_group_name,
-                            {'type': 'quiz_started', 'slide_id': slide_id, 'question_idx': question_idx, 'time_limit_sec': time_limit},
+                            _session_event({
+                                'type': 'quiz_started', 'slide_id': slide_id,
+                                'question_idx': question_idx, 'time_limit_sec': time_limit,
+                            }),
                         )
                     except Exception as e:
                         logger.error('[LessonSession] quiz_start broadcast failed: %s', e)
@@ -526,7 +767,7 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
                 slide_id = data.get('slide_id')
                 question_idx = int(data.get('question_idx', 0))
                 if slide_id:
-                    slide = await self.get_slide_by_id(slide_id)
+                    slide = await self.get_slide(slide_id)
                     if slide:
                         questions = (slide.content or {}).get('questions', [])
                         correct = questions[question_idx].get('correct', -1) if 0 <= question_idx < len(questions) else -1
@@ -535,59 +776,56 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
                         try:
                             await self.channel_layer.group_send(
                                 self.room_group_name,
-                                {
+                                _session_event({
                                     'type': 'quiz_leaderboard',
                                     'slide_id': slide_id,
                                     'question_idx': question_idx,
                                     'correct_index': correct,
                                     'leaderboard': leaderboard,
                                     'answer_stats': answer_stats,
-                                },
+                                }),
                             )
                         except Exception as e:
                             logger.error('[LessonSession] quiz_show_results broadcast failed: %s', e)
 
+    def accepts_answers(self, slide_id, msg_type):
+        """
+        Принимать ли ответ ученика — по снимку session_state, без запроса к БД.
+        После session_ended ответы не принимаются; ответ на викторину — только
+        на текущий слайд (форму могли дозаполнить уже после переключения слайда).
+        """
+        if not self.session_state['is_active']:
+            return False
+        current = self.session_state['current_slide_id']
+        if msg_type == 'quiz_answer' and current is not None:
+            return str(slide_id) == str(current)
+        return True
+
     # ── Group message handlers ────────────────────────────────────────────────
+    # Кадр уже закодирован отправителем (_session_event) — пересылаем как есть.
 
     async def slide_changed(self, event):
-        await self.send(text_data=json.dumps({'type': 'slide_changed', 'slide_id': event['slide_id']}))
+        self.session_state['current_slide_id'] = event['slide_id']
+        await self.send(text_data=event['frame'])
 
     async def session_ended(self, event):
-        await self.send(text_data=json.dumps({'type': 'session_ended'}))
+        self.session_state['is_active'] = False
+        await self.send(text_data=event['frame'])
 
     async def form_results_updated(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'form_results_updated', 'slide_id': event['slide_id'], 'results': event['results'],
-        }))
+        await self.send(text_data=event['frame'])
 
     async def video_control(self, event):
-        await self.send(text_data=json.dumps({'type': 'video_control', 'action': event['action']}))
+        await self.send(text_data=event['frame'])
 
     async def quiz_started(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'quiz_started',
-            'slide_id': event['slide_id'],
-            'question_idx': event['question_idx'],
-            'time_limit_sec': event['time_limit_sec'],
-        }))
+        await self.send(text_data=event['frame'])
 
     async def quiz_answer_received(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'quiz_answer_received',
-            'slide_id': event['slide_id'],
-            'question_idx': event['question_idx'],
-            'answered_count': event['answered_count'],
-        }))
+        await self.send(text_data=event['frame'])
 
     async def quiz_leaderboard(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'quiz_leaderboard',
-            'slide_id': event['slide_id'],
-            'question_idx': event['question_idx'],
-            'correct_index': event['correct_index'],
-            'leaderboard': event['leaderboard'],
-            'answer_stats': event['answer_stats'],
-        }))
+        await self.send(text_data=event['frame'])
 
     # ── DB helpers ────────────────────────────────────────────────────────────
 
@@ -599,27 +837,27 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
             return False
         if session.school_class_id is None:
             return True
-        try:
-            from school.models import StudentProfile
-            return StudentProfile.objects.filter(user=user, school_class_id=session.school_class_id).exists()
-        except Exception:
-            return False
+        from school.models import StudentProfile
+        return authz.check('lesson_session', user.id, session.id, lambda: (
+            StudentProfile.objects.filter(user=user, school_class_id=session.school_class_id).exists()
+        ))
 
     @sync_to_async
     def get_session(self):
         try:
-            return LessonSession.objects.get(id=self.session_id)
+            # discussion_data может быть большим и здесь не нужен
+            return LessonSession.objects.defer('discussion_data').get(id=self.session_id)
         except LessonSession.DoesNotExist:
             return None
 
+    @sync_to_async
+    def load_slides(self, lesson_id):
+        slides = Slide.objects.filter(lesson_id=lesson_id).only('id', 'lesson_id', 'slide_type', 'content')
+        return {slide.id: slide for slide in slides}
+
     @sync_to_async
     def do_set_slide(self, slide_id):
-        try:
-            session = LessonSession.objects.get(id=self.session_id)
-            session.current_slide_id = slide_id
-            session.save(update_fields=['current_slide'])
-        except LessonSession.DoesNotExist:
-            pass
+        LessonSession.objects.filter(id=self.session_id).update(current_slide_id=slide_id)
 
     @sync_to_async
     def save_form_answer(self, slide_id, answers):
@@ -630,76 +868,76 @@ class LessonSessionConsumer(AsyncWebsocketConsumer):
             defaults={'answers': answers},
         )
 
-    @sync_to_async
-    def get_form_results(self, slide_id):
-        try:
-            slide = Slide.objects.get(id=slide_id)
-            fa_qs = FormAnswer.objects.filter(
-                session_id=self.session_id, slide_id=slide_id,
-            ).select_related('student')
-            return compute_form_results(slide, fa_qs)
-        except Exception:
-            return {'summary': {'answered_count': 0, 'total_questions': 0, 'per_question': []}, 'details': []}
-
     @sync_to_async
     def do_end_session(self):
         from django.utils import timezone
+        LessonSession.objects.filter(id=self.session_id).update(is_active=False, ended_at=timezone.now())
+        # update() не шлёт post_save — доступ учеников к урокам пересчитается
+        authz.invalidate('lesson', resource_id=self.lesson_id)
+        quiz.drop_aggregator(self.session_id)
+
+    async def get_slide(self, slide_id):
+        """Слайд из снимка урока; слайд, добавленный после подключения, дочитывается из БД."""
         try:
-            session = LessonSession.objects.get(id=self.session_id)
-            session.is_active = False
-            session.ended_at = timezone.now()
-            session.save(update_fields=['is_active', 'ended_at'])
-        except LessonSession.DoesNotExist:
-            pass
+            slide_id = int(slide_id)
+        except (TypeError, ValueError):
+            return None
+        slide = self.slides.get(slide_id)
+        if slide is None:
+            slide = await self._fetch_slide(slide_id)
+            if slide is not None:
+                self.slides[slide_id] = slide
+        return slide
 
     @sync_to_async
-    def get_slide_by_id(self, slide_id):
+    def _fetch_slide(self, slide_id):
         try:
-            return Slide.objects.get(id=slide_id)
+            return Slide.objects.only('id', 'lesson_id', 'slide_type', 'content').get(
+                id=slide_id, lesson__sessions__id=self.session_id,
+            )
         except Slide.DoesNotExist:
             return None
 
     @sync_to_async
     def save_quiz_answer(self, slide_id, question_idx, option_index, elapsed_ms, points):
-        fa, _ = FormAnswer.objects.get_or_create(
-            session_id=self.session_id, slide_id=slide_id, student=self.user,
-            defaults={'answers': {}},
+        """
+        Сохраняет ответ в QuizAnswer и учитывает его в агрегаторе. Возвращает число ответивших.
+        Прежний ответ читается под блокировкой строки, поэтому два параллельных
+        ответа ученика (две вкладки) не получат один и тот же prev и не учтутся
+        дважды. Агрегатор обновляется только после коммита.
+        """
+        # Агрегатор поднимаем до записи, иначе восстановление из БД уже учтёт этот ответ.
+        quiz.get_aggregator(self.session_id)
+        lookup = {
+            'session_id': self.session_id,
+            'slide_id': slide_id,
+            'question_idx': question_idx,
+            'student': self.user,
+        }
+        fields = {'option_index': option_index, 'elapsed_ms': max(0, elapsed_ms), 'points': points}
+        prev = None
+        with transaction.atomic():
+            answer = QuizAnswer.objects.select_for_update().filter(**lookup).first()
+            if answer is None:
+                try:
+                    with transaction.atomic():
+                        QuizAnswer.objects.create(**lookup, **fields)
+                except IntegrityError:
+                    # Первый ответ на вопрос параллельно записала другая вкладка
+                    answer = QuizAnswer.objects.select_for_update().get(**lookup)
+            if answer is not None:
+                prev = (answer.option_index, answer.points)
+                for name, value in fields.items():
+                    setattr(answer, name, value)
+                answer.save(update_fields=[*fields, 'answered_at'])
+        return quiz.record_answer(
+            self.session_id, slide_id, question_idx, self.user, option_index, points, prev=prev,
         )
-        if not isinstance(fa.answers, dict):
-            fa.answers = {}
-        fa.answers[str(question_idx)] = {'option_index': option_index, 'elapsed_ms': elapsed_ms, 'points': points}
-        fa.save(update_fields=['answers'])
-
-    @sync_to_async
-    def get_quiz_answered_count(self, slide_id, question_idx):
-        fas = FormAnswer.objects.filter(session_id=self.session_id, slide_id=slide_id)
-        key = str(question_idx)
-        return sum(1 for fa in fas if isinstance(fa.answers, dict) and key in fa.answers)
 
     @sync_to_async
     def get_quiz_leaderboard(self):
-        answers = FormAnswer.objects.filter(session_id=self.session_id).select_related('student')
-        totals: dict = {}
-        for fa in answers:
-            sid = fa.student_id
-            name = f'{fa.student.first_name} {fa.student.last_name}'.strip() or f'User {sid}'
-            if sid not in totals:
-                totals[sid] = {'id': sid, 'name': name, 'points': 0}
-            if isinstance(fa.answers, dict):
-                for v in fa.answers.values():
-                    if isinstance(v, dict) and 'points' in v:
-                        totals[sid]['points'] += v['points']
-        return sorted(totals.values(), key=lambda x: -x['points'])
+        return quiz.leaderboard(self.session_id)
 
     @sync_to_async
     def get_quiz_answer_stats(self, slide_id, question_idx):
-        fas = FormAnswer.objects.filter(session_id=self.session_id, slide_id=slide_id)
-        key = str(question_idx)
-        stats: dict = {}
-        for fa in fas:
-            if isinstance(fa.answers, dict) and key in fa.answers:
-                v = fa.answers[key]
-                if isinstance(v, dict) and 'option_index' in v:
-                    idx = str(v['option_index'])
-                    stats[idx] = stats.get(idx, 0) + 1
-        return stats
+        return quiz.answer_stats(self.session_id, slide_id, question_idx)
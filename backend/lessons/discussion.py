@@ -0,0 +1,99 @@
+"""
+Журнал событий досок обсуждений для дельта-синхронизации при переподключении.
+
+У каждой доски — пары (slide_id, session_id) — монотонно растущая версия.
+Каждое событие, разосланное DiscussionConsumer, получает очередную версию и
+попадает в ограниченный журнал. Клиент, переподключившийся с ?since=<version>,
+получает только пропущенные события; полный снимок — только если журнал уже не
+покрывает его версию. Из нескольких sticker_updated одного стикера в журнале
+остаётся только последнее (_collapse_key).
+
+Журнал живёт в памяти процесса (один процесс Daphne, см. DEPLOY.md). Первая
+версия доски берётся от текущего времени в миллисекундах, поэтому после
+рестарта версии не повторяются, и клиенты со старой версией получают снимок.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Сколько последних событий хранить на доску
+LOG_SIZE = 500
+
+# Сколько досок держать в памяти (LRU)
+_MAX_BOARDS = 256
+
+
+def _collapse_key(frame):
+    """
+    Ключ, по которому новое событие вытесняет из журнала прежнее. sticker_updated
+    несёт стикер целиком, поэтому догоняющему клиенту нужна только последняя
+    позиция: перетаскивание (до 15 событий в секунду) занимает в журнале одну
+    запись на стикер, а не вытесняет остальные события доски.
+    """
+    if frame.get('type') == 'sticker_updated':
+        return ('sticker', frame['sticker']['id'])
+    return None
+
+
+class BoardLog:
+    def __init__(self):
+        self.version = int(time.time() * 1000)
+        self.floor = self.version       # версии до floor включительно журнал уже не покрывает
+        self.events = OrderedDict()     # version → (frame, ключ схлопывания)
+        self.latest = {}                # ключ схлопывания → версия его записи в events
+
+    def append(self, frame):
+        self.version += 1
+        key = _collapse_key(frame)
+        if key is not None:
+            superseded = self.latest.pop(key, None)
+            if superseded is not None:
+                del self.events[superseded]
+            self.latest[key] = self.version
+        self.events[self.version] = (frame, key)
+        while len(self.events) > LOG_SIZE:
+            version, (_, old_key) = self.events.popitem(last=False)
+            self.floor = version
+            if old_key is not None and self.latest.get(old_key) == version:
+                del self.latest[old_key]
+        return self.version
+
+    def since(self, version):
+        """События после version или None, если журнал их уже не покрывает."""
+        if version > self.version or version < self.floor:
+            return None
+        return [frame for v, (frame, _) in self.events.items() if v > version]
+
+
+_boards: 'OrderedDict[tuple, BoardLog]' = OrderedDict()
+_lock = threading.Lock()
+
+
+def _get(board_key):
+    log = _boards.get(board_key)
+    if log is None:
+        log = _boards[board_key] = BoardLog()
+        while len(_boards) > _MAX_BOARDS:
+            _boards.popitem(last=False)
+    else:
+        _boards.move_to_end(board_key)
+    return log
+
+
+def append(board_key, frame):
+    """Записать событие доски; проставляет и возвращает его версию."""
+    with _lock:
+        frame['version'] = _get(board_key).append(frame)
+        return frame['version']
+
+
+def current_version(board_key):
+    with _lock:
+        return _get(board_key).version
+
+
+def events_since(board_key, version):
+    """(текущая версия, пропущенные события | None)."""
+    with _lock:
+        log = _get(board_key)
+        return log.version, log.since(version)
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-16 22:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0012_lessonsession_discussion_data'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_idx', models.PositiveSmallIntegerField(verbose_name='Номер вопроса')),
+                ('option_index', models.IntegerField(verbose_name='Выбранный вариант')),
+                ('elapsed_ms', models.PositiveIntegerField(default=0, verbose_name='Время ответа (мс)')),
+                ('points', models.PositiveIntegerField(default=0, verbose_name='Очки')),
+                ('answered_at', models.DateTimeField(auto_now=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_answers', to='lessons.lessonsession', verbose_name='Сессия')),
+                ('slide', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_answers', to='lessons.slide', verbose_name='Слайд')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_answers', to=settings.AUTH_USER_MODEL, verbose_name='Ученик')),
+            ],
+            options={
+                'verbose_name': 'Ответ на викторину',
+                'verbose_name_plural': 'Ответы на викторины',
+                'indexes': [models.Index(fields=['session', 'student'], name='lessons_qui_session_787108_idx')],
+                'unique_together': {('session', 'slide', 'question_idx', 'student')},
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Data migration: переносит ответы викторин из FormAnswer.answers (dict) в QuizAnswer.
+
+from django.db import migrations
+
+_BATCH = 1000
+
+
+def forward(apps, schema_editor):
+    FormAnswer = apps.get_model('lessons', 'FormAnswer')
+    QuizAnswer = apps.get_model('lessons', 'QuizAnswer')
+
+    batch = []
+    quiz_fa_ids = []
+    for fa in FormAnswer.objects.all().iterator(chunk_size=_BATCH):
+        # Формы хранят список [{question_id, value}], викторины — dict {question_idx: {...}}
+        if not isinstance(fa.answers, dict):
+            continue
+        quiz_fa_ids.append(fa.id)
+        for q_idx, v in fa.answers.items():
+            if not isinstance(v, dict) or 'option_index' not in v:
+                continue
+            try:
+                question_idx = int(q_idx)
+                option_index = int(v['option_index'])
+            except (TypeError, ValueError):
+                continue
+            batch.append(QuizAnswer(
+                session_id=fa.session_id,
+                slide_id=fa.slide_id,
+                student_id=fa.student_id,
+                question_idx=question_idx,
+                option_index=option_index,
+                elapsed_ms=max(0, int(v.get('elapsed_ms') or 0)),
+                points=max(0, int(v.get('points') or 0)),
+            ))
+            if len(batch) >= _BATCH:
+                QuizAnswer.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+    if batch:
+        QuizAnswer.objects.bulk_create(batch, ignore_conflicts=True)
+
+    for i in range(0, len(quiz_fa_ids), _BATCH):
+        FormAnswer.objects.filter(id__in=quiz_fa_ids[i:i + _BATCH]).delete()
+
+
+def backward(apps, schema_editor):
+    FormAnswer = apps.get_model('lessons', 'FormAnswer')
+    QuizAnswer = apps.get_model('lessons', 'QuizAnswer')
+
+    grouped = {}
+    for qa in QuizAnswer.objects.all().iterator(chunk_size=_BATCH):
+        key = (qa.session_id, qa.slide_id, qa.student_id)
+        grouped.setdefault(key, {})[str(qa.question_idx)] = {
+            'option_index': qa.option_index,
+            'elapsed_ms': qa.elapsed_ms,
+            'points': qa.points,
+        }
+    FormAnswer.objects.bulk_create(
+        [
+            FormAnswer(session_id=s, slide_id=sl, student_id=st, answers=answers)
+            for (s, sl, st), answers in grouped.items()
+        ],
+        batch_size=_BATCH,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0013_quizanswer'),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, backward),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.4 on 2026-10-16 22:45
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0014_quizanswer_from_formanswer'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscussionSticker',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('x', models.FloatField(default=100)),
+                ('y', models.FloatField(default=100)),
+                ('text', models.TextField(blank=True, default='')),
+                ('color', models.CharField(default='#fef08a', max_length=20)),
+                ('author_name', models.CharField(blank=True, default='', max_length=300)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('author', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='discussion_stickers', to='lessons.lessonsession', verbose_name='Сессия')),
+                ('slide', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='discussion_stickers', to='lessons.slide', verbose_name='Слайд')),
+            ],
+            options={
+                'verbose_name': 'Стикер обсуждения',
+                'verbose_name_plural': 'Стикеры обсуждений',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DiscussionArrow',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('author_name', models.CharField(blank=True, default='', max_length=300)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('author', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='discussion_arrows', to='lessons.lessonsession', verbose_name='Сессия')),
+                ('slide', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='discussion_arrows', to='lessons.slide', verbose_name='Слайд')),
+                ('from_sticker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='arrows_out', to='lessons.discussionsticker')),
+                ('to_sticker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='arrows_in', to='lessons.discussionsticker')),
+            ],
+            options={
+                'verbose_name': 'Стрелка обсуждения',
+                'verbose_name_plural': 'Стрелки обсуждений',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='discussionsticker',
+            index=models.Index(fields=['slide', 'session'], name='lessons_dis_slide_i_e43e29_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='discussionarrow',
+            index=models.Index(fields=['slide', 'session'], name='lessons_dis_slide_i_9a4b09_idx'),
+        ),
+    ]
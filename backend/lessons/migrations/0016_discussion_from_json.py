@@ -0,0 +1,172 @@
+# Data migration: переносит стикеры и стрелки досок обсуждений из JSON
+# (Slide.content и LessonSession.discussion_data) в DiscussionSticker/DiscussionArrow.
+# Тема доски остаётся в JSON.
+
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+_BATCH = 500
+
+
+def _as_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _as_float(value, default):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def _import_board(apps, board, slide_id, session_id, user_ids):
+    DiscussionSticker = apps.get_model('lessons', 'DiscussionSticker')
+    DiscussionArrow = apps.get_model('lessons', 'DiscussionArrow')
+
+    stickers, created = [], []
+    id_map = {}
+    base = timezone.now()
+    for i, s in enumerate(board.get('stickers') or []):
+        if not isinstance(s, dict):
+            continue
+        new_id = _as_uuid(s.get('id')) or uuid.uuid4()
+        if new_id in id_map.values():
+            new_id = uuid.uuid4()
+        id_map[str(s.get('id'))] = new_id
+        author_id = s.get('author_id')
+        stickers.append(DiscussionSticker(
+            id=new_id,
+            slide_id=slide_id,
+            session_id=session_id,
+            x=_as_float(s.get('x'), 100),
+            y=_as_float(s.get('y'), 100),
+            text=str(s.get('text') or ''),
+            color=str(s.get('color') or '#fef08a')[:20],
+            author_id=author_id if author_id in user_ids else None,
+            author_name=str(s.get('author_name') or '')[:300],
+        ))
+        # Порядок стикеров на доске задаётся created_at
+        parsed = parse_datetime(str(s.get('created_at') or ''))
+        created.append(parsed or base + timedelta(microseconds=i))
+    DiscussionSticker.objects.bulk_create(stickers, batch_size=_BATCH)
+    # auto_now_add перезаписывает created_at при вставке — восстанавливаем
+    for sticker, created_at in zip(stickers, created):
+        sticker.created_at = created_at
+    DiscussionSticker.objects.bulk_update(stickers, ['created_at'], batch_size=_BATCH)
+
+    arrows = []
+    for a in board.get('arrows') or []:
+        if not isinstance(a, dict):
+            continue
+        from_id = id_map.get(str(a.get('from_id')))
+        to_id = id_map.get(str(a.get('to_id')))
+        if from_id is None or to_id is None or from_id == to_id:
+            continue
+        author_id = a.get('author_id')
+        arrows.append(DiscussionArrow(
+            id=_as_uuid(a.get('id')) or uuid.uuid4(),
+            slide_id=slide_id,
+            session_id=session_id,
+            from_sticker_id=from_id,
+            to_sticker_id=to_id,
+            author_id=author_id if author_id in user_ids else None,
+            author_name=str(a.get('author_name') or '')[:300],
+        ))
+    DiscussionArrow.objects.bulk_create(arrows, batch_size=_BATCH, ignore_conflicts=True)
+
+
+def forward(apps, schema_editor):
+    Slide = apps.get_model('lessons', 'Slide')
+    LessonSession = apps.get_model('lessons', 'LessonSession')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    user_ids = set(User.objects.values_list('id', flat=True))
+
+    for slide in Slide.objects.filter(slide_type='discussion').iterator(chunk_size=_BATCH):
+        content = slide.content if isinstance(slide.content, dict) else {}
+        if 'stickers' not in content and 'arrows' not in content:
+            continue
+        _import_board(apps, content, slide.id, None, user_ids)
+        slide.content = {k: v for k, v in content.items() if k not in ('stickers', 'arrows')}
+        slide.save(update_fields=['content'])
+
+    slide_ids = set(Slide.objects.values_list('id', flat=True))
+    for session in LessonSession.objects.exclude(discussion_data={}).iterator(chunk_size=_BATCH):
+        data = session.discussion_data if isinstance(session.discussion_data, dict) else {}
+        remaining = {}
+        for key, board in data.items():
+            if not isinstance(board, dict):
+                continue
+            try:
+                slide_id = int(key)
+            except (TypeError, ValueError):
+                continue
+            if slide_id in slide_ids:
+                _import_board(apps, board, slide_id, session.id, user_ids)
+            if board.get('topic'):
+                remaining[key] = {'topic': board['topic']}
+        session.discussion_data = remaining
+        session.save(update_fields=['discussion_data'])
+
+
+def backward(apps, schema_editor):
+    Slide = apps.get_model('lessons', 'Slide')
+    LessonSession = apps.get_model('lessons', 'LessonSession')
+    DiscussionSticker = apps.get_model('lessons', 'DiscussionSticker')
+    DiscussionArrow = apps.get_model('lessons', 'DiscussionArrow')
+
+    boards = {}
+    for s in DiscussionSticker.objects.order_by('created_at').iterator(chunk_size=_BATCH):
+        board = boards.setdefault((s.slide_id, s.session_id), {'stickers': [], 'arrows': []})
+        board['stickers'].append({
+            'id': str(s.id),
+            'x': s.x,
+            'y': s.y,
+            'text': s.text,
+            'color': s.color,
+            'author_id': s.author_id,
+            'author_name': s.author_name,
+            'created_at': s.created_at.isoformat(),
+        })
+    for a in DiscussionArrow.objects.order_by('created_at').iterator(chunk_size=_BATCH):
+        board = boards.setdefault((a.slide_id, a.session_id), {'stickers': [], 'arrows': []})
+        board['arrows'].append({
+            'id': str(a.id),
+            'from_id': str(a.from_sticker_id),
+            'to_id': str(a.to_sticker_id),
+            'author_id': a.author_id,
+            'author_name': a.author_name,
+        })
+
+    for (slide_id, session_id), board in boards.items():
+        if session_id is None:
+            slide = Slide.objects.get(id=slide_id)
+            slide.content = {**(slide.content or {}), **board}
+            slide.save(update_fields=['content'])
+        else:
+            session = LessonSession.objects.get(id=session_id)
+            data = dict(session.discussion_data or {})
+            data[str(slide_id)] = {**data.get(str(slide_id), {}), **board}
+            session.discussion_data = data
+            session.save(update_fields=['discussion_data'])
+
+    DiscussionArrow.objects.all().delete()
+    DiscussionSticker.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0015_discussion_sticker_arrow'),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, backward),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-16 23:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0016_discussion_from_json'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='textbook',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Страниц'),
+        ),
+    ]
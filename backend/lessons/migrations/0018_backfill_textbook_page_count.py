@@ -0,0 +1,26 @@
+# Data migration: число страниц уже загруженных учебников.
+
+import fitz  # pymupdf
+from django.db import migrations
+
+
+def forward(apps, schema_editor):
+    Textbook = apps.get_model('lessons', 'Textbook')
+    for textbook in Textbook.objects.filter(page_count__isnull=True).exclude(file='').iterator():
+        try:
+            with fitz.open(textbook.file.path) as doc:
+                textbook.page_count = doc.page_count
+        except (FileNotFoundError, fitz.FileDataError):
+            continue
+        textbook.save(update_fields=['page_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0017_textbook_page_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.conf import settings
 
@@ -188,6 +190,134 @@ class FormAnswer(models.Model):
         return f'FormAnswer session={self.session_id} slide={self.slide_id} student={self.student_id}'
 
 
+class QuizAnswer(models.Model):
+    """Ответ ученика на один вопрос викторины в рамках сессии."""
+    session = models.ForeignKey(
+        LessonSession,
+        on_delete=models.CASCADE,
+        related_name='quiz_answers',
+        verbose_name='Сессия',
+    )
+    slide = models.ForeignKey(
+        Slide,
+        on_delete=models.CASCADE,
+        related_name='quiz_answers',
+        verbose_name='Слайд',
+    )
+    question_idx = models.PositiveSmallIntegerField(verbose_name='Номер вопроса')
+    student = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='quiz_answers',
+        verbose_name='Ученик',
+    )
+    option_index = models.IntegerField(verbose_name='Выбранный вариант')
+    elapsed_ms = models.PositiveIntegerField(default=0, verbose_name='Время ответа (мс)')
+    points = models.PositiveIntegerField(default=0, verbose_name='Очки')
+    answered_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['session', 'slide', 'question_idx', 'student']
+        indexes = [
+            # Лидерборд сессии: GROUP BY student по session.
+            models.Index(fields=['session', 'student']),
+        ]
+        verbose_name = 'Ответ на викторину'
+        verbose_name_plural = 'Ответы на викторины'
+
+    def __str__(self):
+        return f'QuizAnswer session={self.session_id} slide={self.slide_id} q={self.question_idx} student={self.student_id}'
+
+
+class DiscussionSticker(models.Model):
+    """
+    Стикер доски обсуждения. Доска — пара (slide, session): session=None —
+    доска в редакторе слайда, иначе — доска конкретной сессии урока.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    slide = models.ForeignKey(
+        Slide,
+        on_delete=models.CASCADE,
+        related_name='discussion_stickers',
+        verbose_name='Слайд',
+    )
+    session = models.ForeignKey(
+        LessonSession,
+        on_delete=models.CASCADE,
+        null=True, blank=True,
+        related_name='discussion_stickers',
+        verbose_name='Сессия',
+    )
+    x = models.FloatField(default=100)
+    y = models.FloatField(default=100)
+    text = models.TextField(blank=True, default='')
+    color = models.CharField(max_length=20, default='#fef08a')
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    author_name = models.CharField(max_length=300, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['slide', 'session'])]
+        verbose_name = 'Стикер обсуждения'
+        verbose_name_plural = 'Стикеры обсуждений'
+
+    def __str__(self):
+        return f'Sticker {self.id} slide={self.slide_id} session={self.session_id}'
+
+
+class DiscussionArrow(models.Model):
+    """Стрелка между двумя стикерами; удаляется вместе с любым из них."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    slide = models.ForeignKey(
+        Slide,
+        on_delete=models.CASCADE,
+        related_name='discussion_arrows',
+        verbose_name='Слайд',
+    )
+    session = models.ForeignKey(
+        LessonSession,
+        on_delete=models.CASCADE,
+        null=True, blank=True,
+        related_name='discussion_arrows',
+        verbose_name='Сессия',
+    )
+    from_sticker = models.ForeignKey(
+        DiscussionSticker,
+        on_delete=models.CASCADE,
+        related_name='arrows_out',
+    )
+    to_sticker = models.ForeignKey(
+        DiscussionSticker,
+        on_delete=models.CASCADE,
+        related_name='arrows_in',
+    )
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    author_name = models.CharField(max_length=300, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['slide', 'session'])]
+        verbose_name = 'Стрелка обсуждения'
+        verbose_name_plural = 'Стрелки обсуждений'
+
+    def __str__(self):
+        return f'Arrow {self.id} slide={self.slide_id} session={self.session_id}'
+
+
 class LessonMedia(models.Model):
     lesson = models.ForeignKey(
         Lesson,
@@ -213,6 +343,7 @@ class Textbook(models.Model):
     file = models.FileField(upload_to='textbooks/%Y/', verbose_name='Файл')
     original_name = models.CharField(max_length=300, blank=True, verbose_name='Оригинальное имя')
     file_size = models.BigIntegerField(default=0, verbose_name='Размер файла (байт)')
+    page_count = models.PositiveIntegerField(null=True, blank=True, verbose_name='Страниц')
     subject = models.ForeignKey(
         'school.Subject',
         on_delete=models.SET_NULL,
@@ -0,0 +1,212 @@
+"""
+Страницы PDF по запросу с дисковым LRU-кэшем.
+
+Импортированные PDF-презентации и учебники больше не рендерятся целиком: клиент
+запрашивает одну страницу нужной ширины (GET .../pages/<n>/?w=&fmt=), она
+рендерится при первом запросе (lessons/pdf_render.py) и кладётся в
+PDF_PAGE_CACHE_DIR. Ключ — хеш содержимого PDF, страница, ширина, формат и
+качество; он же ETag ответа, поэтому повторный запрос браузера с If-None-Match
+не открывает ни кэш, ни PDF.
+
+Эндпоинты страниц открыты без JWT (картинки грузятся тегом <img>), поэтому
+рендер — только по подписанной ссылке: ?s= — подпись ресурса (sign()), её
+отдают сериализатор учебника и слайды импорта. Без подписи отдаётся лишь то, что
+уже лежит в кэше. Ширина и качество округляются до фиксированных WIDTHS и
+QUALITIES, а одновременных рендеров не больше PDF_RENDER_CONCURRENCY, так что
+подписанная ссылка тоже не позволяет ни плодить варианты, ни занять все ядра.
+
+Объём каталога ограничен PDF_PAGE_CACHE_MB: при переполнении удаляются файлы с
+самым старым временем изменения (при попадании оно обновляется), пока не
+останется 90% лимита. Хеш файла считается один раз на (путь, размер, mtime).
+Счётчики — stats(), в /api/admin/cache-stats/.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare
+
+from . import pdf_render
+
+FORMATS = pdf_render.FORMATS
+WIDTHS = (320, 480, 640, 960, 1280, 1600, 1920, 2560)
+QUALITIES = (50, 65, 80, 90)
+QUALITY_DEFAULT = 80
+RENDER_WAIT = 10  # секунд ждать свободного слота рендера, дальше — RenderBusy
+
+_MAX_HASHES = 1024
+
+_hashes: 'OrderedDict[tuple, str]' = OrderedDict()   # (путь, размер, mtime) → sha256 содержимого
+_size = None                                          # байт в каталоге кэша; None — ещё не посчитан
+_counters = {'hits': 0, 'misses': 0, 'evicted': 0, 'denied': 0, 'busy': 0}
+_lock = threading.Lock()
+_render_slots = None
+
+
+class RenderBusy(Exception):
+    """Все слоты рендера заняты дольше RENDER_WAIT."""
+
+
+def cache_dir():
+    return Path(getattr(settings, 'PDF_PAGE_CACHE_DIR', settings.BASE_DIR / 'cache' / 'pdf_pages'))
+
+
+def _limit():
+    return getattr(settings, 'PDF_PAGE_CACHE_MB', 1024) * 1024 * 1024
+
+
+def snap_width(width):
+    """Ширина → ближайшая не меньшая из WIDTHS, чтобы не плодить варианты в кэше."""
+    return next((w for w in WIDTHS if w >= width), WIDTHS[-1])
+
+
+def snap_quality(quality):
+    """Качество → ближайшее не меньшее из QUALITIES, как snap_width."""
+    return next((q for q in QUALITIES if q >= quality), QUALITIES[-1])
+
+
+def sign(resource):
+    """Подпись ресурса ('textbook:<id>', 'media:<id>') для параметра ?s=."""
+    return signing.Signer(salt='lessons.page_cache').signature(resource)
+
+
+def check_signature(resource, token):
+    return bool(token) and constant_time_compare(sign(resource), token)
+
+
+def _slots():
+    global _render_slots
+    with _lock:
+        if _render_slots is None:
+            _render_slots = threading.BoundedSemaphore(getattr(settings, 'PDF_RENDER_CONCURRENCY', 2))
+        return _render_slots
+
+
+def file_hash(path):
+    st = os.stat(path)
+    memo_key = (str(path), st.st_size, st.st_mtime_ns)
+    with _lock:
+        if memo_key in _hashes:
+            _hashes.move_to_end(memo_key)
+            return _hashes[memo_key]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _lock:
+        _hashes[memo_key] = value
+        while len(_hashes) > _MAX_HASHES:
+            _hashes.popitem(last=False)
+    return value
+
+
+def page_key(path, index, width, fmt, quality):
+    """Ключ кэша и ETag страницы."""
+    return f'{file_hash(path)[:32]}-{index}-{width}-{quality}.{fmt}'
+
+
+def _entry_path(key):
+    return cache_dir() / key[:2] / key
+
+
+def _scan():
+    """Файлы кэша: [(mtime, размер, путь)]."""
+    entries = []
+    root = cache_dir()
+    if not root.exists():
+        return entries
+    for sub in os.scandir(root):
+        if not sub.is_dir():
+            continue
+        for entry in os.scandir(sub.path):
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    return entries
+
+
+def _store(key, data):
+    global _size
+    path = _entry_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+    with _lock:
+        if _size is None:
+            _size = sum(size for _, size, _ in _scan())
+        else:
+            _size += len(data)
+        if _size <= _limit():
+            return
+        entries = sorted(_scan())
+        _size = sum(size for _, size, _ in entries)
+        target = _limit() * 0.9
+        for _, size, victim in entries:
+            if _size <= target:
+                break
+            try:
+                os.remove(victim)
+            except FileNotFoundError:
+                pass
+            _size -= size
+            _counters['evicted'] += 1
+
+
+def get_page(path, index, width, fmt, quality, key=None, render=True):
+    """
+    Байты страницы из кэша или свежеотрендеренные; при render=False промах
+    кэша → None. Бросает IndexError и RenderBusy.
+    """
+    key = key or page_key(path, index, width, fmt, quality)
+    entry = _entry_path(key)
+    try:
+        data = entry.read_bytes()
+    except FileNotFoundError:
+        data = None
+    if data is not None:
+        now = time.time()
+        try:
+            os.utime(entry, (now, now))
+        except FileNotFoundError:   # вытеснен другим потоком между чтением и utime
+            pass
+        with _lock:
+            _counters['hits'] += 1
+        return data
+    if not render:
+        with _lock:
+            _counters['denied'] += 1
+        return None
+
+    slots = _slots()
+    if not slots.acquire(timeout=RENDER_WAIT):
+        with _lock:
+            _counters['busy'] += 1
+        raise RenderBusy()
+    try:
+        data = pdf_render.render_page(path, index, width, fmt, quality)
+    finally:
+        slots.release()
+    _store(key, data)
+    with _lock:
+        _counters['misses'] += 1
+    return data
+
+
+def put_page(path, index, width, fmt, quality, data):
+    """Положить уже отрендеренную страницу (прогрев после импорта)."""
+    _store(page_key(path, index, width, fmt, quality), data)
+
+
+def stats():
+    with _lock:
+        return {**_counters, 'bytes': _size, 'limit': _limit()}
@@ -0,0 +1,155 @@
+"""
+Фоновый импорт PDF в урок.
+
+Запрос POST /lessons/import/ только сохраняет файл и возвращает task_id, а
+задача в фоновом потоке создаёт по content-слайду на страницу одним bulk_create.
+Страницы не рендерятся заранее: блок-изображение слайда ссылается на
+GET /lessons/media/<id>/pages/<n>/ (lessons/page_cache.py), и страница
+рендерится при первом показе. Первые WARM_PAGES страниц прогреваются в кэш
+пулом процессов (PDF_IMPORT_WORKERS, рендер — lessons/pdf_render.py), чтобы
+урок сразу открывался без ожидания. Прогресс — GET /lessons/import/<task_id>/,
+как у импорта учеников из Excel (school/views.py): задачи хранятся в памяти
+процесса и забываются через _TASK_TTL.
+
+При ошибке урок удаляется, как и при синхронном импорте.
+"""
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import page_cache, pdf_render
+from .models import Lesson, LessonMedia, Slide
+from .utils import IMPORT_H, IMPORT_W
+
+# Ширина, с которой слайды запрашивают страницы (полноэкранный показ)
+SLIDE_WIDTH = 1920
+WARM_PAGES = 3
+
+_TASK_TTL = 3600  # секунд
+
+_tasks: dict = {}
+_lock = threading.Lock()
+_executor = None
+
+
+def _workers():
+    return getattr(settings, 'PDF_IMPORT_WORKERS', None) or min(4, os.cpu_count() or 1)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # spawn, а не fork: процесс Daphne многопоточный, форк его состояния небезопасен
+            _executor = ProcessPoolExecutor(
+                max_workers=_workers(), mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _cleanup_old_tasks():
+    """Вызывать под _lock."""
+    now = time.time()
+    for task_id in [k for k, v in _tasks.items() if now - v['created_at'] > _TASK_TTL]:
+        del _tasks[task_id]
+
+
+def _update(task_id, **fields):
+    with _lock:
+        _tasks[task_id].update(fields)
+
+
+def get_task(task_id, user):
+    """Состояние задачи для её автора или None."""
+    with _lock:
+        task = _tasks.get(task_id)
+        if task is None or task['user_id'] != user.id:
+            return None
+        return {k: v for k, v in task.items() if k not in ('user_id', 'created_at')}
+
+
+def start(request, lesson, file_obj):
+    """Сохранить PDF в медиафайлы урока и запустить импорт. Возвращает task_id."""
+    source = LessonMedia(lesson=lesson)
+    source.file.save(file_obj.name, file_obj, save=True)
+
+    task_id = str(uuid.uuid4())
+    with _lock:
+        _cleanup_old_tasks()
+        _tasks[task_id] = {
+            'status': 'running',
+            'lesson': lesson.id,
+            'processed': 0,
+            'total': 0,
+            'user_id': request.user.id,
+            'created_at': time.time(),
+        }
+    base_url = request.build_absolute_uri('/')
+    threading.Thread(
+        target=run, args=(task_id, lesson.id, source.id, source.file.path, base_url), daemon=True,
+    ).start()
+    return task_id
+
+
+def page_src(base_url, media_id, index):
+    """URL страницы index (с 0) PDF из LessonMedia для блока-изображения слайда, с подписью."""
+    sig = page_cache.sign(f'media:{media_id}')
+    return urljoin(base_url, f'/api/lessons/media/{media_id}/pages/{index + 1}/?w={SLIDE_WIDTH}&s={sig}')
+
+
+def run(task_id, lesson_id, media_id, path, base_url):
+    """Тело фоновой задачи: слайды по страницам, затем прогрев первых страниц."""
+    try:
+        total = pdf_render.page_count(path)
+        _update(task_id, total=total)
+        Slide.objects.bulk_create([
+            Slide(
+                lesson_id=lesson_id,
+                order=i,
+                slide_type=Slide.TYPE_CONTENT,
+                content={
+                    'blocks': [{
+                        'id': f'b{i}_1',
+                        'type': 'image',
+                        'x': 0, 'y': 0,
+                        'w': IMPORT_W, 'h': IMPORT_H,
+                        'zIndex': 1,
+                        'rotation': 0,
+                        'src': page_src(base_url, media_id, i),
+                        'alt': f'Страница {i + 1}',
+                    }],
+                },
+            )
+            for i in range(total)
+        ])
+        _update(task_id, status='done', processed=total)
+    except Exception as exc:
+        Lesson.objects.filter(id=lesson_id).delete()
+        _update(task_id, status='error', detail=f'Ошибка импорта: {exc}')
+        return
+    finally:
+        close_old_connections()
+
+    _warm(path, min(total, WARM_PAGES))
+
+
+def _warm(path, pages):
+    """Отрендерить первые pages страниц в кэш; ошибки прогрева не важны."""
+    fmt, quality = page_cache.FORMATS[0], page_cache.QUALITY_DEFAULT
+    executor = _get_executor()
+    futures = {
+        executor.submit(pdf_render.render_page, path, i, SLIDE_WIDTH, fmt, quality): i
+        for i in range(pages)
+    }
+    for future in as_completed(futures):
+        try:
+            page_cache.put_page(path, futures[future], SLIDE_WIDTH, fmt, quality, future.result())
+        except Exception:
+            continue
@@ -0,0 +1,44 @@
+"""
+Рендер страниц PDF (PyMuPDF) для импорта презентаций и учебников.
+
+Модуль без импортов Django: функции выполняются и в процессах пула
+lessons/pdf_import.py, которые стартуют через spawn и не настраивают Django.
+
+JPEG кодирует сам PyMuPDF; WebP — через Pillow, если он установлен.
+"""
+import io
+
+import fitz  # pymupdf
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow — необязательная зависимость, без неё только JPEG
+    Image = None
+
+FORMATS = ('webp', 'jpeg') if Image is not None else ('jpeg',)
+
+# Файла нет или это не PDF
+OPEN_ERRORS = (FileNotFoundError, fitz.FileDataError)
+
+
+def page_count(path):
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def render_page(path, index, width, fmt='jpeg', quality=80):
+    """
+    Страница index (с 0) файла path шириной width пикселей в формате fmt.
+    Бросает IndexError, если такой страницы нет.
+    """
+    with fitz.open(path) as doc:
+        if not 0 <= index < doc.page_count:
+            raise IndexError(index)
+        page = doc[index]
+        zoom = width / page.rect.width
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    if fmt == 'webp':
+        buf = io.BytesIO()
+        Image.frombytes('RGB', (pix.width, pix.height), pix.samples).save(buf, 'WEBP', quality=quality)
+        return buf.getvalue()
+    return pix.tobytes('jpeg', jpg_quality=quality)
@@ -0,0 +1,171 @@
+"""
+Живой агрегатор викторины для LessonSessionConsumer.
+
+Держит в памяти процесса по каждой сессии: сколько учеников ответило на вопрос,
+гистограмму выбранных вариантов и накопленные очки. Каждый ответ обновляет
+агрегатор за O(1), лидерборд и статистика читаются из него без запросов к БД.
+
+QuizAnswer остаётся долговременным хранилищем: после рестарта Daphne агрегатор
+лениво восстанавливается из БД при первом обращении к сессии.
+"""
+import threading
+from collections import OrderedDict
+
+from django.db.models import Count, Sum
+
+# Сколько сессий держать в памяти одновременно (LRU). Активных уроков в школе
+# заметно меньше, вытесненная сессия просто перечитается из БД.
+_MAX_SESSIONS = 64
+
+
+def _student_name(first_name, last_name, student_id):
+    return f'{first_name} {last_name}'.strip() or f'User {student_id}'
+
+
+class QuizAggregator:
+    """Счётчики одной сессии. Ключ вопроса — (slide_id, question_idx)."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self._answered = {}     # (slide_id, question_idx) → int
+        self._histograms = {}   # (slide_id, question_idx) → {str(option_index): int}
+        self._totals = {}       # student_id → {'id', 'name', 'points'}
+
+    def record(self, slide_id, question_idx, student_id, name, option_index, points, prev=None):
+        """
+        Учитывает ответ. prev — (option_index, points) предыдущего ответа этого
+        ученика на тот же вопрос, если он был: повторный ответ заменяет старый.
+        Ответы двух вкладок могут прийти сюда не в порядке коммитов, поэтому
+        счётчик варианта временно может уйти в минус — итог от порядка не зависит.
+        """
+        q_key = (int(slide_id), int(question_idx))
+        hist = self._histograms.setdefault(q_key, {})
+        total = self._totals.setdefault(student_id, {'id': student_id, 'name': name, 'points': 0})
+
+        if prev is None:
+            self._answered[q_key] = self._answered.get(q_key, 0) + 1
+        else:
+            prev_option, prev_points = prev
+            hist[str(prev_option)] = hist.get(str(prev_option), 0) - 1
+            if hist[str(prev_option)] == 0:
+                del hist[str(prev_option)]
+            total['points'] -= prev_points
+
+        hist[str(option_index)] = hist.get(str(option_index), 0) + 1
+        if hist[str(option_index)] == 0:
+            del hist[str(option_index)]
+        total['points'] += points
+        if name:
+            total['name'] = name
+        return self._answered.get(q_key, 0)
+
+    def answered_count(self, slide_id, question_idx):
+        return self._answered.get((int(slide_id), int(question_idx)), 0)
+
+    def answer_stats(self, slide_id, question_idx):
+        hist = self._histograms.get((int(slide_id), int(question_idx)), {})
+        return {option: n for option, n in hist.items() if n > 0}
+
+    def leaderboard(self):
+        return sorted((dict(t) for t in self._totals.values()), key=lambda x: -x['points'])
+
+
+_aggregators: 'OrderedDict[int, QuizAggregator]' = OrderedDict()
+_generation = 0   # растёт при drop_aggregator: восстановление, начатое до сброса, не сохраняется
+_lock = threading.Lock()
+
+
+# ── Агрегаты из БД (один GROUP BY на запрос) ─────────────────────────────────
+
+def db_leaderboard(session_id):
+    from .models import QuizAnswer
+
+    rows = (
+        QuizAnswer.objects.filter(session_id=session_id)
+        .values('student_id', 'student__first_name', 'student__last_name')
+        .annotate(total=Sum('points'))
+        .order_by('-total')
+    )
+    return [
+        {
+            'id': r['student_id'],
+            'name': _student_name(r['student__first_name'], r['student__last_name'], r['student_id']),
+            'points': r['total'] or 0,
+        }
+        for r in rows
+    ]
+
+
+def _build_from_db(session_id):
+    """Восстановить агрегатор двумя GROUP BY-запросами: гистограммы и лидерборд."""
+    from .models import QuizAnswer
+
+    agg = QuizAggregator(session_id)
+    rows = (
+        QuizAnswer.objects.filter(session_id=session_id)
+        .values('slide_id', 'question_idx', 'option_index')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for r in rows:
+        q_key = (r['slide_id'], r['question_idx'])
+        agg._answered[q_key] = agg._answered.get(q_key, 0) + r['n']
+        agg._histograms.setdefault(q_key, {})[str(r['option_index'])] = r['n']
+    for entry in db_leaderboard(session_id):
+        agg._totals[entry['id']] = entry
+    return agg
+
+
+def get_aggregator(session_id):
+    """
+    Агрегатор сессии; при отсутствии в памяти — восстановить из QuizAnswer.
+    Восстановление идёт без _lock, чтобы чтение БД одной сессии не задерживало
+    ответы и лидерборды остальных.
+    """
+    session_id = int(session_id)
+    with _lock:
+        agg = _aggregators.get(session_id)
+        if agg is not None:
+            _aggregators.move_to_end(session_id)
+            return agg
+        generation = _generation
+    agg = _build_from_db(session_id)
+    with _lock:
+        # Параллельный вызов мог успеть первым — в него уже идут ответы, берём его
+        current = _aggregators.get(session_id)
+        if current is not None:
+            return current
+        # Если сессию сбросили, пока агрегатор строился, — не сохраняем устаревший
+        if generation == _generation:
+            _aggregators[session_id] = agg
+            while len(_aggregators) > _MAX_SESSIONS:
+                _aggregators.popitem(last=False)
+    return agg
+
+
+def record_answer(session_id, slide_id, question_idx, student, option_index, points, prev=None):
+    """Учесть сохранённый в БД ответ ученика. Возвращает число ответивших на вопрос."""
+    agg = get_aggregator(session_id)
+    name = _student_name(student.first_name, student.last_name, student.id)
+    with _lock:
+        return agg.record(slide_id, question_idx, student.id, name, option_index, points, prev=prev)
+
+
+def leaderboard(session_id):
+    agg = get_aggregator(session_id)
+    with _lock:
+        return agg.leaderboard()
+
+
+def answer_stats(session_id, slide_id, question_idx):
+    agg = get_aggregator(session_id)
+    with _lock:
+        return agg.answer_stats(slide_id, question_idx)
+
+
+def drop_aggregator(session_id):
+    """Освободить память после завершения сессии."""
+    global _generation
+    with _lock:
+        _aggregators.pop(int(session_id), None)
+        _generation += 1
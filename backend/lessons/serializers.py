@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from . import page_cache
 from .models import Lesson, LessonFolder, Slide, LessonMedia, LessonSession, Textbook, LessonAssignment
 
 
@@ -132,18 +133,19 @@ class TextbookSerializer(serializers.ModelSerializer):
     subject_name = serializers.SerializerMethodField()
     grade_levels_data = serializers.SerializerMethodField()
     file_url = serializers.SerializerMethodField()
+    page_token = serializers.SerializerMethodField()
     uploaded_by_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Textbook
         fields = [
-            'id', 'title', 'file_url', 'original_name', 'file_size',
+            'id', 'title', 'file_url', 'page_count', 'page_token', 'original_name', 'file_size',
             'subject', 'subject_name',
             'grade_levels_data',
             'uploaded_by', 'uploaded_by_name',
             'created_at',
         ]
-        read_only_fields = ['uploaded_by', 'created_at']
+        read_only_fields = ['uploaded_by', 'page_count', 'created_at']
 
     def get_file_url(self, obj):
         request = self.context.get('request')
@@ -151,6 +153,10 @@ class TextbookSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.file.url) if request else obj.file.url
         return None
 
+    def get_page_token(self, obj):
+        # Подпись ?s= для рендера страниц (GET .../textbooks/<id>/pages/<n>/)
+        return page_cache.sign(f'textbook:{obj.id}')
+
     def get_subject_name(self, obj):
         return obj.subject.name if obj.subject else None
 
@@ -0,0 +1,26 @@
+"""Сброс кэша решений авторизации (core/authz.py) для уроков и сессий."""
+from django.db.models.signals import post_delete, post_save
+
+from core import authz
+from school.models import StudentProfile
+
+from .models import LessonAssignment, LessonSession
+
+
+def _invalidate_lesson(sender, instance, **kwargs):
+    # Новая/завершённая сессия класса или выдача урока меняют доступ к его слайдам
+    authz.invalidate('lesson', resource_id=instance.lesson_id)
+
+
+def _invalidate_student(sender, instance, **kwargs):
+    # Перевод ученика в другой класс
+    authz.invalidate('lesson', user_id=instance.user_id)
+    authz.invalidate('lesson_session', user_id=instance.user_id)
+
+
+for model in (LessonSession, LessonAssignment):
+    post_save.connect(_invalidate_lesson, sender=model, dispatch_uid=f'authz_save_{model.__name__}')
+    post_delete.connect(_invalidate_lesson, sender=model, dispatch_uid=f'authz_delete_{model.__name__}')
+
+post_save.connect(_invalidate_student, sender=StudentProfile, dispatch_uid='authz_lessons_student_save')
+post_delete.connect(_invalidate_student, sender=StudentProfile, dispatch_uid='authz_lessons_student_delete')
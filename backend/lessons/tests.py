@@ -0,0 +1,120 @@
+import uuid
+
+from core.testing import MigrationTestCase
+
+
+class QuizAnswerMigrationTests(MigrationTestCase):
+    app = 'lessons'
+    migrate_from = '0013_quizanswer'
+    migrate_to = '0014_quizanswer_from_formanswer'
+
+    def test_quiz_answers_move_and_return(self):
+        User = self.apps.get_model('accounts', 'User')
+        Lesson = self.apps.get_model('lessons', 'Lesson')
+        Slide = self.apps.get_model('lessons', 'Slide')
+        LessonSession = self.apps.get_model('lessons', 'LessonSession')
+        FormAnswer = self.apps.get_model('lessons', 'FormAnswer')
+
+        teacher, student = User.objects.create(username='teacher'), User.objects.create(username='student')
+        lesson = Lesson.objects.create(title='Дроби', owner=teacher)
+        quiz = Slide.objects.create(lesson=lesson, slide_type='quiz', order=0)
+        form = Slide.objects.create(lesson=lesson, slide_type='form', order=1)
+        session = LessonSession.objects.create(lesson=lesson, teacher=teacher)
+        FormAnswer.objects.create(session=session, slide=quiz, student=student, answers={
+            '0': {'option_index': 2, 'elapsed_ms': 1500, 'points': 870},
+            '1': {'option_index': 0},
+            'x': {'option_index': 1},
+            '2': 'битое значение',
+        })
+        form_answers = [{'question_id': 'q1', 'value': 'ответ'}]
+        FormAnswer.objects.create(session=session, slide=form, student=student, answers=form_answers)
+
+        apps = self.forward()
+        QuizAnswer = apps.get_model('lessons', 'QuizAnswer')
+        FormAnswer = apps.get_model('lessons', 'FormAnswer')
+        self.assertEqual(
+            list(QuizAnswer.objects.order_by('question_idx').values_list(
+                'session_id', 'slide_id', 'student_id', 'question_idx', 'option_index', 'elapsed_ms', 'points',
+            )),
+            [
+                (session.pk, quiz.pk, student.pk, 0, 2, 1500, 870),
+                (session.pk, quiz.pk, student.pk, 1, 0, 0, 0),
+            ],
+        )
+        # Ответы форм остаются в FormAnswer
+        self.assertEqual(list(FormAnswer.objects.values_list('slide_id', 'answers')), [(form.pk, form_answers)])
+
+        apps = self.backward()
+        FormAnswer = apps.get_model('lessons', 'FormAnswer')
+        self.assertEqual(FormAnswer.objects.get(slide_id=quiz.pk).answers, {
+            '0': {'option_index': 2, 'elapsed_ms': 1500, 'points': 870},
+            '1': {'option_index': 0, 'elapsed_ms': 0, 'points': 0},
+        })
+        self.assertEqual(FormAnswer.objects.get(slide_id=form.pk).answers, form_answers)
+
+
+class DiscussionMigrationTests(MigrationTestCase):
+    app = 'lessons'
+    migrate_from = '0015_discussion_sticker_arrow'
+    migrate_to = '0016_discussion_from_json'
+
+    def test_boards_move_to_rows_and_back(self):
+        User = self.apps.get_model('accounts', 'User')
+        Lesson = self.apps.get_model('lessons', 'Lesson')
+        Slide = self.apps.get_model('lessons', 'Slide')
+        LessonSession = self.apps.get_model('lessons', 'LessonSession')
+
+        teacher = User.objects.create(username='teacher')
+        lesson = Lesson.objects.create(title='Обсуждение', owner=teacher)
+        first, second = str(uuid.uuid4()), str(uuid.uuid4())
+        slide = Slide.objects.create(lesson=lesson, slide_type='discussion', content={
+            'topic': 'Зачем нужны дроби?',
+            'stickers': [
+                {'id': first, 'x': 10, 'y': 20, 'text': 'Делить пиццу', 'author_id': teacher.pk,
+                 'created_at': '2024-09-02T10:00:00+00:00'},
+                {'id': second, 'x': 'мусор', 'text': 'Проценты', 'author_id': 999999,
+                 'created_at': '2024-09-02T10:05:00+00:00'},
+            ],
+            'arrows': [
+                {'from_id': first, 'to_id': second},
+                {'from_id': first, 'to_id': 'нет такого'},
+            ],
+        })
+        session = LessonSession.objects.create(lesson=lesson, teacher=teacher, discussion_data={
+            str(slide.pk): {'topic': 'Тема урока', 'stickers': [{'text': 'без id'}]},
+            '999999': {'stickers': [{'text': 'слайда нет'}]},
+        })
+
+        apps = self.forward()
+        Slide = apps.get_model('lessons', 'Slide')
+        LessonSession = apps.get_model('lessons', 'LessonSession')
+        DiscussionSticker = apps.get_model('lessons', 'DiscussionSticker')
+        DiscussionArrow = apps.get_model('lessons', 'DiscussionArrow')
+        self.assertEqual(Slide.objects.get(pk=slide.pk).content, {'topic': 'Зачем нужны дроби?'})
+        self.assertEqual(
+            LessonSession.objects.get(pk=session.pk).discussion_data,
+            {str(slide.pk): {'topic': 'Тема урока'}},
+        )
+        editor = list(DiscussionSticker.objects.filter(session=None).order_by('created_at'))
+        self.assertEqual([str(s.id) for s in editor], [first, second])
+        self.assertEqual([(s.x, s.y) for s in editor], [(10, 20), (100, 100)])
+        self.assertEqual([s.author_id for s in editor], [teacher.pk, None])
+        self.assertEqual(
+            list(DiscussionArrow.objects.values_list('from_sticker_id', 'to_sticker_id')),
+            [(uuid.UUID(first), uuid.UUID(second))],
+        )
+        self.assertEqual(
+            list(DiscussionSticker.objects.filter(session_id=session.pk).values_list('text', flat=True)),
+            ['без id'],
+        )
+
+        apps = self.backward()
+        Slide = apps.get_model('lessons', 'Slide')
+        LessonSession = apps.get_model('lessons', 'LessonSession')
+        content = Slide.objects.get(pk=slide.pk).content
+        self.assertEqual(content['topic'], 'Зачем нужны дроби?')
+        self.assertEqual([s['id'] for s in content['stickers']], [first, second])
+        self.assertEqual([(a['from_id'], a['to_id']) for a in content['arrows']], [(first, second)])
+        board = LessonSession.objects.get(pk=session.pk).discussion_data[str(slide.pk)]
+        self.assertEqual(board['topic'], 'Тема урока')
+        self.assertEqual([s['text'] for s in board['stickers']], ['без id'])
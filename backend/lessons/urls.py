@@ -9,6 +9,7 @@ urlpatterns = [
 
     # Импорт
     path('import/', views.import_presentation),
+    path('import/<str:task_id>/', views.import_status),
 
     # Уроки
     path('lessons/', views.lesson_list_create),
@@ -17,6 +18,7 @@ urlpatterns = [
 
     # Медиафайлы
     path('lessons/<int:lesson_id>/upload/', views.upload_media),
+    path('media/<int:media_id>/pages/<int:page>/', views.lesson_media_page),
 
     # Слайды
     path('lessons/<int:lesson_id>/slides/', views.slide_list_create),
@@ -41,6 +43,7 @@ urlpatterns = [
     path('textbooks/', views.textbook_list_create),
     path('textbooks/grade-levels/', views.textbook_grade_levels),
     path('textbooks/<int:textbook_id>/', views.textbook_detail),
+    path('textbooks/<int:textbook_id>/pages/<int:page>/', views.textbook_page),
 
     # Выдача уроков (самостоятельное прохождение)
     path('assignments/', views.lesson_assignments),
@@ -1,5 +1,9 @@
 """Вспомогательные функции для lessons."""
 
+# Холст слайда, на который раскладываются импортированные PDF/PPTX
+IMPORT_W = 960
+IMPORT_H = 540
+
 
 def _has_correct(q):
     q_type = q.get('type', 'single')
@@ -195,3 +199,91 @@ def compute_form_results(slide, form_answers_qs):
         },
         'details': details,
     }
+
+
+def compute_quiz_results(slide, quiz_answers):
+    """
+    Сводка по викторине в том же формате, что и compute_form_results.
+
+    :param slide: Slide instance (slide_type='quiz')
+    :param quiz_answers: iterable QuizAnswer этого слайда с select_related('student')
+    :returns: dict {summary, details}
+    """
+    questions = (slide.content or {}).get('questions', [])
+    answers_list = list(quiz_answers)
+
+    per_question = []
+    total_correct = 0
+    total_with_correct = 0
+    for idx, q in enumerate(questions):
+        options = q.get('options', [])
+        correct = q.get('correct', -1)
+        has_correct = isinstance(correct, int) and 0 <= correct < len(options)
+        option_counts = [0] * len(options)
+        answer_count = 0
+        correct_count = 0
+        for qa in answers_list:
+            if qa.question_idx != idx:
+                continue
+            answer_count += 1
+            if 0 <= qa.option_index < len(option_counts):
+                option_counts[qa.option_index] += 1
+            if has_correct and qa.option_index == correct:
+                correct_count += 1
+        stat = {
+            'question_id': q.get('id', str(idx)),
+            'type': 'single',
+            'text': q.get('text', ''),
+            'answer_count': answer_count,
+            'has_correct': has_correct,
+            'options': options,
+            'option_counts': option_counts,
+        }
+        if has_correct:
+            stat['correct_count'] = correct_count
+            total_correct += correct_count
+            total_with_correct += answer_count
+        per_question.append(stat)
+
+    by_student = {}
+    for qa in answers_list:
+        entry = by_student.setdefault(qa.student_id, {'student': qa.student, 'answers': {}})
+        entry['answers'][qa.question_idx] = qa.option_index
+
+    details = []
+    for student_id, entry in by_student.items():
+        student = entry['student']
+        student_correct = 0
+        student_total = 0
+        q_results = []
+        for idx, q in enumerate(questions):
+            val = entry['answers'].get(idx)
+            is_correct = None
+            if val is not None and per_question[idx]['has_correct']:
+                is_correct = val == q.get('correct')
+                student_total += 1
+                if is_correct:
+                    student_correct += 1
+            q_results.append({
+                'question_id': per_question[idx]['question_id'],
+                'value': val,
+                'is_correct': is_correct,
+            })
+        details.append({
+            'student_id': student_id,
+            'student_name': f'{student.first_name} {student.last_name}'.strip(),
+            'answers': q_results,
+            'correct_count': student_correct,
+            'total_with_correct': student_total,
+        })
+
+    return {
+        'summary': {
+            'answered_count': len(by_student),
+            'total_questions': len(questions),
+            'total_correct': total_correct,
+            'total_with_correct': total_with_correct,
+            'per_question': per_question,
+        },
+        'details': details,
+    }
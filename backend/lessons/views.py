@@ -1,8 +1,9 @@
 from django.core.exceptions import ValidationError
 from django.db import models as django_models
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
 from django.utils import timezone
@@ -10,9 +11,10 @@ from accounts.permissions import PasswordChanged
 from core.validators import validate_file_mime, ALLOWED_IMAGES, ALLOWED_PDF, ALLOWED_EXCEL
 
 ALLOWED_PRESENTATION_FILES = ALLOWED_PDF + ['application/zip']  # PDF + PPTX (zip)
-from .models import Lesson, LessonFolder, Slide, LessonMedia, LessonSession, FormAnswer, VocabProgress, Textbook, TextbookAnnotation, LessonAssignment
+from .models import Lesson, LessonFolder, Slide, LessonMedia, LessonSession, FormAnswer, QuizAnswer, VocabProgress, Textbook, TextbookAnnotation, LessonAssignment
 from .serializers import LessonFolderSerializer, LessonSerializer, SlideSerializer, LessonMediaSerializer, LessonSessionSerializer, TextbookSerializer, LessonAssignmentSerializer
-from .utils import compute_form_results
+from . import consumers as lesson_consumers, page_cache, pdf_import, pdf_render, quiz
+from .utils import IMPORT_H, IMPORT_W, compute_form_results, compute_quiz_results
 
 
 def _ctx(request):
@@ -172,8 +174,6 @@ def lesson_detail(request, lesson_id):
 
 # ─── Импорт презентаций ───────────────────────────────────────────────────────
 
-_IMPORT_W = 960
-_IMPORT_H = 540
 # Имена тем, которые не несут реального имени шрифта
 _THEME_FONT_PLACEHOLDERS = {'+mj-lt', '+mn-lt', '+mj-ea', '+mn-ea', '+mj-cs', '+mn-cs'}
 
@@ -611,46 +611,6 @@ def _canvas_shape(shape) -> str:
     return 'rect'
 
 
-# ── PDF ───────────────────────────────────────────────────────────────────────
-
-def _import_pdf(request, lesson, file_obj):
-    """Импорт PDF: каждая страница → content-слайд с блоком-изображением на весь холст."""
-    import fitz  # pymupdf
-    from django.core.files.base import ContentFile
-
-    data = file_obj.read()
-    doc = fitz.open(stream=data, filetype='pdf')
-    try:
-        for i, page in enumerate(doc):
-            mat = fitz.Matrix(2, 2)  # 2× для чёткости
-            pix = page.get_pixmap(matrix=mat)
-            img_bytes = pix.tobytes('png')
-
-            media = LessonMedia(lesson=lesson)
-            media.file.save(f'page_{i + 1}.png', ContentFile(img_bytes), save=True)
-            img_url = request.build_absolute_uri(media.file.url)
-
-            Slide.objects.create(
-                lesson=lesson,
-                order=i,
-                slide_type=Slide.TYPE_CONTENT,
-                content={
-                    'blocks': [{
-                        'id': f'b{i}_1',
-                        'type': 'image',
-                        'x': 0, 'y': 0,
-                        'w': _IMPORT_W, 'h': _IMPORT_H,
-                        'zIndex': 1,
-                        'rotation': 0,
-                        'src': img_url,
-                        'alt': f'Страница {i + 1}',
-                    }],
-                },
-            )
-    finally:
-        doc.close()
-
-
 # ── PPTX ──────────────────────────────────────────────────────────────────────
 
 def _import_pptx(request, lesson, file_obj):
@@ -677,10 +637,10 @@ def _import_pptx(request, lesson, file_obj):
 
         for shape in pptx_slide.shapes:
             try:
-                x = int(shape.left / slide_w * _IMPORT_W)
-                y = int(shape.top  / slide_h * _IMPORT_H)
-                w = max(50, int(shape.width  / slide_w * _IMPORT_W))
-                h = max(20, int(shape.height / slide_h * _IMPORT_H))
+                x = int(shape.left / slide_w * IMPORT_W)
+                y = int(shape.top  / slide_h * IMPORT_H)
+                w = max(50, int(shape.width  / slide_w * IMPORT_W))
+                h = max(20, int(shape.height / slide_h * IMPORT_H))
                 rotation = float(getattr(shape, 'rotation', 0) or 0)
                 stype = getattr(shape, 'shape_type', None)
 
@@ -693,7 +653,7 @@ def _import_pptx(request, lesson, file_obj):
                     blocks.append({
                         'id': f'b{i}_{idx}', 'type': 'image',
                         'x': max(0, x), 'y': max(0, y),
-                        'w': min(w, _IMPORT_W), 'h': min(h, _IMPORT_H),
+                        'w': min(w, IMPORT_W), 'h': min(h, IMPORT_H),
                         'zIndex': idx, 'rotation': rotation,
                         'src': request.build_absolute_uri(media.file.url), 'alt': '',
                     })
@@ -708,7 +668,7 @@ def _import_pptx(request, lesson, file_obj):
                             'id': f'b{i}_{idx}', 'type': 'shape',
                             'shape': _canvas_shape(shape),
                             'x': max(0, x), 'y': max(0, y),
-                            'w': min(w, _IMPORT_W), 'h': min(h, _IMPORT_H),
+                            'w': min(w, IMPORT_W), 'h': min(h, IMPORT_H),
                             'zIndex': idx, 'rotation': rotation,
                             'fillColor': fc, 'strokeColor': sc, 'strokeWidth': sw,
                         })
@@ -723,7 +683,7 @@ def _import_pptx(request, lesson, file_obj):
                         blocks.append({
                             'id': f'b{i}_{idx}', 'type': 'text',
                             'x': max(0, x), 'y': max(0, y),
-                            'w': min(w, _IMPORT_W), 'h': min(h, _IMPORT_H),
+                            'w': min(w, IMPORT_W), 'h': min(h, IMPORT_H),
                             'zIndex': idx, 'rotation': rotation,
                             'html': html,
                         })
@@ -777,9 +737,13 @@ def import_presentation(request):
 
     try:
         if ext == 'pdf':
-            _import_pdf(request, lesson, file)
-        else:
-            _import_pptx(request, lesson, file)
+            # Страницы рендерятся в фоне — прогресс по GET /lessons/import/<task_id>/
+            task_id = pdf_import.start(request, lesson, file)
+            return Response({
+                'task_id': task_id,
+                'lesson': LessonSerializer(lesson, context=_ctx(request)).data,
+            }, status=202)
+        _import_pptx(request, lesson, file)
     except Exception as e:
         lesson.delete()
         return Response({'error': f'Ошибка импорта: {str(e)}'}, status=500)
@@ -787,6 +751,16 @@ def import_presentation(request):
     return Response(LessonSerializer(lesson, context=_ctx(request)).data, status=201)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, PasswordChanged])
+def import_status(request, task_id):
+    """GET /lessons/import/<task_id>/ — {status: running/done/error, lesson, processed, total, detail?}."""
+    task = pdf_import.get_task(task_id, request.user)
+    if task is None:
+        return Response({'error': 'Задача не найдена'}, status=404)
+    return Response(task)
+
+
 # ─── Слайды ───────────────────────────────────────────────────────────────────
 
 def _can_edit_lesson(lesson, user):
@@ -984,12 +958,23 @@ def session_detail(request, session_id):
         return Response({'error': 'Нет доступа'}, status=403)
 
     if request.method == 'PATCH':
+        events = []
+        if 'current_slide' in request.data:
+            slide_id = request.data['current_slide']
+            if slide_id is not None and str(slide_id) != str(session.current_slide_id):
+                events.append({'type': 'slide_changed', 'slide_id': slide_id})
+            session.current_slide_id = slide_id
         if 'is_active' in request.data and not request.data['is_active']:
+            if session.is_active:
+                events.append({'type': 'session_ended'})
             session.is_active = False
             session.ended_at = timezone.now()
-        if 'current_slide' in request.data:
-            session.current_slide_id = request.data['current_slide']
         session.save()
+        # Подключённые по WS клиенты держат снимок сессии — сообщаем им, как это делает ведущий
+        for event in events:
+            lesson_consumers.broadcast_session_event(session.id, event)
+        if not session.is_active:
+            quiz.drop_aggregator(session.id)
         return Response(LessonSessionSerializer(session, context=_ctx(request)).data)
 
     if request.method == 'DELETE':
@@ -1180,6 +1165,12 @@ def textbook_list_create(request):
         subject_id=subject_id,
         uploaded_by=request.user,
     )
+    # Число страниц — один раз при загрузке, а не при каждой сериализации списка
+    try:
+        textbook.page_count = pdf_render.page_count(textbook.file.path)
+        textbook.save(update_fields=['page_count'])
+    except pdf_render.OPEN_ERRORS:
+        pass
     if grade_level_ids:
         textbook.grade_levels.set([int(g) for g in grade_level_ids])
 
@@ -1225,6 +1216,65 @@ def textbook_detail(request, textbook_id):
     return Response(status=204)
 
 
+def _pdf_page_response(request, resource, path, page):
+    """
+    Страница page (с 1) PDF-файла path картинкой: ?w= — ширина (округляется вверх
+    до page_cache.WIDTHS), ?fmt=webp|jpeg (по умолчанию webp, если его принимает
+    браузер и он доступен), ?q= — качество (округляется вверх до page_cache.QUALITIES),
+    ?s= — подпись resource; без неё отдаются только страницы из кэша.
+    """
+    try:
+        width = page_cache.snap_width(int(request.query_params.get('w', 960)))
+        quality = page_cache.snap_quality(int(request.query_params.get('q', page_cache.QUALITY_DEFAULT)))
+    except ValueError:
+        return Response({'error': 'Некорректные параметры'}, status=400)
+    fmt = request.query_params.get('fmt')
+    if fmt is None:
+        accepts_webp = 'image/webp' in request.headers.get('Accept', '')
+        fmt = 'webp' if accepts_webp and 'webp' in page_cache.FORMATS else 'jpeg'
+    if fmt not in page_cache.FORMATS:
+        return Response({'error': f'Поддерживаемые форматы: {", ".join(page_cache.FORMATS)}'}, status=400)
+
+    try:
+        key = page_cache.page_key(path, page - 1, width, fmt, quality)
+        etag = f'"{key}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponse(status=304)
+        else:
+            signed = page_cache.check_signature(resource, request.query_params.get('s'))
+            data = page_cache.get_page(path, page - 1, width, fmt, quality, key=key, render=signed)
+            if data is None:
+                return Response({'error': 'Нет доступа'}, status=403)
+            response = HttpResponse(data, content_type=f'image/{fmt}')
+    except (FileNotFoundError, IndexError):
+        return Response({'error': 'Страница не найдена'}, status=404)
+    except page_cache.RenderBusy:
+        return Response({'error': 'Сервер занят, повторите позже'}, status=503, headers={'Retry-After': '5'})
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=86400'
+    response['Vary'] = 'Accept'
+    return response
+
+
+# Картинки страниц грузятся тегом <img> без JWT — доступ как у самих файлов в /media/
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def lesson_media_page(request, media_id, page):
+    """GET /lessons/media/<media_id>/pages/<page>/ — страница PDF, импортированного в урок."""
+    media = get_object_or_404(LessonMedia, id=media_id)
+    if not media.file.name.lower().endswith('.pdf'):
+        return Response({'error': 'Файл не PDF'}, status=404)
+    return _pdf_page_response(request, f'media:{media.id}', media.file.path, page)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def textbook_page(request, textbook_id, page):
+    """GET /lessons/textbooks/<textbook_id>/pages/<page>/ — страница учебника."""
+    textbook = get_object_or_404(Textbook, id=textbook_id)
+    return _pdf_page_response(request, f'textbook:{textbook.id}', textbook.file.path, page)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, PasswordChanged])
 def textbook_grade_levels(request):
@@ -1363,12 +1413,16 @@ def session_stats(request, session_id):
 
     slides = Slide.objects.filter(lesson=session.lesson).order_by('order', 'id')
     form_answers = FormAnswer.objects.filter(session=session).select_related('student', 'slide')
+    quiz_answers = QuizAnswer.objects.filter(session=session).select_related('student')
 
     slides_stats = []
     for slide in slides:
         if slide.slide_type in ('form', 'quiz'):
-            slide_fas = [fa for fa in form_answers if fa.slide_id == slide.id]
-            results = compute_form_results(slide, slide_fas)
+            if slide.slide_type == 'quiz':
+                results = compute_quiz_results(slide, [qa for qa in quiz_answers if qa.slide_id == slide.id])
+            else:
+                slide_fas = [fa for fa in form_answers if fa.slide_id == slide.id]
+                results = compute_form_results(slide, slide_fas)
             slides_stats.append({
                 'slide_id': slide.id,
                 'slide_type': slide.slide_type,
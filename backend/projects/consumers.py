@@ -5,12 +5,30 @@ from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.utils import timezone
 
-from groups.models import StudentChatRestriction
+from core import authz, frames
+from groups import restrictions
 from .models import Project, ProjectMember, ProjectPost
 from .serializers import ProjectPostSerializer
 
 _URL_PATTERN = re.compile(r'https?://|www\.', re.IGNORECASE)
 
+# Событие группы project_{id} → тип кадра для клиента
+CLIENT_FRAME_TYPES = {
+    'project_post_new': 'post_new',
+    'project_post_deleted': 'post_deleted',
+    'project_post_updated': 'post_updated',
+    'project_user_typing': 'user_typing',
+    'project_assignment_updated': 'assignment_updated',
+    'project_submission_updated': 'submission_updated',
+}
+
+
+def group_event(event):
+    """Событие группы проекта с кадром, закодированным один раз для всех получателей."""
+    frame = {'type': CLIENT_FRAME_TYPES[event['type']], **{k: v for k, v in event.items() if k != 'type'}}
+    route = {'user_id': event['user_id']} if event['type'] == 'project_user_typing' else {}
+    return frames.group_event(event['type'], frame, **route)
+
 
 class ProjectConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -58,7 +76,7 @@ class ProjectConsumer(AsyncWebsocketConsumer):
             serialized = await self.serialize_post(post)
             await self.channel_layer.group_send(
                 self.group_name,
-                {'type': 'project_post_new', 'post': serialized},
+                group_event({'type': 'project_post_new', 'post': serialized}),
             )
 
         elif msg_type == 'typing':
@@ -68,75 +86,55 @@ class ProjectConsumer(AsyncWebsocketConsumer):
             )
             await self.channel_layer.group_send(
                 self.group_name,
-                {
+                group_event({
                     'type': 'project_user_typing',
                     'user_id': self.user.id,
                     'display_name': display_name,
-                },
+                }),
             )
 
     # ─── Event handlers ────────────────────────────────────────────────────────
+    # Кадр уже закодирован отправителем (group_event) — пересылаем как есть.
 
     async def project_post_new(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'post_new',
-            'post': event['post'],
-        }))
+        await self.send(text_data=event['frame'])
 
     async def project_post_deleted(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'post_deleted',
-            'post_id': event['post_id'],
-        }))
+        await self.send(text_data=event['frame'])
 
     async def project_post_updated(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'post_updated',
-            'post': event['post'],
-        }))
+        await self.send(text_data=event['frame'])
 
     async def project_user_typing(self, event):
         if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({
-                'type': 'user_typing',
-                'user_id': event['user_id'],
-                'display_name': event['display_name'],
-            }))
+            await self.send(text_data=event['frame'])
 
     async def project_assignment_updated(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'assignment_updated',
-            'assignment_id': event['assignment_id'],
-        }))
+        await self.send(text_data=event['frame'])
 
     async def project_submission_updated(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'submission_updated',
-            'assignment_id': event['assignment_id'],
-            'student_id': event['student_id'],
-        }))
+        await self.send(text_data=event['frame'])
 
     # ─── DB helpers ────────────────────────────────────────────────────────────
 
     @sync_to_async
     def check_membership(self):
-        try:
-            project = Project.objects.get(id=self.project_id)
-            return (
-                self.user.is_admin
-                or project.members_rel.filter(user=self.user).exists()
-            )
-        except Project.DoesNotExist:
-            return False
+        if self.user.is_admin:
+            return Project.objects.filter(id=self.project_id).exists()
+        return authz.check('project', self.user.id, self.project_id, lambda: (
+            ProjectMember.objects.filter(project_id=self.project_id, user=self.user).exists()
+        ))
 
     @sync_to_async
     def save_post(self, text):
         project = Project.objects.get(id=self.project_id)
-        return ProjectPost.objects.create(
+        post = ProjectPost.objects.create(
             project=project,
             author=self.user,
             text=text,
         )
+        restrictions.note_sent('project', self.user.id, post.created_at)
+        return post
 
     @sync_to_async
     def serialize_post(self, post):
@@ -146,9 +144,8 @@ class ProjectConsumer(AsyncWebsocketConsumer):
     @sync_to_async
     def check_restrictions(self, text):
         """Возвращает строку с ошибкой если ученик нарушает ограничения, иначе None."""
-        try:
-            r = StudentChatRestriction.objects.get(student=self.user)
-        except StudentChatRestriction.DoesNotExist:
+        r = restrictions.get_restriction(self.user.id)
+        if r is None:
             return None
 
         now = timezone.now()
@@ -165,11 +162,12 @@ class ProjectConsumer(AsyncWebsocketConsumer):
 
         # Cooldown (считаем по постам проекта)
         if r.message_cooldown > 0:
-            last_post = ProjectPost.objects.filter(
-                author=self.user
-            ).order_by('-created_at').first()
-            if last_post:
-                elapsed = (now - last_post.created_at).total_seconds()
+            last_sent = restrictions.last_sent_at('project', self.user.id, lambda: (
+                ProjectPost.objects.filter(author=self.user)
+                .order_by('-created_at').values_list('created_at', flat=True).first()
+            ))
+            if last_sent:
+                elapsed = (now - last_sent).total_seconds()
                 if elapsed < r.message_cooldown:
                     wait = int(r.message_cooldown - elapsed) + 1
                     return f'Подождите {wait} сек. перед следующим сообщением.'
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-16 22:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_add_submission_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='projectpost',
+            index=models.Index(fields=['project', 'created_at', 'id'], name='projects_pr_project_7096b5_idx'),
+        ),
+    ]
@@ -62,6 +62,10 @@ class ProjectPost(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Keyset-пагинация ленты: core.pagination.keyset_page
+            models.Index(fields=['project', 'created_at', 'id']),
+        ]
 
     def __str__(self):
         return f'Пост в {self.project} от {self.author}'
@@ -0,0 +1,82 @@
+"""
+Участники проекта и задачи учеников по заданиям.
+
+Каждый ученик проекта получает по каждому заданию Task и AssignmentSubmission,
+связанные друг с другом. При добавлении участников или задания они создаются
+пакетными вставками, а не парой INSERT на каждое (задание, ученик).
+"""
+from django.db import transaction
+
+from core import authz, membership
+from tasks.models import Task
+
+from .models import AssignmentSubmission, ProjectMember
+
+
+def create_tasks_for_students(assignments, students, teacher):
+    """
+    Создать Task и AssignmentSubmission для всех пар (задание, ученик), у которых
+    задачи ещё нет; существующей сдаче без задачи задача привязывается.
+    """
+    assignments, students = list(assignments), list(students)
+    if not assignments or not students:
+        return
+    with transaction.atomic():
+        existing = {
+            (assignment_id, student_id): (submission_id, task_id)
+            for submission_id, assignment_id, student_id, task_id in AssignmentSubmission.objects.filter(
+                assignment__in=assignments, student__in=students,
+            ).values_list('id', 'assignment_id', 'student_id', 'task_id')
+        }
+        pairs = [
+            (assignment, student)
+            for assignment in assignments
+            for student in students
+            if existing.get((assignment.id, student.id), (None, None))[1] is None
+        ]
+        if not pairs:
+            return
+        tasks = Task.objects.bulk_create([
+            Task(
+                title=assignment.title,
+                description=assignment.description or '',
+                created_by=teacher,
+                assigned_to=student,
+                status=Task.STATUS_NEW,
+                due_date=assignment.due_date,
+            )
+            for assignment, student in pairs
+        ], batch_size=membership.BATCH_SIZE)
+        to_link, to_create = [], []
+        for (assignment, student), task in zip(pairs, tasks):
+            submission = existing.get((assignment.id, student.id))
+            if submission:
+                to_link.append(AssignmentSubmission(id=submission[0], task=task))
+            else:
+                to_create.append(AssignmentSubmission(assignment=assignment, student=student, task=task))
+        AssignmentSubmission.objects.bulk_update(to_link, ['task'], batch_size=membership.BATCH_SIZE)
+        AssignmentSubmission.objects.bulk_create(to_create, batch_size=membership.BATCH_SIZE)
+
+
+def add_members(project, user_ids, teacher, role=None):
+    """
+    Добавить в проект пользователей по списку id. role=None — роль по пользователю
+    (учитель/админ → учитель, остальные → ученик). Новым ученикам создаются задачи
+    по всем заданиям проекта. Всё в одной транзакции; возвращает новые ProjectMember.
+    """
+    def build(user):
+        member_role = role
+        if member_role is None:
+            member_role = ProjectMember.ROLE_TEACHER if (user.is_teacher or user.is_admin) else ProjectMember.ROLE_STUDENT
+        return ProjectMember(project=project, user=user, role=member_role)
+
+    users = membership.resolve_users(user_ids)
+    with transaction.atomic():
+        added = membership.add_members(ProjectMember, 'project', project, users, build)
+        students = [member.user for member in added if member.role == ProjectMember.ROLE_STUDENT]
+        create_tasks_for_students(project.assignments.all(), students, teacher)
+    if added:
+        # bulk_create не шлёт post_save (projects/signals.py)
+        for kind in ('project', 'project_teacher'):
+            authz.invalidate(kind, resource_id=project.id)
+    return added
@@ -0,0 +1,21 @@
+"""Сброс кэша решений авторизации (core/authz.py) при изменении участников проекта."""
+from django.db.models.signals import post_delete, post_save
+
+from core import authz
+
+from .models import Project, ProjectMember
+
+
+def _invalidate_member(sender, instance, **kwargs):
+    for kind in ('project', 'project_teacher'):
+        authz.invalidate(kind, resource_id=instance.project_id, user_id=instance.user_id)
+
+
+def _invalidate_project(sender, instance, **kwargs):
+    for kind in ('project', 'project_teacher'):
+        authz.invalidate(kind, resource_id=instance.id)
+
+
+post_save.connect(_invalidate_member, sender=ProjectMember, dispatch_uid='authz_project_member_save')
+post_delete.connect(_invalidate_member, sender=ProjectMember, dispatch_uid='authz_project_member_delete')
+post_delete.connect(_invalidate_project, sender=Project, dispatch_uid='authz_project_delete')
@@ -11,11 +11,15 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from accounts.permissions import PasswordChanged
+from core import authz
+from core.pagination import InvalidCursor, keyset_page
 from core.validators import validate_file_mime, ALLOWED_IMAGES, ALLOWED_PDF, ALLOWED_EXCEL
-from groups.models import StudentChatRestriction
+from groups import restrictions
 
 ALLOWED_PROJECT_FILES = ALLOWED_IMAGES + ALLOWED_PDF + ALLOWED_EXCEL
 from tasks.models import Task
+from . import services
+from .consumers import group_event
 from .models import (
     Project, ProjectMember, ProjectPost, PostAttachment,
     ProjectAssignment, AssignmentAttachment, AssignmentSubmission, SubmissionFile,
@@ -46,47 +50,23 @@ def _append_event(submission, event_type, author, comment=''):
 def broadcast_project(project_id, event):
     """Отправить событие всем WebSocket-клиентам проекта."""
     channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(f'project_{project_id}', event)
-
-
-def _create_task_for_student(assignment, student, teacher):
-    """Создать Task для студента по заданию (если ещё нет) и создать/обновить AssignmentSubmission."""
-    # Если submission с task уже есть — не дублируем
-    existing = AssignmentSubmission.objects.filter(
-        assignment=assignment, student=student
-    ).first()
-    if existing and existing.task_id:
-        return existing
-
-    task = Task.objects.create(
-        title=assignment.title,
-        description=assignment.description or '',
-        created_by=teacher,
-        assigned_to=student,
-        status=Task.STATUS_NEW,
-        due_date=assignment.due_date,
-    )
-
-    if existing:
-        existing.task = task
-        existing.save(update_fields=['task'])
-        return existing
-    else:
-        return AssignmentSubmission.objects.create(
-            assignment=assignment,
-            student=student,
-            task=task,
-        )
+    async_to_sync(channel_layer.group_send)(f'project_{project_id}', group_event(event))
 
 
 def _is_member(project, user):
-    return user.is_admin or project.members_rel.filter(user=user).exists()
+    return user.is_admin or authz.check(
+        'project', user.id, project.id,
+        lambda: project.members_rel.filter(user=user).exists(),
+    )
 
 
 def _is_teacher_in_project(project, user):
     if user.is_admin:
         return True
-    return project.members_rel.filter(user=user, role=ProjectMember.ROLE_TEACHER).exists()
+    return authz.check(
+        'project_teacher', user.id, project.id,
+        lambda: project.members_rel.filter(user=user, role=ProjectMember.ROLE_TEACHER).exists(),
+    )
 
 
 def _get_project(pk, user, require_teacher=False):
@@ -228,9 +208,7 @@ class ProjectMembersView(APIView):
             member.save()
         # Если добавляем студента — создаём Tasks для всех существующих заданий
         if role == ProjectMember.ROLE_STUDENT:
-            teacher = project.created_by or request.user
-            for assignment in project.assignments.all():
-                _create_task_for_student(assignment, user, teacher)
+            services.create_tasks_for_students(project.assignments.all(), [user], project.created_by or request.user)
         serializer = ProjectMemberSerializer(member)
         return Response(serializer.data, status=201 if created else 200)
 
@@ -243,25 +221,10 @@ class ProjectMembersBulkView(APIView):
         project, err = _get_project(pk, request.user, require_teacher=True)
         if err:
             return err
-        user_ids = request.data.get('user_ids', [])
-        added = []
-        for uid in user_ids:
-            try:
-                user = User.objects.get(pk=uid)
-            except User.DoesNotExist:
-                continue
-            role = ProjectMember.ROLE_TEACHER if (user.is_teacher or user.is_admin) else ProjectMember.ROLE_STUDENT
-            member, created = ProjectMember.objects.get_or_create(
-                project=project, user=user,
-                defaults={'role': role},
-            )
-            if created:
-                if role == ProjectMember.ROLE_STUDENT:
-                    teacher = project.created_by or request.user
-                    for assignment in project.assignments.all():
-                        _create_task_for_student(assignment, user, teacher)
-                added.append(ProjectMemberSerializer(member).data)
-        return Response({'added': added}, status=201)
+        added = services.add_members(
+            project, request.data.get('user_ids', []), teacher=project.created_by or request.user,
+        )
+        return Response({'added': ProjectMemberSerializer(added, many=True).data}, status=201)
 
 
 class ProjectMemberDetailView(APIView):
@@ -291,17 +254,23 @@ class ProjectPostListView(APIView):
         project, err = _get_project(pk, request.user)
         if err:
             return err
-        before = request.query_params.get('before')
         qs = project.posts.select_related('author').prefetch_related('attachments')
-        if before:
-            try:
-                qs = qs.filter(id__lt=int(before))
-            except (ValueError, TypeError):
-                pass
-        posts = list(qs.order_by('-created_at')[:50])
-        posts.reverse()
-        serializer = ProjectPostSerializer(posts, many=True)
-        return Response({'results': serializer.data, 'has_more': qs.count() > 50})
+        try:
+            page = keyset_page(
+                qs,
+                before=request.query_params.get('before'),
+                after=request.query_params.get('after'),
+                limit=50,
+            )
+        except InvalidCursor:
+            return Response({'detail': 'Некорректный курсор.'}, status=400)
+        serializer = ProjectPostSerializer(page['items'], many=True)
+        return Response({
+            'results': serializer.data,
+            'has_more': page['has_more'],
+            'prev_cursor': page['prev_cursor'],
+            'next_cursor': page['next_cursor'],
+        })
 
     def post(self, request, pk):
         project, err = _get_project(pk, request.user)
@@ -311,6 +280,7 @@ class ProjectPostListView(APIView):
         if not text:
             return Response({'detail': 'Текст обязателен.'}, status=400)
         post = ProjectPost.objects.create(project=project, author=request.user, text=text)
+        restrictions.note_sent('project', request.user.id, post.created_at)
         serialized = ProjectPostSerializer(post).data
         broadcast_project(pk, {'type': 'project_post_new', 'post': serialized})
         return Response(serialized, status=201)
@@ -353,12 +323,9 @@ class ProjectPostFileView(APIView):
             return Response({'detail': 'Нет прав.'}, status=403)
         # Проверяем ограничение на файлы для учеников
         if request.user.is_student:
-            try:
-                restriction = StudentChatRestriction.objects.get(student=request.user)
-                if restriction.no_files:
-                    return Response({'detail': 'Вам запрещено отправлять файлы.'}, status=403)
-            except StudentChatRestriction.DoesNotExist:
-                pass
+            restriction = restrictions.get_restriction(request.user.id)
+            if restriction and restriction.no_files:
+                return Response({'detail': 'Вам запрещено отправлять файлы.'}, status=403)
         f = request.FILES.get('file')
         if not f:
             return Response({'detail': 'Файл обязателен.'}, status=400)
@@ -413,11 +380,11 @@ class ProjectAssignmentListView(APIView):
             created_by=request.user,
         )
         # Автоматически создаём Task для каждого студента в проекте
-        student_members = project.members_rel.filter(
-            role=ProjectMember.ROLE_STUDENT
-        ).select_related('user')
-        for member in student_members:
-            _create_task_for_student(assignment, member.user, request.user)
+        students = User.objects.filter(
+            project_memberships__project=project,
+            project_memberships__role=ProjectMember.ROLE_STUDENT,
+        )
+        services.create_tasks_for_students([assignment], students, request.user)
         serializer = ProjectAssignmentSerializer(assignment, context={'request': request})
         broadcast_project(pk, {'type': 'project_assignment_updated', 'assignment_id': assignment.id})
         return Response(serializer.data, status=201)
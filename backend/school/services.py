@@ -2,6 +2,7 @@ import datetime
 
 from django.contrib.auth.hashers import make_password
 from accounts.services import create_user_with_temp_password, generate_password, parse_import_file
+from accounts import user_cache
 from accounts.models import User
 from .models import GradeLevel, SchoolClass, StudentProfile, ParentProfile
 
@@ -306,6 +307,8 @@ def import_students_from_excel_streaming(file):
         # Bulk update existing
         if users_to_update:
             User.objects.bulk_update(users_to_update, ['first_name', 'last_name', 'birth_date'])
+            for u in users_to_update:
+                user_cache.invalidate(u.id)
         if profiles_to_update:
             StudentProfile.objects.bulk_update(
                 profiles_to_update, ['school_class', 'personal_file_number']
@@ -334,6 +337,10 @@ def import_students_from_excel_streaming(file):
             'updated': updated_count,
         }
 
+    # bulk_create/bulk_update не шлют сигналов — сбросить граф собеседников чата вручную
+    from groups.eligibility import invalidate as invalidate_dm_graph
+    invalidate_dm_graph()
+
     yield {'type': 'done', 'created': created_count, 'updated': updated_count, 'errors': errors}
 
 
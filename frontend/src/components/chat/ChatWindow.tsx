@@ -24,6 +24,55 @@ function formatDateLabel(iso: string) {
   return d.toLocaleDateString('ru-RU', { day: 'numeric', month: 'long', year: 'numeric' });
 }
 
+// Сервер рассылает «печатает» не чаще раза в 2.5 с (groups/receipts.py TYPING_INTERVAL_SEC),
+// поэтому индикатор держится дольше интервала и продлевается каждым событием.
+const TYPING_INDICATOR_MS = 4000;
+
+// Изменения опроса и реакций приходят дельтой (только затронутые варианты / emoji
+// с новыми счётчиками) — и в ответе REST, и по WS. Применение идемпотентно.
+interface PollDelta {
+  poll_id: number;
+  voter: { id: number; name: string };
+  options: { id: number; vote_count: number; voted: boolean }[];
+  total_votes: number;
+}
+
+interface ReactionDelta {
+  message_id: number;
+  user_id: number;
+  changes: { emoji: string; count: number; reacted: boolean }[];
+}
+
+function applyPollDelta(poll: ChatPoll, delta: PollDelta, myId?: number): ChatPoll {
+  const isMe = delta.voter.id === myId;
+  return {
+    ...poll,
+    total_votes: delta.total_votes,
+    options: poll.options.map((opt) => {
+      const upd = delta.options.find((o) => o.id === opt.id);
+      if (!upd) return opt;
+      const others = opt.voters.filter((v) => v.id !== delta.voter.id);
+      return {
+        ...opt,
+        vote_count: upd.vote_count,
+        voters: upd.voted ? [...others, delta.voter] : others,
+        user_voted: isMe ? upd.voted : opt.user_voted,
+      };
+    }),
+  };
+}
+
+function applyReactionDelta(reactions: ChatReactionSummary[], delta: ReactionDelta, myId?: number) {
+  const isMe = delta.user_id === myId;
+  const result = reactions.filter((r) => !delta.changes.some((c) => c.emoji === r.emoji));
+  delta.changes.forEach((c) => {
+    if (c.count <= 0) return;
+    const prev = reactions.find((r) => r.emoji === c.emoji);
+    result.push({ emoji: c.emoji, count: c.count, user_reacted: isMe ? c.reacted : !!prev?.user_reacted });
+  });
+  return result.sort((a, b) => (a.emoji < b.emoji ? -1 : a.emoji > b.emoji ? 1 : 0));
+}
+
 function groupByDate(messages: ChatMessage[]) {
   const groups: { date: string; messages: ChatMessage[] }[] = [];
   messages.forEach((msg) => {
@@ -42,6 +91,8 @@ export default function ChatWindow({ room, onRoomUpdated, onNewMessage, onOpenLi
   const { user } = useAuth();
   const [messages, setMessages] = useState<ChatMessage[]>([]);
   const [hasMore, setHasMore] = useState(false);
+  // Курсор самой старой загруженной страницы (keyset-пагинация на бэкенде)
+  const olderCursorRef = useRef<string | null>(null);
   const [loadingHistory, setLoadingHistory] = useState(true);
   const [loadingMore, setLoadingMore] = useState(false);
   const [input, setInput] = useState('');
@@ -73,6 +124,7 @@ export default function ChatWindow({ room, onRoomUpdated, onNewMessage, onOpenLi
   const reconnectRef = useRef<ReturnType<typeof setTimeout> | null>(null);
   const roomIdRef = useRef(room.id);
   const typingTimerRef = useRef<ReturnType<typeof setTimeout> | null>(null);
+  const typingHideTimersRef = useRef<Map<number, ReturnType<typeof setTimeout>>>(new Map());
   const isAtBottomRef = useRef(true);
   const [isAtBottom, setIsAtBottom] = useState(true);
   const [newMsgCount, setNewMsgCount] = useState(0);
@@ -130,6 +182,7 @@ export default function ChatWindow({ room, onRoomUpdated, onNewMessage, onOpenLi
     roomIdRef.current = room.id;
     setMessages([]);
     setHasMore(false);
+    olderCursorRef.current = null;
     setLoadingHistory(true);
     setReplyTo(null);
     setInput('');
@@ -141,6 +194,7 @@ export default function ChatWindow({ room, onRoomUpdated, onNewMessage, onOpenLi
       .then((res) => {
         setMessages(res.data.results);
         setHasMore(res.data.has_more);
+        olderCursorRef.current = res.data.prev_cursor;
         setNewMsgCount(0);
         setTimeout(() => scrollToBottom(false), 50);
       })
@@ -187,19 +241,7 @@ export default function ChatWindow({ room, onRoomUpdated, onNewMessage, onOpenLi
             );
           } else if (data.type === 'poll_updated') {
             setMessages((prev) => prev.map((m) =>
-              m.poll?.id === data.poll_id
-                ? {
-                    ...m,
-                    poll: {
-                      ...m.poll!,
-                      total_votes: data.total_votes,
-                      options: m.poll!.options.map((opt) => {
-                        const upd = (data.options as ChatPoll['options']).find((o) => o.id === opt.id);
-                        return upd ? { ...upd, user_voted: opt.user_voted } : opt;
-                      }),
-                    } as ChatPoll,
-                  }
-                : m
+              m.poll?.id === data.poll_id ? { ...m, poll: applyPollDelta(m.poll!, data as PollDelta, user?.id) } : m
             ));
           } else if (data.type === 'chat_task_taken') {
             setMessages((prev) => prev.map((m) =>
@@ -214,7 +256,7 @@ export default function ChatWindow({ room, onRoomUpdated, onNewMessage, onOpenLi
           } else if (data.type === 'reaction_updated') {
             setMessages((prev) => prev.map((m) =>
               m.id === data.message_id
-                ? { ...m, reactions: data.reactions as ChatReactionSummary[] }
+                ? { ...m, reactions: applyReactionDelta(m.reactions, data as ReactionDelta, user?.id) }
                 : m
             ));
           } else if (data.type === 'user_typing') {
@@ -222,9 +264,13 @@ export default function ChatWindow({ room, onRoomUpdated, onNewMessage, onOpenLi
               const filtered = prev.filter((u) => u.id !== data.user_id);
               return [...filtered, { id: data.user_id, name: data.display_name }];
             });
-            setTimeout(() => {
+            const timers = typingHideTimersRef.current;
+            const prevTimer = timers.get(data.user_id);
+            if (prevTimer) clearTimeout(prevTimer);
+            timers.set(data.user_id, setTimeout(() => {
+              timers.delete(data.user_id);
               setTypingUsers((prev) => prev.filter((u) => u.id !== data.user_id));
-            }, 3000);
+            }, TYPING_INDICATOR_MS));
           }
         } catch { /* ignore */ }
       };
@@ -241,6 +287,9 @@ export default function ChatWindow({ room, onRoomUpdated, onNewMessage, onOpenLi
     return () => {
       roomIdRef.current = -1;
       if (reconnectRef.current) clearTimeout(reconnectRef.current);
+      typingHideTimersRef.current.forEach(clearTimeout);
+      typingHideTimersRef.current.clear();
+      setTypingUsers([]);
       if (wsRef.current) {
         wsRef.current.onclose = null;
         wsRef.current.close();
@@ -263,16 +312,18 @@ export default function ChatWindow({ room, onRoomUpdated, onNewMessage, onOpenLi
   }, [hasMore, loadingMore, messages]);
 
   const loadMore = async () => {
-    if (!messages.length || loadingMore) return;
+    if (!messages.length || loadingMore || !olderCursorRef.current) return;
     setLoadingMore(true);
-    const firstId = messages[0].id;
     const container = scrollContainerRef.current;
     const prevScrollHeight = container?.scrollHeight ?? 0;
     const prevScrollTop = container?.scrollTop ?? 0;
     try {
-      const res = await api.get(`/chat/rooms/${room.id}/messages/?before=${firstId}&limit=20`);
+      const res = await api.get(`/chat/rooms/${room.id}/messages/`, {
+        params: { before: olderCursorRef.current, limit: 20 },
+      });
       setMessages((prev) => [...res.data.results, ...prev]);
       setHasMore(res.data.has_more);
+      olderCursorRef.current = res.data.prev_cursor;
       requestAnimationFrame(() => {
         if (container) {
           container.scrollTop = prevScrollTop + (container.scrollHeight - prevScrollHeight);
@@ -414,7 +465,9 @@ export default function ChatWindow({ room, onRoomUpdated, onNewMessage, onOpenLi
   const handleReact = async (msgId: number, emoji: string) => {
     try {
       const res = await api.post(`/chat/messages/${msgId}/react/`, { emoji });
-      setMessages((prev) => prev.map((m) => m.id === msgId ? { ...m, reactions: res.data } : m));
+      setMessages((prev) => prev.map((m) =>
+        m.id === msgId ? { ...m, reactions: applyReactionDelta(m.reactions, res.data as ReactionDelta, user?.id) } : m
+      ));
     } catch { /* ignore */ }
   };
 
@@ -426,7 +479,7 @@ export default function ChatWindow({ room, onRoomUpdated, onNewMessage, onOpenLi
     try {
       const res = await api.post(`/chat/polls/${pollId}/vote/`, { option_id: optionId });
       setMessages((prev) => prev.map((m) =>
-        m.poll?.id === pollId ? { ...m, poll: res.data as ChatPoll } : m
+        m.poll?.id === pollId ? { ...m, poll: applyPollDelta(m.poll!, res.data as PollDelta, user?.id) } : m
       ));
     } catch { /* ignore */ }
   };
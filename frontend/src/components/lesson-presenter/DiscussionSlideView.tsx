@@ -150,26 +150,60 @@ export default function DiscussionSlideView({ slide, scale, user, sessionId }: {
   useEffect(() => { drawingRef.current = drawing; }, [drawing]);
 
   useEffect(() => {
-    const token = localStorage.getItem('access_token') ?? '';
-    const proto = window.location.protocol === 'https:' ? 'wss' : 'ws';
-    const ws = new WebSocket(`${proto}://${window.location.host}/ws/discussion/${slide.id}/?session_id=${sessionId}&token=${token}`);
-    wsRef.current = ws;
-    ws.onopen  = () => setIsConn(true);
-    ws.onclose = () => { setIsConn(false); if (wsRef.current === ws) wsRef.current = null; };
-    ws.onerror = () => setIsConn(false);
-    ws.onmessage = (ev) => {
-      try {
-        const d = JSON.parse(ev.data);
-        if (d.type === 'init')            { setStickers(d.stickers ?? []); setArrows(d.arrows ?? []); setTopic(d.topic ?? ''); }
-        if (d.type === 'sticker_added')   setStickers(p => [...p, d.sticker]);
-        if (d.type === 'sticker_updated') setStickers(p => p.map(s => s.id === d.sticker.id ? d.sticker : s));
-        if (d.type === 'sticker_deleted') { setStickers(p => p.filter(s => s.id !== d.id)); setArrows(p => p.filter(a => a.from_id !== d.id && a.to_id !== d.id)); }
-        if (d.type === 'arrow_added')     setArrows(p => [...p, d.arrow]);
-        if (d.type === 'arrow_deleted')   setArrows(p => p.filter(a => a.id !== d.id));
-        if (d.type === 'topic_updated')   setTopic(d.topic ?? '');
-      } catch { /* ignore */ }
+    let active = true;
+    let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+    // Версия доски последнего применённого события: при переподключении
+    // сервер пришлёт только пропущенные события (sync) вместо всей доски.
+    let version: number | null = null;
+
+    const apply = (d: any) => {
+      if (d.type === 'sticker_added')   setStickers(p => p.some(s => s.id === d.sticker.id) ? p : [...p, d.sticker]);
+      if (d.type === 'sticker_updated') setStickers(p => p.map(s => s.id === d.sticker.id ? d.sticker : s));
+      if (d.type === 'sticker_deleted') { setStickers(p => p.filter(s => s.id !== d.id)); setArrows(p => p.filter(a => a.from_id !== d.id && a.to_id !== d.id)); }
+      if (d.type === 'arrow_added')     setArrows(p => p.some(a => a.id === d.arrow.id) ? p : [...p, d.arrow]);
+      if (d.type === 'arrow_deleted')   setArrows(p => p.filter(a => a.id !== d.id));
+      if (d.type === 'topic_updated')   setTopic(d.topic ?? '');
+      if (typeof d.version === 'number') version = d.version;
+    };
+
+    const connect = () => {
+      if (!active) return;
+      const token = localStorage.getItem('access_token') ?? '';
+      const proto = window.location.protocol === 'https:' ? 'wss' : 'ws';
+      const since = version !== null ? `&since=${version}` : '';
+      const ws = new WebSocket(`${proto}://${window.location.host}/ws/discussion/${slide.id}/?session_id=${sessionId}${since}&token=${token}`);
+      wsRef.current = ws;
+      ws.onopen  = () => setIsConn(true);
+      ws.onclose = (e) => {
+        setIsConn(false);
+        if (wsRef.current === ws) wsRef.current = null;
+        if (active && e.code !== 1000 && e.code !== 4001 && e.code !== 4403) {
+          reconnectTimer = setTimeout(connect, 2000);
+        }
+      };
+      ws.onerror = () => setIsConn(false);
+      ws.onmessage = (ev) => {
+        try {
+          const d = JSON.parse(ev.data);
+          if (d.type === 'init') {
+            setStickers(d.stickers ?? []); setArrows(d.arrows ?? []); setTopic(d.topic ?? '');
+            version = d.version ?? null;
+          } else if (d.type === 'sync') {
+            (d.events ?? []).forEach(apply);
+            version = d.version;
+          } else {
+            apply(d);
+          }
+        } catch { /* ignore */ }
+      };
+    };
+
+    connect();
+    return () => {
+      active = false;
+      if (reconnectTimer !== null) clearTimeout(reconnectTimer);
+      wsRef.current?.close();
     };
-    return () => { ws.close(); };
   }, [slide.id, sessionId]);
 
   const send = (data: object) => {
@@ -1,16 +1,8 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
-import { Document, Page, pdfjs } from 'react-pdf';
-import 'react-pdf/dist/Page/AnnotationLayer.css';
-import 'react-pdf/dist/Page/TextLayer.css';
 import DrawingCanvas from '../DrawingCanvas';
 import api from '../../api/client';
 import type { Slide, TextbookSlideContent, Textbook, AnnotationStroke } from '../../types';
 
-pdfjs.GlobalWorkerOptions.workerSrc = new URL(
-  'pdfjs-dist/build/pdf.worker.min.mjs',
-  import.meta.url,
-).toString();
-
 const DRAW_COLORS = ['#000000', '#ef4444', '#3b82f6', '#22c55e', '#f97316'];
 const HL_COLORS   = ['#fde047', '#a3e635', '#67e8f9', '#f9a8d4'];
 const PEN_SIZES   = [2, 4, 8];
@@ -46,8 +38,8 @@ export default function TextbookSlideView({
 
   const [textbook, setTextbook]       = useState<Textbook | null>(null);
   const [currentPage, setCurrentPage] = useState(page_from || 1);
-  const [numPages, setNumPages]       = useState(0);
   const [pageHeight, setPageHeight]   = useState(0);
+  const [pageError, setPageError]     = useState(false);
   const [annotations, setAnnotations] = useState<Record<number, AnnotationStroke[]>>({});
   const [loadedPages, setLoadedPages] = useState<Set<number>>(new Set());
   const [zoom, setZoom]               = useState(1.0);
@@ -65,6 +57,7 @@ export default function TextbookSlideView({
   useEffect(() => { currentPageRef.current = currentPage; }, [currentPage]);
   useEffect(() => { annotationsRef.current = annotations; }, [annotations]);
 
+  const numPages       = textbook?.page_count ?? 0;
   const effectiveTo    = numPages > 0 ? Math.min(page_to, numPages) : page_to;
   const currentStrokes = annotations[currentPage] ?? [];
 
@@ -88,6 +81,8 @@ export default function TextbookSlideView({
     setZoom(1);
   }, [slide.id]); // eslint-disable-line
 
+  useEffect(() => { setPageError(false); }, [currentPage, slide.id]);
+
   useEffect(() => {
     if (isPresenter || !sessionId || loadedPages.has(currentPage)) return;
     api.get(`/lessons/sessions/${sessionId}/slides/${slide.id}/textbook-annotations/`)
@@ -168,7 +163,11 @@ export default function TextbookSlideView({
   const onScrollTouchEnd = () => { pinchStartDist.current = null; };
 
   const goTo = (p: number) => setCurrentPage(Math.max(page_from, Math.min(effectiveTo, p)));
-  const fileUrl = textbook?.file_url;
+  // Страница рендерится на сервере под ширину области (с учётом плотности пикселей), а не весь PDF целиком;
+  // рендер только с подписью page_token, поэтому ссылка строится после загрузки учебника
+  const pageSrc = textbook
+    ? `/api/lessons/textbooks/${textbook_id}/pages/${currentPage}/?w=${Math.round(pdfWidth * (window.devicePixelRatio || 1))}&s=${textbook.page_token}`
+    : undefined;
   const zoomPct = Math.round(zoom * 100);
 
   return (
@@ -214,8 +213,8 @@ export default function TextbookSlideView({
           <div style={{ display: 'flex', alignItems: 'center', justifyContent: 'center', height: '100%', color: '#9ca3af' }}>
             <div style={{ textAlign: 'center' }}><div style={{ fontSize: 40 }}>📖</div><div>Учебник не выбран</div></div>
           </div>
-        ) : !fileUrl ? (
-          <div style={{ color: '#6b7280', padding: 32 }}>Загрузка учебника…</div>
+        ) : pageError ? (
+          <div style={{ color: '#ef4444', padding: 32 }}>Не удалось загрузить страницу</div>
         ) : pdfWidth > 0 ? (
           <div style={{ display: 'flex', justifyContent: 'center' }}>
             {/* Layout container — sets scroll area to zoomed dimensions */}
@@ -225,27 +224,23 @@ export default function TextbookSlideView({
               position: 'relative',
               flexShrink: 0,
             }}>
-              {/* PDF rendered at base width, scaled via CSS — no re-render on zoom change */}
+              {/* Page image at base width, scaled via CSS — no re-request on zoom change */}
               <div style={{
                 position: 'absolute', top: 0, left: 0,
                 width: pdfWidth,
                 transform: `scale(${zoom})`,
                 transformOrigin: 'top left',
               }}>
-                <Document
-                  file={fileUrl}
-                  onLoadSuccess={({ numPages: n }) => setNumPages(n)}
-                  loading={<div style={{ color: '#6b7280', padding: 32 }}>Загрузка…</div>}
-                  error={<div style={{ color: '#ef4444', padding: 32 }}>Не удалось загрузить PDF</div>}
-                >
-                  <Page
-                    pageNumber={currentPage}
-                    width={pdfWidth}
-                    onRenderSuccess={({ height }) => setPageHeight(height)}
-                    renderTextLayer={false}
-                    renderAnnotationLayer={false}
-                  />
-                </Document>
+                <img
+                  src={pageSrc}
+                  alt={`Страница ${currentPage}`}
+                  onLoad={e => {
+                    const img = e.currentTarget;
+                    setPageHeight(Math.round(pdfWidth * img.naturalHeight / img.naturalWidth));
+                  }}
+                  onError={() => setPageError(true)}
+                  style={{ display: 'block', width: pdfWidth, background: '#fff' }}
+                />
               </div>
               {/* Canvas at zoomed dimensions — pointer coords stay correct */}
               {!isPresenter && pageHeight > 0 && (
@@ -117,6 +117,8 @@ export default function ProjectFeed({ projectId, isTeacher }: Props) {
   const { user } = useAuth();
   const [posts, setPosts] = useState<ProjectPost[]>([]);
   const [hasMore, setHasMore] = useState(false);
+  // Курсор самой старой загруженной страницы (keyset-пагинация на бэкенде)
+  const olderCursorRef = useRef<string | null>(null);
   const [loadingHistory, setLoadingHistory] = useState(true);
   const [input, setInput] = useState('');
   const [sending, setSending] = useState(false);
@@ -174,6 +176,7 @@ export default function ProjectFeed({ projectId, isTeacher }: Props) {
       .then(res => {
         setPosts(res.data.results);
         setHasMore(res.data.has_more);
+        olderCursorRef.current = res.data.prev_cursor;
         setTimeout(scrollToBottom, 50);
       })
       .finally(() => setLoadingHistory(false));
@@ -253,6 +256,8 @@ export default function ProjectFeed({ projectId, isTeacher }: Props) {
         setInput('');
         const res = await api.get(`/projects/${projectId}/posts/`);
         setPosts(res.data.results);
+        setHasMore(res.data.has_more);
+        olderCursorRef.current = res.data.prev_cursor;
         setTimeout(scrollToBottom, 50);
       } catch { /* ignore */ } finally { setSending(false); }
       return;
@@ -291,16 +296,18 @@ export default function ProjectFeed({ projectId, isTeacher }: Props) {
       // Обновим список
       const res = await api.get(`/projects/${projectId}/posts/`);
       setPosts(res.data.results);
+      setHasMore(res.data.has_more);
+      olderCursorRef.current = res.data.prev_cursor;
       setTimeout(scrollToBottom, 50);
     } catch { /* ignore */ } finally { setUploading(false); }
   };
 
   const loadMore = async () => {
-    if (!posts.length) return;
-    const oldest = posts[0];
-    const res = await api.get(`/projects/${projectId}/posts/?before=${oldest.id}`);
+    if (!posts.length || !olderCursorRef.current) return;
+    const res = await api.get(`/projects/${projectId}/posts/`, { params: { before: olderCursorRef.current } });
     setPosts(prev => [...res.data.results, ...prev]);
     setHasMore(res.data.has_more);
+    olderCursorRef.current = res.data.prev_cursor;
   };
 
   return (
@@ -998,6 +998,7 @@ export default function LessonsPage() {
   // Импорт презентации
   const importFileRef = useRef<HTMLInputElement>(null);
   const [importing, setImporting] = useState(false);
+  const [importProgress, setImportProgress] = useState<{ processed: number; total: number } | null>(null);
 
   // Drag-and-drop
   const [dragItem, setDragItem] = useState<DragItem | null>(null);
@@ -1165,13 +1166,37 @@ export default function LessonsPage() {
       const res = await api.post('/lessons/import/', fd, {
         headers: { 'Content-Type': 'multipart/form-data' },
       });
-      navigate(`/lessons/${res.data.id}/edit`);
+      if (res.status !== 202) {
+        navigate(`/lessons/${res.data.id}/edit`);
+        return;
+      }
+      // PDF импортируется в фоне — ждём, пока отрендерятся все страницы
+      const taskId: string = res.data.task_id;
+      const lessonId: number = await new Promise((resolve, reject) => {
+        const interval = setInterval(async () => {
+          try {
+            const { data: task } = await api.get(`/lessons/import/${taskId}/`);
+            if (task.status === 'running') {
+              setImportProgress({ processed: task.processed, total: task.total });
+            } else {
+              clearInterval(interval);
+              if (task.status === 'done') resolve(task.lesson);
+              else reject({ response: { data: { error: task.detail } } });
+            }
+          } catch (err) {
+            clearInterval(interval);
+            reject(err);
+          }
+        }, 700);
+      });
+      navigate(`/lessons/${lessonId}/edit`);
     } catch (err: unknown) {
       const msg = (err as { response?: { data?: { error?: string } } })?.response?.data?.error
         ?? 'Не удалось импортировать файл';
       setErrorMsg(msg);
     } finally {
       setImporting(false);
+      setImportProgress(null);
     }
   };
 
@@ -1650,7 +1675,11 @@ export default function LessonsPage() {
               <path className="opacity-75" fill="currentColor" d="M4 12a8 8 0 018-8v8H4z" />
             </svg>
             <p className="text-sm font-medium text-gray-700 dark:text-slate-300">Импорт презентации...</p>
-            <p className="text-xs text-gray-400 dark:text-slate-500">Это может занять несколько секунд</p>
+            <p className="text-xs text-gray-400 dark:text-slate-500">
+              {importProgress && importProgress.total > 0
+                ? `Страница ${importProgress.processed} из ${importProgress.total}`
+                : 'Это может занять несколько секунд'}
+            </p>
           </div>
         </div>
       )}
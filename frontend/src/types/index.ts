@@ -599,6 +599,8 @@ export interface Textbook {
   id: number;
   title: string;
   file_url: string | null;
+  page_count: number | null;
+  page_token: string;
   original_name: string;
   file_size: number;
   subject: number | null;